@@ -7,6 +7,7 @@ import { DataTable } from '@/components/AttendanceViewer/DataTable';
 import { EditRecordModal } from '@/components/AttendanceViewer/Modals/EditRecordModal';
 import { AttendanceRecord, AttendanceFilters, AttendanceStatus } from '../../types/attendance';
 import { attendanceApi } from '@/services/api';
+import { LoadMore } from '@/components/ui/load-more';
 import { format } from 'date-fns';
 import toast from 'react-hot-toast';
 
@@ -27,6 +28,8 @@ export const AttendanceViewer: React.FC = () => {
   const [isEditModalOpen, setIsEditModalOpen] = useState(false);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  const [next, setNext] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [filters, setFilters] = useState<AttendanceFilters>({
     startDate: format(new Date(), 'yyyy-MM-dd'),
     endDate: format(new Date(), 'yyyy-MM-dd'),
@@ -54,12 +57,13 @@ export const AttendanceViewer: React.FC = () => {
     setLoading(true);
     setError(null);
     try {
-      const data = await attendanceApi.getAttendanceLogs(
+      const page = await attendanceApi.getAttendanceLogs(
         filters.startDate,
         filters.endDate
       );
-      setRecords(data);
-      setFilteredRecords(data);
+      setRecords(page.results);
+      setFilteredRecords(page.results);
+      setNext(page.next);
     } catch (err) {
       console.error('Error fetching attendance:', err);
       setError('Failed to load attendance data');
@@ -68,6 +72,20 @@ export const AttendanceViewer: React.FC = () => {
     }
   };
 
+  const loadMoreAttendance = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await attendanceApi.getAttendanceLogs(filters.startDate, filters.endDate, next);
+      setRecords(previous => [...previous, ...page.results]);
+      setNext(page.next);
+    } catch (err) {
+      console.error('Error fetching attendance:', err);
+      setError('Failed to load attendance data');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchAttendanceData();
   }, [filters.startDate, filters.endDate]);
@@ -274,6 +292,7 @@ export const AttendanceViewer: React.FC = () => {
               Next
             </button>
           </div>
+          <LoadMore hasMore={next !== null} loading={loadingMore} onLoadMore={loadMoreAttendance} />
         </div>
 
         {selectedRecord && (
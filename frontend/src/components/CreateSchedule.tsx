@@ -17,6 +17,7 @@ import { CreateSchedulePayload } from '@/services/api';
 import { teacherApi } from '@/services/api'
 import { studentApi } from '@/services/api'
 import { groupApi } from '@/services/api'
+import { LoadMore } from '@/components/ui/load-more'
 
 
 const formSchema = z.object({
@@ -69,6 +70,21 @@ const DAYS_OPTIONS: Option[] = [
   { value: "6", label: "Sunday" },
 ]
 
+// Transform the API responses to match the UI's expected format
+const toTeacher = (teacher: any) => ({
+  id: teacher.id.toString(),
+  name: teacher.name || `${teacher.first_name} ${teacher.last_name}`,
+  email: teacher.email,
+  specializations: teacher.specializations || [],
+  contactDetails: teacher.contact_details || teacher.phone || ''
+})
+
+const toStudent = (student: any) => ({
+  id: student.id.toString(),
+  name: student.name || `${student.first_name} ${student.last_name}`,
+  email: student.email
+})
+
 export default function CreateSchedule({ 
   assignments, 
   setAssignments 
@@ -78,28 +94,18 @@ export default function CreateSchedule({
   const [teachers, setTeachers] = useState<Teacher[]>([])
   const [students, setStudents] = useState<Student[]>([])
   const [groupsState, setGroups] = useState<Group[]>([])
+  const [teachersNext, setTeachersNext] = useState<string | null>(null)
+  const [studentsNext, setStudentsNext] = useState<string | null>(null)
+  const [groupsNext, setGroupsNext] = useState<string | null>(null)
   const { toast } = useToast()
 
   useEffect(() => {
     async function fetchTeachers() {
       try {
         setLoading(true)
-        const response = await teacherApi.getAll()
-        console.log('Teacher API Response:', response)
-        if (Array.isArray(response)) {
-          // Transform the API response to match the UI's expected format
-          const transformedTeachers = response.map((teacher: any) => ({
-            id: teacher.id.toString(),
-            name: teacher.name || `${teacher.first_name} ${teacher.last_name}`,
-            email: teacher.email,
-            specializations: teacher.specializations || [],
-            contactDetails: teacher.contact_details || teacher.phone || ''
-          }))
-          setTeachers(transformedTeachers)
-        } else {
-          console.error('Unexpected teacher response format:', response)
-          throw new Error('Invalid teacher response format')
-        }
+        const page = await teacherApi.getAll()
+        setTeachers(page.results.map(toTeacher))
+        setTeachersNext(page.next)
       } catch (error) {
         toast({
           title: "Error",
@@ -118,20 +124,9 @@ export default function CreateSchedule({
     async function fetchStudents() {
       try {
         setLoading(true)
-        const response = await studentApi.getAll()
-        console.log('Student API Response:', response)
-        if (response && response.data) {
-          // Transform the API response to match the UI's expected format
-          const transformedStudents = response.data.map((student: any) => ({
-            id: student.id.toString(),
-            name: student.name || `${student.first_name} ${student.last_name}`,
-            email: student.email
-          }))
-          setStudents(transformedStudents)
-        } else {
-          console.error('Unexpected student response format:', response)
-          throw new Error('Invalid student response format')
-        }
+        const page = await studentApi.getAll()
+        setStudents(page.results.map(toStudent))
+        setStudentsNext(page.next)
       } catch (error) {
         toast({
           title: "Error",
@@ -150,14 +145,9 @@ export default function CreateSchedule({
     async function fetchGroups() {
       try {
         setLoading(true)
-        const response = await groupApi.getAll()
-        console.log('Groups API Response:', response)
-        if (Array.isArray(response)) {
-          setGroups(response)
-        } else {
-          console.error('Unexpected groups response format:', response)
-          throw new Error('Invalid groups response format')
-        }
+        const page = await groupApi.getAll()
+        setGroups(page.results)
+        setGroupsNext(page.next)
       } catch (error) {
         console.error('Error fetching groups:', error)
         toast({
@@ -173,6 +163,24 @@ export default function CreateSchedule({
     fetchGroups()
   }, [toast])
 
+  const loadMoreTeachers = async () => {
+    const page = await teacherApi.getAll(teachersNext)
+    setTeachers(previous => [...previous, ...page.results.map(toTeacher)])
+    setTeachersNext(page.next)
+  }
+
+  const loadMoreStudents = async () => {
+    const page = await studentApi.getAll(studentsNext)
+    setStudents(previous => [...previous, ...page.results.map(toStudent)])
+    setStudentsNext(page.next)
+  }
+
+  const loadMoreGroups = async () => {
+    const page = await groupApi.getAll(groupsNext)
+    setGroups(previous => [...previous, ...page.results])
+    setGroupsNext(page.next)
+  }
+
   const form = useForm<z.infer<typeof formSchema>>({
     resolver: zodResolver(formSchema),
     defaultValues: {
@@ -255,6 +263,7 @@ export default function CreateSchedule({
                     ))}
                   </SelectContent>
                 </Select>
+                <LoadMore hasMore={teachersNext !== null} onLoadMore={loadMoreTeachers} />
                 <FormMessage />
               </FormItem>
             )}
@@ -322,6 +331,7 @@ export default function CreateSchedule({
                         ))}
                       </SelectContent>
                     </Select>
+                    <LoadMore hasMore={groupsNext !== null} onLoadMore={loadMoreGroups} />
                     <FormDescription>
                       Select a group for the lesson
                     </FormDescription>
@@ -354,6 +364,7 @@ export default function CreateSchedule({
                         ))}
                       </SelectContent>
                     </Select>
+                    <LoadMore hasMore={studentsNext !== null} onLoadMore={loadMoreStudents} />
                     <FormMessage />
                   </FormItem>
                 ) : null}
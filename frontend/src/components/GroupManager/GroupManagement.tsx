@@ -12,6 +12,7 @@ import { groupService } from '../../services/api';
 import GroupForm from './GroupForm';
 import GroupList from './GroupList';
 import MembersModal from './MembersModal';
+import { LoadMore } from '@/components/ui/load-more';
 import { Group } from '@/types/groupManager';
 
 export const GroupManagement: React.FC = () => {
@@ -20,16 +21,19 @@ export const GroupManagement: React.FC = () => {
   const [isFormOpen, setIsFormOpen] = useState(false);
   const [isMembersModalOpen, setIsMembersModalOpen] = useState(false);
   const [loading, setLoading] = useState(true);
+  const [next, setNext] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   // const [students, setStudents] = useState<Student[]>([]);
   // const [teachers, setTeachers] = useState<Teacher[]>([]);
 
   const fetchGroups = async () => {
     try {
-      const response = await groupService.getGroups();
-      setGroups(response.data);
+      const page = await groupService.getGroups();
+      setGroups(page.results);
+      setNext(page.next);
       // Update selectedGroup if it exists
       if (selectedGroup) {
-        const updatedGroup = response.data.find((g: Group) => g.id === selectedGroup.id);
+        const updatedGroup = page.results.find((g: Group) => g.id === selectedGroup.id);
         if (updatedGroup) {
           setSelectedGroup(updatedGroup);
         }
@@ -41,6 +45,28 @@ export const GroupManagement: React.FC = () => {
     }
   };
 
+  const loadMoreGroups = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await groupService.getGroups(next);
+      setGroups(previous => [...previous, ...page.results]);
+      setNext(page.next);
+    } catch (error) {
+      console.error('Error fetching groups:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // Refreshes one group in place so the pages loaded so far are kept
+  const refreshGroup = async (groupId: string) => {
+    const { data } = await groupService.getGroup(parseInt(groupId));
+    setGroups(previous => previous.map(group => (group.id === data.id ? data : group)));
+    if (selectedGroup?.id === data.id) {
+      setSelectedGroup(data);
+    }
+  };
+
   useEffect(() => {
     fetchGroups();
   }, []);
@@ -127,8 +153,8 @@ export const GroupManagement: React.FC = () => {
         }
       }
       
-      // Refresh the groups list and update selected group
-      await fetchGroups();
+      // Refresh the group and update selected group
+      await refreshGroup(groupId);
     } catch (error) {
       console.error('Error updating group members:', error);
     }
@@ -155,6 +181,7 @@ export const GroupManagement: React.FC = () => {
             onManageMembers={handleManageMembers}
           />
         )}
+        <LoadMore hasMore={next !== null} loading={loadingMore} onLoadMore={loadMoreGroups} />
       </div>
 
       <Dialog open={isFormOpen} onOpenChange={setIsFormOpen}>
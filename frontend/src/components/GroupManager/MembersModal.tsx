@@ -2,6 +2,7 @@ import { useState, useEffect, useMemo } from 'react';
 import { X, Search, UserPlus, UserMinus } from 'lucide-react';
 import { Student, Teacher, Group } from '@/types/groupManager';
 import { studentApi, teacherApi } from '@/services/api';
+import { LoadMore } from '@/components/ui/load-more';
 
 interface MembersModalProps {
   open: boolean;
@@ -22,6 +23,8 @@ export function MembersModal({
   const [localTeacherIds, setLocalTeacherIds] = useState<string[]>([]);
   const [students, setStudents] = useState<Student[]>([]);
   const [teachers, setTeachers] = useState<Teacher[]>([]);
+  const [studentsNext, setStudentsNext] = useState<string | null>(null);
+  const [teachersNext, setTeachersNext] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [isUpdating, setIsUpdating] = useState(false);
@@ -41,14 +44,9 @@ export function MembersModal({
       setIsLoading(true);
       setError(null);
       try {
-        const response = await studentApi.getAll();
-        console.log('Student API Response:', response);
-        if (response && response.data) {
-          setStudents(response.data);
-        } else {
-          console.error('Unexpected response format:', response);
-          throw new Error('Invalid response format');
-        }
+        const page = await studentApi.getAll();
+        setStudents(page.results);
+        setStudentsNext(page.next);
       } catch (err) {
         setError('Failed to load students. Please try again later.');
         console.error('Error fetching students:', err);
@@ -61,14 +59,9 @@ export function MembersModal({
       setIsLoading(true);
       setError(null);
       try {
-        const teachersData = await teacherApi.getAll();
-        console.log('Teacher API Response:', teachersData);
-        if (Array.isArray(teachersData)) {
-          setTeachers(teachersData);
-        } else {
-          console.error('Unexpected response format:', teachersData);
-          throw new Error('Invalid response format');
-        }
+        const page = await teacherApi.getAll();
+        setTeachers(page.results);
+        setTeachersNext(page.next);
       } catch (err) {
         setError('Failed to load teachers. Please try again later.');
         console.error('Error fetching teachers:', err);
@@ -83,6 +76,26 @@ export function MembersModal({
     }
   }, [open]);
 
+  const loadMore = async () => {
+    setIsLoading(true);
+    try {
+      if (activeTab === 'students') {
+        const page = await studentApi.getAll(studentsNext);
+        setStudents(previous => [...previous, ...page.results]);
+        setStudentsNext(page.next);
+      } else {
+        const page = await teacherApi.getAll(teachersNext);
+        setTeachers(previous => [...previous, ...page.results]);
+        setTeachersNext(page.next);
+      }
+    } catch (err) {
+      setError(`Failed to load more ${activeTab}. Please try again later.`);
+      console.error(`Error fetching ${activeTab}:`, err);
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
   const currentStudents = useMemo(() => {
     if (!group?.students) return [];
     return group.students;
@@ -314,6 +327,11 @@ export function MembersModal({
                       <p className="text-gray-500 text-center py-4">Type to search...</p>
                     )}
                   </div>
+                  <LoadMore
+                    hasMore={(activeTab === 'students' ? studentsNext : teachersNext) !== null}
+                    loading={isLoading}
+                    onLoadMore={loadMore}
+                  />
                 </div>
               </div>
             </div>
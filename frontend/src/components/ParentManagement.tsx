@@ -12,6 +12,7 @@ import { ChevronUp, ChevronDown, Search, Plus, X } from 'lucide-react'
 import { parentApi } from '@/services/api';
 import { useToast } from "@/hooks/use-toast"
 import { AddParentForm } from "@/components/add-parent-form"
+import { LoadMore } from "@/components/ui/load-more"
 
 interface Child {
   id: number
@@ -56,10 +57,19 @@ const formatNumber = (num: number) => {
   return new Intl.NumberFormat('ru-RU').format(num);
 };
 
+// Adds the totals shown in the table to a parent from the API
+const withTotals = (parent: ApiParent): Parent => ({
+  ...parent,
+  total_lessons_remaining: parent.children.reduce((sum, child) => sum + Number(child.lessons_remaining), 0),
+  total_subscription_balance: parent.children.reduce((sum, child) => sum + Number(child.subscription_balance), 0)
+})
+
 export function ParentManagement() {
   const [searchTerm, setSearchTerm] = useState("")
   const [sortConfig, setSortConfig] = useState<SortConfig>({ key: 'name', direction: 'ascending' })
   const [parents, setParents] = useState<Parent[]>([])
+  const [next, setNext] = useState<string | null>(null)
+  const [isLoadingMore, setIsLoadingMore] = useState(false)
   const [isLoading, setIsLoading] = useState(true)
   const [error, setError] = useState<string | null>(null)
   const [showAddForm, setShowAddForm] = useState(false)
@@ -71,16 +81,11 @@ export function ParentManagement() {
         setIsLoading(true)
         setError(null)
         
-        const apiData = await parentApi.getAll()
-        
+        const page = await parentApi.getAll()
+
         // Transform API data to include calculated fields
-        const transformedData: Parent[] = apiData.map((parent: ApiParent) => ({
-          ...parent,
-          total_lessons_remaining: parent.children.reduce((sum, child) => sum + Number(child.lessons_remaining), 0),
-          total_subscription_balance: parent.children.reduce((sum, child) => sum + Number(child.subscription_balance), 0)
-        }))
-        
-        setParents(transformedData)
+        setParents(page.results.map(withTotals))
+        setNext(page.next)
       } catch (error) {
         console.error('Error fetching parents:', error)
         setError('Failed to load parents data')
@@ -148,19 +153,28 @@ export function ParentManagement() {
 
   const handleParentAdded = async () => {
     try {
-      const apiData = await parentApi.getAll()
-      const transformedData: Parent[] = apiData.map((parent: ApiParent) => ({
-        ...parent,
-        total_lessons_remaining: parent.children.reduce((sum, child) => sum + Number(child.lessons_remaining), 0),
-        total_subscription_balance: parent.children.reduce((sum, child) => sum + Number(child.subscription_balance), 0)
-      }))
-      setParents(transformedData)
+      const page = await parentApi.getAll()
+      setParents(page.results.map(withTotals))
+      setNext(page.next)
       setShowAddForm(false)
     } catch (error) {
       console.error('Error refreshing parents:', error)
     }
   }
 
+  const loadMoreParents = async () => {
+    setIsLoadingMore(true)
+    try {
+      const page = await parentApi.getAll(next)
+      setParents(previous => [...previous, ...page.results.map(withTotals)])
+      setNext(page.next)
+    } catch (error) {
+      console.error('Error fetching parents:', error)
+    } finally {
+      setIsLoadingMore(false)
+    }
+  }
+
   if (isLoading) {
     return (
       <div className="flex items-center justify-center h-48">
@@ -301,6 +315,7 @@ export function ParentManagement() {
               ))}
             </TableBody>
           </Table>
+          <LoadMore hasMore={next !== null} loading={isLoadingMore} onLoadMore={loadMoreParents} />
         </CardContent>
       </Card>
     </div>
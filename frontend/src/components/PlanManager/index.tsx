@@ -6,9 +6,18 @@ import { PlanCard } from './PlanCard';
 import { Plus, Search } from 'lucide-react';
 import { planApi } from '@/services/api';
 import { toast } from '@/hooks/use-toast';
+import { usePagedList } from '@/hooks/usePagedList';
+import { LoadMore } from '@/components/ui/load-more';
 
 export const PlanManager: React.FC = () => {
-  const [plans, setPlans] = useState<Plan[]>([]);
+  const {
+    items: plans,
+    setItems: setPlans,
+    loading,
+    error,
+    hasMore,
+    loadMore,
+  } = usePagedList<Plan>(planApi.getAll);
   const [selectedPlans, setSelectedPlans] = useState<number[]>([]);
   const [sortConfig, setSortConfig] = useState<SortConfig>({
     key: 'name',
@@ -21,23 +30,14 @@ export const PlanManager: React.FC = () => {
   const [deletingPlanId, setDeletingPlanId] = useState<number | null>(null);
 
   useEffect(() => {
-    const fetchPlans = async () => {
-      try {
-        const response = await planApi.getAll();
-        console.log('Fetched plans:', response.data);
-        setPlans(Array.isArray(response.data) ? response.data : []);
-      } catch (error) {
-        console.error('Error fetching plans:', error);
-        toast({
-          title: "Error",
-          description: "Failed to load subscription plans",
-          variant: "destructive",
-        });
-        setPlans([]);
-      }
-    };
-    fetchPlans();
-  }, []);
+    if (error) {
+      toast({
+        title: "Error",
+        description: "Failed to load subscription plans",
+        variant: "destructive",
+      });
+    }
+  }, [error]);
 
   const handleSort = (key: keyof Plan) => {
     setSortConfig((prev) => ({
@@ -207,6 +207,8 @@ export const PlanManager: React.FC = () => {
         </div>
       )}
 
+      <LoadMore hasMore={hasMore} loading={loading} onLoadMore={loadMore} />
+
       {showForm && (
         <PlanForm
           plan={editingPlan}
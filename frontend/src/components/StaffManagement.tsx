@@ -1,6 +1,6 @@
 "use client"
 
-import { useState, useEffect } from "react"
+import { useState } from "react"
 import { Button } from "@/components/ui/button"
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card"
 import { teacherApi } from "@/services/api"
@@ -13,6 +13,8 @@ import {
   DialogTrigger,
 } from "@/components/ui/dialog"
 import { AddTeacherForm } from "./staff/AddTeacherForm"
+import { usePagedList } from "@/hooks/usePagedList"
+import { LoadMore } from "@/components/ui/load-more"
 import {
   Table,
   TableBody,
@@ -52,28 +54,16 @@ interface Teacher {
 }
 
 export function StaffManagement() {
-  const [teachers, setTeachers] = useState<Teacher[]>([])
   const [isAddTeacherOpen, setIsAddTeacherOpen] = useState(false)
-  const [isLoading, setIsLoading] = useState(true)
+  const {
+    items: teachers,
+    loading: isLoading,
+    hasMore,
+    loadMore,
+    reload: loadTeachers,
+  } = usePagedList<Teacher>(teacherApi.getAll)
 
-  useEffect(() => {
-    loadTeachers()
-  }, [])
-
-  const loadTeachers = async () => {
-    try {
-      setIsLoading(true)
-      const data = await teacherApi.getAll()
-      setTeachers(Array.isArray(data) ? data : [])
-    } catch (error) {
-      console.error('Error loading teachers:', error)
-      setTeachers([])
-    } finally {
-      setIsLoading(false)
-    }
-  }
-
-  if (isLoading) {
+  if (isLoading && teachers.length === 0) {
     return (
       <Card>
         <CardContent className="flex items-center justify-center h-48">
@@ -169,6 +159,7 @@ export function StaffManagement() {
             ))}
           </TableBody>
         </Table>
+        <LoadMore hasMore={hasMore} loading={isLoading} onLoadMore={loadMore} />
       </CardContent>
     </Card>
   )
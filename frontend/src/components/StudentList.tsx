@@ -38,6 +38,7 @@ import {
 } from "@/components/ui/table"
 import { studentApi } from '@/services/api';
 import { EditStudentDialog } from "./edit-student-dialog"
+import { LoadMore } from "@/components/ui/load-more"
 
 interface Student {
   id: string;
@@ -63,6 +64,8 @@ export function StudentList({ className }: StudentListProps) {
   const [editingStudent, setEditingStudent] = React.useState<Student | null>(null)
   const [students, setStudents] = React.useState<Student[]>([])
   const [loading, setLoading] = React.useState(true)
+  const [next, setNext] = React.useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = React.useState(false)
   const [error, setError] = React.useState<string | null>(null)
 
   const columns: ColumnDef<Student>[] = [
@@ -163,25 +166,17 @@ export function StudentList({ className }: StudentListProps) {
     },
   ]
 
-  const fetchStudents = async () => {
+  // Loads the first page, or appends the page a next link points to
+  const fetchStudents = async (cursor?: string | null) => {
     try {
-      const response = await studentApi.getAll()
-      const studentsWithSubscriptions = await Promise.all(
-        response.data.map(async (student: any) => {
-          try {
-            // Get student's subscription
-            const subscriptionResponse = await studentApi.getSubscription(student.id)
-            return {
-              ...student,
-              subscription_plan: subscriptionResponse.data?.subscription_plan?.name || null
-            }
-          } catch (error) {
-            console.error(`Error fetching subscription for student ${student.id}:`, error)
-            return student
-          }
-        })
-      )
-      setStudents(studentsWithSubscriptions)
+      const page = await studentApi.getAll(cursor)
+      // The listing already carries each student's latest subscription
+      const studentsWithSubscriptions = page.results.map((student: any) => ({
+        ...student,
+        subscription_plan: student.subscription_info?.plan_name || null
+      }))
+      setStudents(previous => (cursor ? [...previous, ...studentsWithSubscriptions] : studentsWithSubscriptions))
+      setNext(page.next)
       setError(null) // Clear any previous errors
     } catch (error) {
       console.error('Error fetching students:', error)
@@ -196,6 +191,12 @@ export function StudentList({ className }: StudentListProps) {
     }
   }
 
+  const loadMoreStudents = async () => {
+    setLoadingMore(true)
+    await fetchStudents(next)
+    setLoadingMore(false)
+  }
+
   React.useEffect(() => {
     fetchStudents()
   }, [])
@@ -371,12 +372,13 @@ export function StudentList({ className }: StudentListProps) {
           </Button>
         </div>
       </div>
+      <LoadMore hasMore={next !== null} loading={loadingMore} onLoadMore={loadMoreStudents} />
       {editingStudent && (
         <EditStudentDialog
           student={editingStudent}
           open={!!editingStudent}
           onOpenChange={(open) => !open && setEditingStudent(null)}
-          onSuccess={fetchStudents}
+          onSuccess={() => fetchStudents()}
         />
       )}
     </div>
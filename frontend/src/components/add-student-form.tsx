@@ -18,6 +18,7 @@ import { Input } from "@/components/ui/input"
 import { toast } from "@/hooks/use-toast"
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card"
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select"
+import { LoadMore } from "@/components/ui/load-more"
 import { studentApi, planApi, parentApi } from "@/services/api"
 import { useNavigate } from "react-router-dom"
 
@@ -61,14 +62,16 @@ export function AddStudentForm({ className }: React.HTMLAttributes<HTMLDivElemen
   const [isSubmitting, setIsSubmitting] = useState(false)
   const [plans, setPlans] = useState<Array<{ id: number; name: string; price: number; number_of_lessons: number }>>([])
   const [parents, setParents] = useState<Parent[]>([])
+  const [plansNext, setPlansNext] = useState<string | null>(null)
+  const [parentsNext, setParentsNext] = useState<string | null>(null)
   const navigate = useNavigate()
 
   useEffect(() => {
     const fetchPlans = async () => {
       try {
-        const response = await planApi.getAll()
-        console.log('Fetched plans:', response.data)
-        setPlans(response.data)
+        const page = await planApi.getAll()
+        setPlans(page.results)
+        setPlansNext(page.next)
       } catch (error) {
         console.error('Error fetching plans:', error)
         toast({
@@ -82,9 +85,9 @@ export function AddStudentForm({ className }: React.HTMLAttributes<HTMLDivElemen
 
     const fetchParents = async () => {
       try {
-        const parents = await parentApi.getAll()
-        console.log('Fetched parents:', parents)
-        setParents(parents)
+        const page = await parentApi.getAll()
+        setParents(page.results)
+        setParentsNext(page.next)
       } catch (error) {
         console.error('Error fetching parents:', error)
         toast({
@@ -100,6 +103,26 @@ export function AddStudentForm({ className }: React.HTMLAttributes<HTMLDivElemen
     fetchParents()
   }, [])
 
+  const loadMorePlans = async () => {
+    try {
+      const page = await planApi.getAll(plansNext)
+      setPlans(previous => [...previous, ...page.results])
+      setPlansNext(page.next)
+    } catch (error) {
+      console.error('Error fetching plans:', error)
+    }
+  }
+
+  const loadMoreParents = async () => {
+    try {
+      const page = await parentApi.getAll(parentsNext)
+      setParents(previous => [...previous, ...page.results])
+      setParentsNext(page.next)
+    } catch (error) {
+      console.error('Error fetching parents:', error)
+    }
+  }
+
   const form = useForm<FormValues>({
     resolver: zodResolver(formSchema),
     defaultValues: {
@@ -252,6 +275,7 @@ export function AddStudentForm({ className }: React.HTMLAttributes<HTMLDivElemen
                       )}
                     </SelectContent>
                   </Select>
+                  <LoadMore hasMore={plansNext !== null} onLoadMore={loadMorePlans} />
                   <FormMessage />
                 </FormItem>
               )}
@@ -298,6 +322,7 @@ export function AddStudentForm({ className }: React.HTMLAttributes<HTMLDivElemen
                       )}
                     </SelectContent>
                   </Select>
+                  <LoadMore hasMore={parentsNext !== null} onLoadMore={loadMoreParents} />
                   <FormDescription>
                     Optional: Link this student to a parent
                   </FormDescription>
@@ -25,6 +25,7 @@ import { Input } from "@/components/ui/input"
 import { toast } from "@/hooks/use-toast"
 import { studentApi, parentApi } from "@/services/api"
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select"
+import { LoadMore } from "@/components/ui/load-more"
 
 interface Parent {
   id: number
@@ -66,6 +67,7 @@ interface EditStudentDialogProps {
 export function EditStudentDialog({ student, open, onOpenChange, onSuccess }: EditStudentDialogProps) {
   const [isSubmitting, setIsSubmitting] = React.useState(false)
   const [parents, setParents] = React.useState<Parent[]>([])
+  const [parentsNext, setParentsNext] = React.useState<string | null>(null)
   const [linkedParent, setLinkedParent] = React.useState<any>(null)
 
   const form = useForm<FormValues>({
@@ -91,14 +93,25 @@ export function EditStudentDialog({ student, open, onOpenChange, onSuccess }: Ed
     })
   }, [student, form])
 
+  const loadMoreParents = async () => {
+    try {
+      const page = await parentApi.getAll(parentsNext)
+      setParents(previous => [...previous, ...page.results])
+      setParentsNext(page.next)
+    } catch (error) {
+      console.error('Error fetching parents:', error)
+    }
+  }
+
   // Fetch parents when dialog opens
   React.useEffect(() => {
     if (open) {
       const fetchData = async () => {
         try {
-          // Fetch all parents
-          const parentsData = await parentApi.getAll()
-          setParents(parentsData)
+          // Fetch the first page of parents
+          const page = await parentApi.getAll()
+          setParents(page.results)
+          setParentsNext(page.next)
 
           // Fetch linked parent for this student
           if (student?.id) {
@@ -309,6 +322,7 @@ export function EditStudentDialog({ student, open, onOpenChange, onSuccess }: Ed
                         )}
                       </SelectContent>
                     </Select>
+                    <LoadMore hasMore={parentsNext !== null} onLoadMore={loadMoreParents} />
                     <FormMessage />
                   </FormItem>
                 )}
@@ -6,6 +6,8 @@ import { teacherApi } from '@/services/api'
 import { AddTeacherDialog } from './AddTeacherDialog'
 import { EditTeacherDialog } from './EditTeacherDialog'
 import { useToast } from '@/hooks/use-toast'
+import { usePagedList } from '@/hooks/usePagedList'
+import { LoadMore } from '@/components/ui/load-more'
 
 interface Teacher {
   id: string
@@ -17,30 +19,27 @@ interface Teacher {
 }
 
 export function TeacherList() {
-  const [teachers, setTeachers] = useState<Teacher[]>([])
-  const [isLoading, setIsLoading] = useState(true)
+  const {
+    items: teachers,
+    loading: isLoading,
+    error,
+    hasMore,
+    loadMore,
+    reload: fetchTeachers,
+  } = usePagedList<Teacher>(teacherApi.getAll)
   const [showAddDialog, setShowAddDialog] = useState(false)
   const [selectedTeacher, setSelectedTeacher] = useState<Teacher | null>(null)
   const { toast } = useToast()
 
   useEffect(() => {
-    fetchTeachers()
-  }, [])
-
-  const fetchTeachers = async () => {
-    try {
-      const data = await teacherApi.getAll()
-      setTeachers(data)
-      setIsLoading(false)
-    } catch (error) {
+    if (error) {
       toast({
         title: "Error",
         description: "Failed to fetch teachers",
         variant: "destructive",
       })
-      setIsLoading(false)
     }
-  }
+  }, [error, toast])
 
   const handleAddTeacher = () => {
     setShowAddDialog(true)
@@ -58,7 +57,7 @@ export function TeacherList() {
   //   })
   // }
 
-  if (isLoading) {
+  if (isLoading && teachers.length === 0) {
     return (
       <div className="flex items-center justify-center h-48">
         <div className="animate-spin rounded-full h-8 w-8 border-b-2 border-gray-900"></div>
@@ -136,6 +135,8 @@ export function TeacherList() {
         ))}
       </div>
 
+      <LoadMore hasMore={hasMore} loading={isLoading} onLoadMore={loadMore} />
+
       <AddTeacherDialog
         open={showAddDialog}
         onOpenChange={setShowAddDialog}
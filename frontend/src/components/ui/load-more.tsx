@@ -0,0 +1,21 @@
+import { Button } from "@/components/ui/button"
+import { LoadingSpinner } from "@/components/ui/loading-spinner"
+
+interface LoadMoreProps {
+  hasMore: boolean
+  loading?: boolean
+  onLoadMore: () => void
+}
+
+// Fetches the next page of a cursor paginated list, hidden once the last page is loaded
+export function LoadMore({ hasMore, loading = false, onLoadMore }: LoadMoreProps) {
+  if (!hasMore) return null
+  return (
+    <div className="flex justify-center py-4">
+      <Button type="button" variant="outline" onClick={onLoadMore} disabled={loading}>
+        {loading && <LoadingSpinner size={16} />}
+        Load more
+      </Button>
+    </div>
+  )
+}
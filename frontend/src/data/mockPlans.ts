@@ -1,12 +1,12 @@
 import { Plan, CreatePlanPayload } from '@/types/plan';
-import { planApi } from '@/services/api';
+import { planApi, type Page } from '@/services/api';
 
-export const getPlans = async (): Promise<Plan[]> => {
+export const getPlans = async (cursor?: string | null): Promise<Page<Plan>> => {
     try {
-        return (await planApi.getAll()).data;
+        return await planApi.getAll(cursor);
     } catch (error) {
         console.error('Failed to fetch plans:', error);
-        return [];
+        return { results: [], next: null };
     }
 };
 
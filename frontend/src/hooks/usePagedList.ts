@@ -0,0 +1,40 @@
+import { useState, useEffect, useCallback } from 'react';
+import type { Page } from '@/services/api';
+
+// Loads the first page of a cursor paginated list and appends the next page on demand
+export const usePagedList = <T,>(fetchPage: (cursor?: string | null) => Promise<Page<T>>, deps: unknown[] = []) => {
+  const [items, setItems] = useState<T[]>([]);
+  const [next, setNext] = useState<string | null>(null);
+  const [loading, setLoading] = useState(true);
+  const [error, setError] = useState<unknown>(null);
+
+  // eslint-disable-next-line react-hooks/exhaustive-deps
+  const load = useCallback(async (cursor?: string | null) => {
+    setLoading(true);
+    setError(null);
+    try {
+      const page = await fetchPage(cursor);
+      setItems(previous => (cursor ? [...previous, ...page.results] : page.results));
+      setNext(page.next);
+    } catch (err) {
+      console.error('Error fetching page:', err);
+      setError(err);
+    } finally {
+      setLoading(false);
+    }
+  }, deps);
+
+  useEffect(() => {
+    load();
+  }, [load]);
+
+  return {
+    items,
+    setItems,
+    loading,
+    error,
+    hasMore: next !== null,
+    loadMore: () => (next ? load(next) : Promise.resolve()),
+    reload: () => load(),
+  };
+};
@@ -43,6 +43,18 @@ api.interceptors.response.use(
   }
 );
 
+// List routes are cursor paginated, a page carries its rows and the link to the next one
+export interface Page<T> {
+  results: T[];
+  next: string | null;
+}
+
+// Fetches the first page of a list route, or the page a previous next link points to
+export const getPage = async <T = any>(url: string, cursor?: string | null, params?: Record<string, any>): Promise<Page<T>> => {
+  const { data } = cursor ? await api.get(cursor) : await api.get(url, { params });
+  return { results: data.results, next: data.next };
+};
+
 // Types
 export interface LoginCredentials {
   email: string;
@@ -185,20 +197,15 @@ export const authApi = {
 
 // Student endpoints
 export const studentApi = {
-  getAll: async () => {
-    const response = await api.get('/students/students/');
-    return response;
-  },
+  getAll: (cursor?: string | null) => getPage('/students/students/', cursor),
   
   getById: async (id: number) => {
     const response = await api.get(`/students/students/${id}/`);
     return response;
   },
 
-  getSubscription: async (studentId: string | number) => {
-    const response = await api.get(`/students/student-subscriptions/?student_id=${studentId}`);
-    return response;
-  },
+  getSubscription: (studentId: string | number, cursor?: string | null) =>
+    getPage('/students/student-subscriptions/', cursor, { student_id: studentId }),
 
   getDashboard: async () => {
     try {
@@ -276,11 +283,9 @@ export const studentApi = {
 
 // Teacher endpoints
 export const teacherApi = {
-  async getAll() {
+  async getAll(cursor?: string | null) {
     try {
-      const response = await api.get('/students/teachers/');
-      console.log('Teacher API Response:', response); // Debug log
-      return Array.isArray(response.data) ? response.data : [];
+      return await getPage('/students/teachers/', cursor);
     } catch (error) {
       console.error('Error fetching teachers:', error);
       throw error;
@@ -345,21 +350,21 @@ export const teacherApi = {
 
 // Parent endpoints
 export const parentApi = {
-  getAll(): Promise<Parent[]> {
-    return api.get('/parents/parents/').then(response => response.data);
+  getAll(cursor?: string | null): Promise<Page<Parent>> {
+    return getPage<Parent>('/parents/parents/', cursor);
   },
 
   getParentById(id: number): Promise<Parent> {
     return api.get(`/parents/parents/${id}/`).then(response => response.data);
   },
 
-  getParentStudentLinks(): Promise<any[]> {
-    return api.get('/parents/parent-student-links/').then(response => response.data);
+  getParentStudentLinks(cursor?: string | null): Promise<Page<any>> {
+    return getPage('/parents/parent-student-links/', cursor);
   },
 
   getStudentParentLink(studentId: number): Promise<any> {
-    return api.get(`/parents/parent-student-links/?student=${studentId}`).then(response => {
-      const links = response.data.filter((link: any) => link.student === studentId);
+    return api.get('/parents/parent-student-links/', { params: { student_id: studentId } }).then(response => {
+      const links = response.data.results;
       return links.length > 0 ? links[0] : null;
     });
   },
@@ -392,11 +397,11 @@ export const parentApi = {
     parent_id: number;
     student_id: number;
   }): Promise<void> {
-    return api.get(`/parents/parent-student-links/?student=${data.student_id}&parent=${data.parent_id}`)
+    return api.get('/parents/parent-student-links/', {
+      params: { student_id: data.student_id, parent_id: data.parent_id }
+    })
       .then(response => {
-        const links = response.data.filter(
-          (link: any) => link.student === data.student_id && link.parent === data.parent_id
-        );
+        const links = response.data.results;
         if (links.length > 0) {
           return api.delete(`/parents/parent-student-links/${links[0].id}/`);
         }
@@ -407,10 +412,9 @@ export const parentApi = {
 
 // Subscription endpoints
 export const subscriptionApi = {
-  getAll: async () => {
+  getAll: async (cursor?: string | null) => {
     try {
-      const { data } = await api.get('/students/student-subscriptions/');
-      return data;
+      return await getPage('/students/student-subscriptions/', cursor);
     } catch (error) {
       if (axios.isAxiosError(error)) {
         throw new Error(error.response?.data?.message || 'Failed to fetch subscriptions');
@@ -419,10 +423,9 @@ export const subscriptionApi = {
     }
   },
 
-  getByStudentId: async (studentId: string) => {
+  getByStudentId: async (studentId: string, cursor?: string | null) => {
     try {
-      const { data } = await api.get(`/students/student-subscriptions/?student=${studentId}`);
-      return data;
+      return await getPage('/students/student-subscriptions/', cursor, { student_id: studentId });
     } catch (error) {
       if (axios.isAxiosError(error)) {
         throw new Error(error.response?.data?.message || 'Failed to fetch subscription');
@@ -435,10 +438,7 @@ export const subscriptionApi = {
 
 // Group endpoints
 export const groupApi = {
-  getAll: async () => {
-    const response = await api.get('/students/groups/');
-    return response.data;
-  },
+  getAll: (cursor?: string | null) => getPage('/students/groups/', cursor),
   getById: async (id: string) => {
     const response = await api.get(`/students/groups/${id}/`);
     return response.data;
@@ -460,7 +460,10 @@ export const groupApi = {
 export const sessionApi = {
   getSessionsByDate: async (date: string) => {
     try {
-      const { data } = await api.get(`/students/sessions/?date=${date}`);
+      // The calendar lists the persisted and upcoming virtual sessions of a date range in one response
+      const { data } = await api.get('/students/sessions/calendar/', {
+        params: { start_date: date, end_date: date }
+      });
       return data;
     } catch (error) {
       console.error('Error fetching sessions:', error);
@@ -470,9 +473,10 @@ export const sessionApi = {
 
   getTeacherSessions: async (date: string) => {
     try {
-      const response = await api.get(`/students/sessions/`, {
+      const response = await api.get('/students/sessions/calendar/', {
         params: {
-          date: date
+          start_date: date,
+          end_date: date
         }
       });
       console.log('Teacher sessions response:', response.data); // Debug log
@@ -522,7 +526,7 @@ export const scheduleApi = {
       const [startDate, endDate] = dateRange.split(',');
       console.log('API call params:', { startDate, endDate, studentId });
       
-      const { data } = await api.get('/students/sessions/', {
+      const { data } = await api.get('/students/sessions/calendar/', {
         params: {
           start_date: startDate,
           end_date: endDate,
@@ -658,12 +662,9 @@ export const scheduleApi = {
 
 // Subscription Plan endpoints
 export const planApi = {
-  getAll: async () => {
+  getAll: async (cursor?: string | null) => {
     try {
-      const response = await api.get('/students/subscription-plans/');
-      console.log('Full API Response:', response);
-      console.log('Subscription plans data:', response.data);
-      return response; // Return the whole response, not just response.data
+      return await getPage('/students/subscription-plans/', cursor);
     } catch (error) {
       console.error('Error fetching subscription plans:', error);
       throw error;
@@ -707,14 +708,13 @@ export const userApi = {
 
 // Attendance endpoint
 export const attendanceApi = {
-  getAttendanceLogs: async (startDate?: string, endDate?: string) => {
+  getAttendanceLogs: async (startDate?: string, endDate?: string, cursor?: string | null) => {
     try {
-      const params = new URLSearchParams();
-      if (startDate) params.append('start_date', startDate);
-      if (endDate) params.append('end_date', endDate);
-      
-      const response = await api.get('/students/attendance-logs/', { params });
-      return response.data;
+      const params: Record<string, string> = {};
+      if (startDate) params.start_date = startDate;
+      if (endDate) params.end_date = endDate;
+
+      return await getPage('/students/attendance-logs/', cursor, params);
     } catch (error) {
       console.error('Error fetching attendance logs:', error);
       throw error;
@@ -747,7 +747,7 @@ export const attendanceApi = {
 
 // Group management API functions
 export const groupService = {
-  getGroups: () => api.get('/students/groups/'),
+  getGroups: (cursor?: string | null) => getPage('/students/groups/', cursor),
   getGroup: (id: number) => api.get(`/students/groups/${id}/`),
   createGroup: (data: {
     name: string;
@@ -790,7 +790,7 @@ export const financialApi = {
   },
   
   getTeacherSessions: async (teacherId: string, startDate: string, endDate: string) => {
-    const response = await api.get(`/students/sessions/`, {
+    const response = await api.get('/students/sessions/calendar/', {
       params: {
         teacher: teacherId,
         start_date: startDate,
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['-sent_at', '-id'], name='notificatio_sent_at_9c2064_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient_email', '-sent_at', '-id'], name='notificatio_recipie_6b6be7_idx'),
+        ),
+    ]
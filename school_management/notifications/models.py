@@ -14,5 +14,12 @@ class Notification(models.Model):
     recipient_email = models.EmailField()
     sent_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Listings page newest first, for everyone or one recipient
+        indexes = [
+            models.Index(fields=['-sent_at', '-id']),
+            models.Index(fields=['recipient_email', '-sent_at', '-id']),
+        ]
+
     def __str__(self):
         return f"{self.type} - {self.recipient_email}"
@@ -10,6 +10,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
     queryset = Notification.objects.all()
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-sent_at', '-id')
 
     def get_queryset(self):
         queryset = Notification.objects.all()
@@ -21,4 +22,4 @@ class NotificationViewSet(viewsets.ModelViewSet):
         if notification_type is not None:
             queryset = queryset.filter(type=notification_type)
 
-        return queryset.order_by('-sent_at')
+        return queryset
@@ -1,3 +1,42 @@
 from django.test import TestCase
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from students.models import Student
+from .models import Parent, ParentStudentLink
+
+
+class ParentStudentLinkTests(TestCase):
+    def test_links_filter_by_parent_and_student(self):
+        User = get_user_model()
+        parents = [
+            Parent.objects.create(
+                user=User.objects.create_user(email=f'parent-{index}@example.com', role='parent'),
+                name=f'parent-{index}', email=f'parent-{index}@example.com'
+            )
+            for index in range(2)
+        ]
+        students = [
+            Student.objects.create(
+                user=User.objects.create_user(email=f'child-{index}@example.com', role='student'),
+                name=f'child-{index}', email=f'child-{index}@example.com'
+            )
+            for index in range(2)
+        ]
+        links = {
+            (parent.id, student.id): ParentStudentLink.objects.create(parent=parent, student=student).id
+            for parent in parents for student in students
+        }
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(email='admin@example.com', role='admin'))
+
+        response = client.get('/api/parents/parent-student-links/', {'student_id': students[1].id})
+        self.assertEqual(
+            {link['id'] for link in response.data['results']},
+            {links[(parents[0].id, students[1].id)], links[(parents[1].id, students[1].id)]}
+        )
+
+        response = client.get('/api/parents/parent-student-links/', {
+            'student_id': students[0].id, 'parent_id': parents[1].id
+        })
+        self.assertEqual([link['id'] for link in response.data['results']], [links[(parents[1].id, students[0].id)]])
@@ -109,4 +109,7 @@ class ParentStudentLinkViewSet(viewsets.ModelViewSet):
         parent_id = self.request.query_params.get('parent_id', None)
         if parent_id is not None:
             queryset = queryset.filter(parent_id=parent_id)
+        student_id = self.request.query_params.get('student_id', None)
+        if student_id is not None:
+            queryset = queryset.filter(student_id=student_id)
         return queryset
@@ -153,6 +153,9 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # List routes return {'next', 'previous', 'results'}, pass page_size for up to 1000 rows
+    'DEFAULT_PAGINATION_CLASS': 'school_management.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
 }
 
 # CORS settings
@@ -192,6 +195,28 @@ SESSION_COOKIE_SECURE = False  # Set to True in production
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = 'Lax'
 
+# Shared by all workers, so invalidating cached availability reaches every process
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cache_table',
+    }
+}
+
+# Number of weeks ahead that sessions are generated from schedules. Listings
+# expand later occurrences virtually, so by default only the current day's
+# sessions are persisted ahead of attendance
+SESSION_HORIZON_WEEKS = int(os.environ.get('SESSION_HORIZON_WEEKS', 0))
+
+# Minutes before its start that the status sweeper opens a session for scans,
+# and after its end that it completes it. Scans are routed to sessions up to
+# 15 minutes outside their times, so the windows should not be shorter
+SESSION_OPEN_GRACE_MINUTES = int(os.environ.get('SESSION_OPEN_GRACE_MINUTES', 15))
+SESSION_CLOSE_GRACE_MINUTES = int(os.environ.get('SESSION_CLOSE_GRACE_MINUTES', 15))
+
+# IANA zone that lesson times are local to in calendar feeds, floating times when empty
+CALENDAR_TIME_ZONE = os.environ.get('CALENDAR_TIME_ZONE', '')
+
 # JWT settings
 from datetime import timedelta
 
@@ -1,15 +1,18 @@
 from django.contrib import admin
 from .models import (
     Student, Teacher, Group, Schedule, Session,
-    AttendanceLog, Performance, SubscriptionPlan,
-    StudentSubscription, GroupStudent
+    AttendanceLog, ScanReceipt, LessonLedger, Performance, SubscriptionPlan,
+    StudentSubscription, GroupStudent, Closure
 )
+from .services import ClosureService
 
 
 @admin.register(Student)
 class StudentAdmin(admin.ModelAdmin):
     list_display = ('name', 'email', 'level')
     search_fields = ('name', 'email')
+    # Balances change through the lesson ledger only
+    readonly_fields = ('lessons_remaining', 'subscription_balance')
 
 
 @admin.register(Session)
@@ -27,6 +30,41 @@ class AttendanceLogAdmin(admin.ModelAdmin):
     search_fields = ('student__name', 'session__id')
 
 
+@admin.register(ScanReceipt)
+class ScanReceiptAdmin(admin.ModelAdmin):
+    list_display = ('idempotency_key', 'student', 'scanned_at', 'status', 'received_at')
+    list_filter = ('status',)
+    search_fields = ('idempotency_key', 'student__name')
+
+
+@admin.register(LessonLedger)
+class LessonLedgerAdmin(admin.ModelAdmin):
+    list_display = ('student', 'entry_type', 'lessons', 'amount', 'lessons_after', 'balance_after', 'created_at')
+    list_filter = ('entry_type',)
+    search_fields = ('student__name', 'note')
+    date_hierarchy = 'created_at'
+
+
+@admin.register(Closure)
+class ClosureAdmin(admin.ModelAdmin):
+    list_display = ('start_date', 'end_date', 'teacher', 'group', 'reason')
+    list_filter = ('start_date',)
+    search_fields = ('reason', 'teacher__name', 'group__name')
+
+    def has_change_permission(self, request, obj=None):
+        # Sessions are cancelled when a closure is created, editing it would not redo that
+        return False
+
+    def save_model(self, request, obj, form, change):
+        closure, _ = ClosureService.create_closure(
+            obj.start_date, obj.end_date, teacher=obj.teacher, group=obj.group, reason=obj.reason
+        )
+        obj.pk = closure.pk
+
+    def delete_model(self, request, obj):
+        ClosureService.delete_closure(obj)
+
+
 @admin.register(Performance)
 class PerformanceAdmin(admin.ModelAdmin):
     list_display = ('student', 'session', 'date')
@@ -0,0 +1,138 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from students.models import (
+    Student, Teacher, Group, GroupStudent, Schedule, Session, SubscriptionPlan, StudentSubscription
+)
+from students.services import AttendanceService
+from datetime import time
+from decimal import Decimal
+import statistics
+import time as timer
+import uuid
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the QR scan pipeline and report queries per scan and p50/p99 latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scans',
+            type=int,
+            default=500,
+            help='Number of students to scan into a group session'
+        )
+
+    def handle(self, *args, **options):
+        num_scans = options['scans']
+        if num_scans < 2:
+            raise CommandError('At least two scans are needed to compute percentiles')
+        User = get_user_model()
+        tag = uuid.uuid4().hex[:8]
+        today = timezone.now().date()
+
+        self.stdout.write(f'Creating {num_scans} benchmark students...')
+        teacher_user = User.objects.create_user(
+            email=f'bench-teacher-{tag}@example.com',
+            role='instructor'
+        )
+        users = User.objects.bulk_create([
+            User(username=f'bench-{tag}-{i}@example.com', email=f'bench-{tag}-{i}@example.com', role='student')
+            for i in range(num_scans)
+        ])
+        group = None
+        plan = None
+
+        try:
+            teacher = Teacher.objects.create(
+                user=teacher_user,
+                name=f'Benchmark Teacher {tag}',
+                email=teacher_user.email
+            )
+            students = Student.objects.bulk_create([
+                Student(
+                    user=user,
+                    name=f'Benchmark Student {i}',
+                    email=user.email,
+                    lessons_remaining=10,
+                    subscription_balance=Decimal('100.00')
+                )
+                for i, user in enumerate(users)
+            ])
+            plan = SubscriptionPlan.objects.create(
+                name=f'Benchmark Plan {tag}',
+                number_of_lessons=10,
+                price=Decimal('100.00')
+            )
+            StudentSubscription.objects.bulk_create([
+                StudentSubscription(
+                    student=student,
+                    subscription_plan=plan,
+                    start_date=today,
+                    lesson_price=Decimal('10.00'),
+                    lessons_left=10
+                )
+                for student in students
+            ])
+
+            # Route every scan through group membership, the heavier lookup
+            group = Group.objects.create(
+                name=f'Benchmark Group {tag}',
+                language='English',
+                level='Beginner',
+                teacher=teacher,
+                max_capacity=num_scans
+            )
+            GroupStudent.objects.bulk_create([
+                GroupStudent(student=student, group=group) for student in students
+            ])
+            schedule = Schedule.objects.create(
+                teacher=teacher,
+                group=group,
+                days=[today.weekday()],
+                start_time=time(17, 0),
+                end_time=time(18, 30),
+                payment=0
+            )
+            Session.objects.create(
+                schedule=schedule,
+                teacher=teacher,
+                group=group,
+                date=today,
+                start_time=schedule.start_time,
+                end_time=schedule.end_time,
+                type='GROUP',
+                payment=0,
+                status='IN_PROGRESS'
+            )
+
+            query_counts = []
+            latencies = []
+            for student in students:
+                with CaptureQueriesContext(connection) as queries:
+                    started = timer.perf_counter()
+                    AttendanceService.scan(student.id, user=teacher_user, today=today)
+                    latencies.append((timer.perf_counter() - started) * 1000)
+                # BEGIN/COMMIT are logged too but are not extra lookups
+                query_counts.append(len([
+                    query for query in queries
+                    if query['sql'] not in ('BEGIN', 'COMMIT')
+                ]))
+
+            percentiles = statistics.quantiles(latencies, n=100)
+            self.stdout.write(f'Scans:             {len(latencies)}')
+            self.stdout.write(f'Queries per scan:  {statistics.mean(query_counts):.2f} (max {max(query_counts)})')
+            self.stdout.write(f'p50 latency:       {percentiles[49]:.2f} ms')
+            self.stdout.write(f'p99 latency:       {percentiles[98]:.2f} ms')
+
+        finally:
+            # Students, the teacher and their sessions cascade from the users
+            if group is not None:
+                group.delete()
+            if plan is not None:
+                plan.delete()
+            User.objects.filter(id__in=[user.id for user in users] + [teacher_user.id]).delete()
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete, fixtures removed'))
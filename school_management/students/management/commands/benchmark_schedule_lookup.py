@@ -0,0 +1,129 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import connection
+from students.models import Teacher, Group, Schedule
+from datetime import time
+import random
+import statistics
+import time as timer
+import uuid
+
+
+class Command(BaseCommand):
+    help = 'Benchmark weekday schedule lookups on the days JSON list against the days_mask column'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--teachers',
+            type=int,
+            default=200,
+            help='Number of benchmark teachers'
+        )
+        parser.add_argument(
+            '--schedules',
+            type=int,
+            default=100,
+            help='Number of schedules per teacher'
+        )
+        parser.add_argument(
+            '--lookups',
+            type=int,
+            default=500,
+            help='Number of (teacher, weekday) lookups to time'
+        )
+
+    def handle(self, *args, **options):
+        num_teachers = options['teachers']
+        num_schedules = options['schedules']
+        num_lookups = options['lookups']
+        if min(num_teachers, num_schedules, num_lookups) < 1:
+            raise CommandError('All counts must be positive')
+        User = get_user_model()
+        tag = uuid.uuid4().hex[:8]
+
+        self.stdout.write(f'Creating {num_teachers * num_schedules} benchmark schedules...')
+        users = User.objects.bulk_create([
+            User(username=f'bench-{tag}-{i}@example.com', email=f'bench-{tag}-{i}@example.com', role='instructor')
+            for i in range(num_teachers)
+        ])
+
+        try:
+            teachers = Teacher.objects.bulk_create([
+                Teacher(user=user, name=f'Benchmark Teacher {i}', email=user.email)
+                for i, user in enumerate(users)
+            ])
+            groups = Group.objects.bulk_create([
+                Group(
+                    name=f'Benchmark Group {tag} {i}',
+                    language='English',
+                    level='Beginner',
+                    teacher=teacher,
+                    max_capacity=10
+                )
+                for i, teacher in enumerate(teachers)
+            ])
+            schedules = []
+            for teacher, group in zip(teachers, groups):
+                for _ in range(num_schedules):
+                    days = random.sample(range(7), random.randint(1, 3))
+                    hour = random.randint(8, 20)
+                    schedules.append(Schedule(
+                        teacher=teacher,
+                        group=group,
+                        days=days,
+                        days_mask=Schedule.mask_for(days),
+                        start_time=time(hour),
+                        end_time=time(hour + 1),
+                        payment=0
+                    ))
+            Schedule.objects.bulk_create(schedules, batch_size=1000)
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(Schedule._meta.db_table)}')
+
+            lookups = [(random.choice(teachers).id, random.randint(0, 6)) for _ in range(num_lookups)]
+            self.compare('One teacher, one weekday', lookups, lambda teacher_id, day: (
+                Schedule.objects.filter(teacher_id=teacher_id).on_days([day]),
+                Schedule.objects.filter(teacher_id=teacher_id, days__contains=[day])
+            ))
+            self.compare('All teachers, one weekday', lookups[:50], lambda teacher_id, day: (
+                Schedule.objects.on_days([day]),
+                Schedule.objects.filter(days__contains=[day])
+            ))
+
+        finally:
+            # Teachers, their groups and schedules cascade from the users
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete, fixtures removed'))
+
+    def compare(self, label, lookups, build_querysets):
+        self.stdout.write(f'{label}:')
+        # The first pass warms the caches and is not reported
+        self.time_lookups(lookups, lambda *lookup: build_querysets(*lookup)[0])
+        mask_times, mask_results = self.time_lookups(lookups, lambda *lookup: build_querysets(*lookup)[0])
+        self.stdout.write(f'  days_mask:  p50 {statistics.median(mask_times):.3f} ms')
+
+        # JSON containment is not supported on SQLite
+        if not connection.features.supports_json_field_contains:
+            self.stdout.write('  days JSON:  not supported on this database')
+            return
+        self.time_lookups(lookups, lambda *lookup: build_querysets(*lookup)[1])
+        json_times, json_results = self.time_lookups(lookups, lambda *lookup: build_querysets(*lookup)[1])
+        if json_results != mask_results:
+            raise CommandError('days_mask and days returned different schedules')
+        self.stdout.write(f'  days JSON:  p50 {statistics.median(json_times):.3f} ms')
+        self.stdout.write(f'  speedup:    {statistics.median(json_times) / statistics.median(mask_times):.2f}x')
+
+    def time_lookups(self, lookups, build_queryset):
+        # Time the compiled SQL only, so ORM overhead does not hide the
+        # difference in how the database evaluates the filter
+        times = []
+        results = []
+        with connection.cursor() as cursor:
+            for teacher_id, day in lookups:
+                sql, params = build_queryset(teacher_id, day).values_list('id', flat=True).query.sql_with_params()
+                started = timer.perf_counter()
+                cursor.execute(sql, params)
+                results.append(sorted(row[0] for row in cursor.fetchall()))
+                times.append((timer.perf_counter() - started) * 1000)
+        return times, results
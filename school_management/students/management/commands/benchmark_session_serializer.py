@@ -0,0 +1,150 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import connection
+from rest_framework import serializers
+from students.models import Teacher, Student, Group, GroupStudent, Session
+from students.serializers import SessionSerializer
+from datetime import date, time, timedelta
+import random
+import statistics
+import time as timer
+import uuid
+
+
+class Command(BaseCommand):
+    help = 'Benchmark serializing a session listing field by field against the batched list serializer'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sessions',
+            type=int,
+            default=2000,
+            help='Number of benchmark sessions'
+        )
+        parser.add_argument(
+            '--groups',
+            type=int,
+            default=50,
+            help='Number of benchmark groups'
+        )
+        parser.add_argument(
+            '--group-size',
+            type=int,
+            default=8,
+            help='Number of students per group'
+        )
+        parser.add_argument(
+            '--repeats',
+            type=int,
+            default=5,
+            help='Number of timed runs of each serializer'
+        )
+
+    def handle(self, *args, **options):
+        num_sessions = options['sessions']
+        num_groups = options['groups']
+        group_size = options['group_size']
+        repeats = options['repeats']
+        if min(num_sessions, num_groups, group_size, repeats) < 1:
+            raise CommandError('All counts must be positive')
+        User = get_user_model()
+        tag = uuid.uuid4().hex[:8]
+
+        self.stdout.write(f'Creating {num_sessions} benchmark sessions in {num_groups} groups...')
+        users = User.objects.bulk_create([
+            User(username=f'bench-{tag}-{i}@example.com', email=f'bench-{tag}-{i}@example.com', role=role)
+            for i, role in enumerate(['instructor'] * 10 + ['student'] * (num_groups * group_size))
+        ])
+
+        groups = []
+        try:
+            teachers = Teacher.objects.bulk_create([
+                Teacher(user=user, name=f'Benchmark Teacher {i}', email=user.email, specializations=['English'])
+                for i, user in enumerate(users[:10])
+            ])
+            students = Student.objects.bulk_create([
+                Student(user=user, name=f'Benchmark Student {i}', email=user.email, level='Beginner')
+                for i, user in enumerate(users[10:])
+            ])
+            groups = Group.objects.bulk_create([
+                Group(
+                    name=f'Benchmark Group {tag} {i}',
+                    language='English',
+                    level='Beginner',
+                    teacher=teachers[i % len(teachers)],
+                    max_capacity=group_size
+                )
+                for i in range(num_groups)
+            ])
+            GroupStudent.objects.bulk_create([
+                GroupStudent(group=group, student=student)
+                for i, group in enumerate(groups)
+                for student in students[i * group_size:(i + 1) * group_size]
+            ])
+            sessions = []
+            for i in range(num_sessions):
+                group = random.choice(groups) if i % 4 else None
+                sessions.append(Session(
+                    teacher=group.teacher if group else random.choice(teachers),
+                    group=group,
+                    student=None if group else random.choice(students),
+                    date=date(2024, 1, 1) + timedelta(days=i % 365),
+                    start_time=time(8 + i % 12),
+                    end_time=time(9 + i % 12),
+                    type='GROUP' if group else 'PRIVATE',
+                    payment=0,
+                    status='SCHEDULED'
+                ))
+            session_ids = [session.id for session in Session.objects.bulk_create(sessions, batch_size=1000)]
+            listing = Session.objects.filter(id__in=session_ids).select_related('student', 'group', 'teacher')
+
+            def field_by_field():
+                # Every session walks its group's prefetched roster through each field
+                serializer = SessionSerializer(many=True)
+                return [
+                    serializers.ModelSerializer.to_representation(serializer.child, session)
+                    for session in listing.prefetch_related('group__students__student')
+                ]
+
+            def batched():
+                return SessionSerializer(listing.all(), many=True).data
+
+            before_times, before_queries, before = self.time_runs(field_by_field, repeats)
+            after_times, after_queries, after = self.time_runs(batched, repeats)
+            if [dict(row) for row in before] != [dict(row) for row in after]:
+                raise CommandError('The serializers returned different sessions')
+
+            self.stdout.write(
+                f'  field by field:  p50 {statistics.median(before_times):.1f} ms, {before_queries} queries'
+            )
+            self.stdout.write(
+                f'  batched:         p50 {statistics.median(after_times):.1f} ms, {after_queries} queries'
+            )
+            self.stdout.write(
+                f'  speedup:         {statistics.median(before_times) / statistics.median(after_times):.2f}x'
+            )
+
+        finally:
+            # Teachers, students and their sessions cascade from the users
+            Group.objects.filter(id__in=[group.id for group in groups]).delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete, fixtures removed'))
+
+    def time_runs(self, serialize, repeats):
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        # The first run warms the caches and is not reported
+        serialize()
+        times = []
+        for _ in range(repeats):
+            queries.clear()
+            with connection.execute_wrapper(count_query):
+                started = timer.perf_counter()
+                data = serialize()
+                times.append((timer.perf_counter() - started) * 1000)
+        return times, len(queries), data
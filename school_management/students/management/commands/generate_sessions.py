@@ -1,25 +1,113 @@
-from django.core.management.base import BaseCommand
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Q
 from django.utils import timezone
-from students.models import Schedule
+from students.manager import AvailabilityManager, ScheduleManager
+from students.models import Schedule, Session
 from datetime import timedelta
+import time as timer
+
+
+def generate_shard(teacher_ids, start_date, end_date, dry_run):
+    """Generate the sessions of one shard of teachers, returns its stats"""
+    started = timer.perf_counter()
+    schedules = list(Schedule.objects.filter(is_recurring=True, teacher_id__in=teacher_ids))
+    occurrences = sum(
+        len(ScheduleManager.session_dates(schedule, start_date, end_date)) for schedule in schedules
+    )
+    sessions = ScheduleManager.missing_sessions(schedules, start_date, end_date)
+
+    if not dry_run:
+        with transaction.atomic():
+            Session.objects.bulk_create(sessions, batch_size=1000, ignore_conflicts=True)
+            Schedule.objects.filter(id__in=[schedule.id for schedule in schedules]).filter(
+                Q(generated_until__isnull=True) | Q(generated_until__lt=end_date)
+            ).update(generated_until=end_date)
+            AvailabilityManager.invalidate(teacher_ids)
+
+    return {
+        'schedules': len(schedules),
+        'occurrences': occurrences,
+        'missing': len(sessions),
+        'elapsed': timer.perf_counter() - started,
+    }
+
+
+def generate_shard_in_worker(*args):
+    """generate_shard for a pool worker, which must not keep its connections open"""
+    try:
+        return generate_shard(*args)
+    finally:
+        connections.close_all()
+
 
 class Command(BaseCommand):
-    help = 'Generate sessions for upcoming week based on schedules'
+    help = 'Generate the missing sessions of all recurring schedules for the upcoming weeks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--weeks',
+            type=int,
+            default=settings.SESSION_HORIZON_WEEKS,
+            help='Number of weeks ahead to generate sessions for'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes to shard teachers across'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be generated without writing'
+        )
 
     def handle(self, *args, **options):
-        today = timezone.now().date()
-        end_date = today + timedelta(days=7)
-        
-        schedules = Schedule.objects.all()
-        sessions_created = 0
-        
-        for schedule in schedules:
-            # Generate session for next occurrence
-            session = schedule.generate_next_session()
-            if session:
-                sessions_created += 1
-                self.stdout.write(f"Created session for schedule {schedule.id} on {session.date}")
-        
+        weeks = options['weeks']
+        workers = options['workers']
+        dry_run = options['dry_run']
+        if weeks < 0:
+            raise CommandError('--weeks cannot be negative')
+        if workers < 1:
+            raise CommandError('--workers must be at least 1')
+
+        started = timer.perf_counter()
+        start_date = timezone.now().date()
+        end_date = start_date + timedelta(weeks=weeks)
+        teacher_ids = sorted(set(Schedule.objects.filter(is_recurring=True).values_list('teacher_id', flat=True)))
+        shards = [teacher_ids[index::workers] for index in range(workers) if teacher_ids[index::workers]]
+
         self.stdout.write(
-            self.style.SUCCESS(f'Successfully generated {sessions_created} sessions')
-        ) 
\ No newline at end of file
+            f'Generating sessions from {start_date} to {end_date} '
+            f'for {len(teacher_ids)} teachers in {len(shards)} shard(s)'
+        )
+
+        if len(shards) > 1:
+            # Each worker opens its own connection after the fork
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+                results = list(pool.map(
+                    generate_shard_in_worker,
+                    shards,
+                    [start_date] * len(shards),
+                    [end_date] * len(shards),
+                    [dry_run] * len(shards)
+                ))
+        else:
+            results = [generate_shard(shard, start_date, end_date, dry_run) for shard in shards]
+
+        elapsed = timer.perf_counter() - started
+        missing = sum(result['missing'] for result in results)
+        self.stdout.write(f'Schedules:         {sum(result["schedules"] for result in results)}')
+        self.stdout.write(f'Occurrences:       {sum(result["occurrences"] for result in results)}')
+        self.stdout.write(f'Missing sessions:  {missing}')
+        self.stdout.write(f'Slowest shard:     {max((result["elapsed"] for result in results), default=0):.2f} s')
+        self.stdout.write(f'Elapsed:           {elapsed:.2f} s')
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'Dry run, {missing} sessions would be generated'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Successfully generated {missing} sessions'))
@@ -0,0 +1,113 @@
+from django.core.management.base import BaseCommand, CommandError
+from students.models import Student
+from students.services import BalanceService
+from decimal import Decimal
+import csv
+import time as timer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare every student balance snapshot with their lesson ledger, cross-check the ledger '
+        'against attendance and report or fix drift'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of students compared per batch'
+        )
+        parser.add_argument(
+            '--report',
+            help='Write the drifted snapshots and attendance logs to this CSV file'
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Settle drifted attendance logs and reset drifted snapshots to their ledger totals'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        report = open(options['report'], 'w', newline='') if options['report'] else None
+        writer = None
+        if report:
+            writer = csv.writer(report)
+            writer.writerow([
+                'student_id', 'problem', 'attendance_id', 'snapshot_lessons', 'ledger_lessons',
+                'snapshot_balance', 'ledger_balance'
+            ])
+
+        started = timer.perf_counter()
+        checked = drifted = fixed = 0
+        attendance_drifted = settled = 0
+        last_id = 0
+        try:
+            while True:
+                # Walk the students by primary key, each chunk costs three queries
+                snapshot = list(Student.objects.filter(id__gt=last_id).order_by('id').values_list(
+                    'id', 'lessons_remaining', 'subscription_balance'
+                )[:chunk_size])
+                if not snapshot:
+                    break
+                last_id = snapshot[-1][0]
+                student_ids = [student_id for student_id, _, _ in snapshot]
+
+                attendances = BalanceService.attendance_drift(student_ids)
+                if writer:
+                    for attendance in attendances:
+                        problem = 'overcharged' if attendance.net < attendance.expected else 'uncharged'
+                        writer.writerow([
+                            attendance.student_id, f'{problem} {attendance.status} attendance',
+                            attendance.id, '', attendance.net, '', ''
+                        ])
+                attendance_drifted += len(attendances)
+                if attendances and options['fix']:
+                    # Settling moves the snapshots, so they are read again before being compared
+                    settled += BalanceService.settle_attendances(attendances)
+                    snapshot = list(Student.objects.filter(id__in=student_ids).order_by('id').values_list(
+                        'id', 'lessons_remaining', 'subscription_balance'
+                    ))
+
+                totals = BalanceService.ledger_totals(student_ids)
+
+                drift = []
+                for student_id, lessons_remaining, balance in snapshot:
+                    lessons, amount = totals.get(student_id, (0, Decimal('0.00')))
+                    if (lessons, amount) != (lessons_remaining, balance):
+                        drift.append(student_id)
+                        if writer:
+                            writer.writerow([student_id, 'snapshot', '', lessons_remaining, lessons, balance, amount])
+
+                checked += len(snapshot)
+                drifted += len(drift)
+                if drift and options['fix']:
+                    # Rechecked under lock, so concurrent deductions are not undone
+                    fixed += len(BalanceService.rebuild(drift))
+        finally:
+            if report:
+                report.close()
+
+        self.stdout.write(f'Students checked:  {checked}')
+        self.stdout.write(f'Drifted:           {drifted}')
+        self.stdout.write(f'Attendance drift:  {attendance_drifted}')
+        if options['fix']:
+            self.stdout.write(f'Fixed:             {fixed}')
+            self.stdout.write(f'Settled:           {settled}')
+        self.stdout.write(f'Elapsed:           {timer.perf_counter() - started:.2f} s')
+
+        if (drifted or attendance_drifted) and not options['fix']:
+            self.stdout.write(self.style.WARNING(
+                'Drift found, run with --fix to settle attendance and reset snapshots to the ledger'
+            ))
+        elif options['fix'] and settled < attendance_drifted:
+            self.stdout.write(self.style.WARNING(
+                f'{attendance_drifted - settled} attendance logs could not be settled, see the report'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('Balances reconciled'))
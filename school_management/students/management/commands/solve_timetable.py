@@ -0,0 +1,79 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from students.manager import ScheduleManager, TimetableSolver
+from decimal import Decimal
+
+
+class Command(BaseCommand):
+    help = 'Propose a conflict-free weekly timetable for groups without a schedule, optionally creating it'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--groups',
+            type=int,
+            nargs='+',
+            help='Only place these group ids'
+        )
+        parser.add_argument(
+            '--duration',
+            type=int,
+            default=TimetableSolver.DURATION,
+            help='Lesson length in minutes'
+        )
+        parser.add_argument(
+            '--step',
+            type=int,
+            default=TimetableSolver.STEP,
+            help='Minutes between candidate start times'
+        )
+        parser.add_argument(
+            '--time-limit',
+            type=float,
+            default=TimetableSolver.TIME_LIMIT,
+            help='Seconds the solver may spend'
+        )
+        parser.add_argument(
+            '--apply',
+            action='store_true',
+            help='Create the proposed schedules and their sessions'
+        )
+        parser.add_argument(
+            '--payment',
+            type=Decimal,
+            default=Decimal('25.00'),
+            help='Payment per lesson of the created schedules'
+        )
+
+    def handle(self, *args, **options):
+        if options['time_limit'] <= 0:
+            raise CommandError('--time-limit must be positive')
+        try:
+            solver = TimetableSolver.for_groups(
+                options['groups'], duration=options['duration'], step=options['step']
+            )
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+        result = solver.solve(options['time_limit'])
+
+        for proposal in result['proposals']:
+            self.stdout.write(
+                f"{proposal['teacher_name']:<30} {proposal['group_name']:<30} "
+                f"days {','.join(str(day) for day in proposal['days']):<8} "
+                f"{proposal['start_time']}-{proposal['end_time']}"
+            )
+        for group in result['unplaced']:
+            self.stdout.write(self.style.WARNING(f"Unplaced {group['group_name']}: {group['reason']}"))
+
+        self.stdout.write(f'Groups:     {len(solver.groups)}')
+        self.stdout.write(f'Placed:     {len(result["proposals"])}')
+        self.stdout.write(f'Unplaced:   {len(result["unplaced"])}')
+        self.stdout.write(f'Elapsed:    {result["elapsed"]:.2f} s')
+
+        if not options['apply']:
+            self.stdout.write(self.style.WARNING('Proposals only, run with --apply to create the schedules'))
+            return
+        try:
+            schedules = ScheduleManager.create_schedules(result['proposals'], payment=options['payment'])
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+        self.stdout.write(self.style.SUCCESS(f'Successfully created {len(schedules)} schedules'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from students.manager import SessionStatusManager
+from datetime import timedelta
+
+
+class Command(BaseCommand):
+    help = 'Start and complete sessions whose time has come, run every few minutes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--open-grace',
+            type=int,
+            help='Minutes before its start that a session opens, SESSION_OPEN_GRACE_MINUTES by default'
+        )
+        parser.add_argument(
+            '--close-grace',
+            type=int,
+            help='Minutes after its end that a session completes, SESSION_CLOSE_GRACE_MINUTES by default'
+        )
+
+    def handle(self, *args, **options):
+        open_grace = options['open_grace']
+        close_grace = options['close_grace']
+        if any(grace is not None and grace < 0 for grace in (open_grace, close_grace)):
+            raise CommandError('Grace windows cannot be negative')
+
+        swept = SessionStatusManager.sweep(
+            open_grace=None if open_grace is None else timedelta(minutes=open_grace),
+            close_grace=None if close_grace is None else timedelta(minutes=close_grace)
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Started {swept["started"]} and completed {swept["completed"]} sessions')
+        )
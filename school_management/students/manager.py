@@ -1,41 +1,151 @@
-from django.db import transaction
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Q
 from django.core.exceptions import ValidationError
 from .models import *
 from datetime import datetime, time, timedelta
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from bisect import bisect_left, bisect_right
+import hashlib
+import heapq
+import re
+from time import monotonic
+import uuid
+
+
+class TeacherTimetable:
+    """
+    A teacher's weekly schedules as per-day interval lists sorted by start
+    minute, loaded with a single query. Overlap lookups bisect into the list,
+    so checking a slot does not walk every schedule of the teacher.
+    """
+
+    def __init__(self, schedules):
+        self.days = {day: [] for day in range(7)}
+        for schedule in schedules:
+            start = ScheduleManager.to_minutes(schedule.start_time)
+            end = ScheduleManager.to_minutes(schedule.end_time)
+            for day in set(schedule.days):
+                if day in self.days:
+                    self.days[day].append((start, end, schedule))
+        self.starts = {}
+        self.longest = {}
+        for day, intervals in self.days.items():
+            intervals.sort(key=lambda interval: interval[:2])
+            self.starts[day] = [start for start, _, _ in intervals]
+            self.longest[day] = max((end - start for start, end, _ in intervals), default=0)
+
+    @classmethod
+    def for_teacher(cls, teacher, exclude_id=None, days=None):
+        schedules = Schedule.objects.filter(teacher=teacher).select_related('group', 'student').only(
+            'id', 'days', 'start_time', 'end_time', 'group__name', 'student__name'
+        )
+        if days is not None:
+            schedules = schedules.on_days(days)
+        if exclude_id is not None:
+            schedules = schedules.exclude(id=exclude_id)
+        return cls(schedules)
+
+    def overlapping(self, day, start, end):
+        """Return the schedules on day that overlap [start, end) in minutes"""
+        starts = self.starts.get(day)
+        if not starts:
+            return []
+        # Anything starting before start - longest has ended by start
+        low = bisect_right(starts, start - self.longest[day])
+        high = bisect_left(starts, end)
+        return [
+            schedule for interval_start, interval_end, schedule in self.days[day][low:high]
+            if interval_end > start
+        ]
 
 
 class ScheduleManager:
     @staticmethod
-    def check_schedule_conflict(teacher, start_time, end_time, day, exclude_id=None):
+    def to_time(value):
         # Convert string times to time objects if they're strings
-        if isinstance(start_time, str):
-            start_time = datetime.strptime(start_time, '%H:%M').time()
-        if isinstance(end_time, str):
-            end_time = datetime.strptime(end_time, '%H:%M').time()
+        if isinstance(value, str):
+            return datetime.strptime(value, '%H:%M').time()
+        return value
 
-        existing_schedules = Schedule.objects.filter(
-            teacher=teacher,
-            days__contains=[day]
-        ).exclude(id=exclude_id)
+    @staticmethod
+    def to_minutes(value):
+        return value.hour * 60 + value.minute
 
-        for schedule in existing_schedules:
-            if (start_time < schedule.end_time and end_time > schedule.start_time):
-                return True
-        return False
+    @staticmethod
+    def find_conflicts(teacher, slots, exclude_id=None):
+        """
+        Checks many candidate slots for a teacher at once.
+
+        slots is a list of {'days': [...], 'start_time': ..., 'end_time': ...}
+        dicts. The teacher's schedules are loaded with one query and every
+        overlap is reported, including overlaps between the candidate slots
+        themselves. Returns one {'slot': index, 'conflicts': [...]} dict per
+        slot, in order.
+        """
+        candidates = []
+        for slot in slots:
+            start_time = ScheduleManager.to_time(slot['start_time'])
+            end_time = ScheduleManager.to_time(slot['end_time'])
+            if start_time >= end_time:
+                raise ValidationError("End time must be after start time")
+            candidates.append((
+                set(slot['days']),
+                ScheduleManager.to_minutes(start_time),
+                ScheduleManager.to_minutes(end_time)
+            ))
+        timetable = TeacherTimetable.for_teacher(
+            teacher, exclude_id, days={day for days, _, _ in candidates for day in days}
+        )
+
+        results = []
+        for index, (days, start, end) in enumerate(candidates):
+            conflicts = []
+            for day in sorted(days):
+                for schedule in timetable.overlapping(day, start, end):
+                    conflicts.append({
+                        'day': day,
+                        'schedule_id': schedule.id,
+                        'start_time': schedule.start_time,
+                        'end_time': schedule.end_time,
+                        'description': schedule.group.name if schedule.group else schedule.student.name,
+                    })
+                for other, (other_days, other_start, other_end) in enumerate(candidates):
+                    if other != index and day in other_days and other_start < end and other_end > start:
+                        conflicts.append({'day': day, 'slot': other})
+            results.append({'slot': index, 'conflicts': conflicts})
+        return results
+
+    @staticmethod
+    def check_schedule_conflict(teacher, start_time, end_time, day, exclude_id=None):
+        conflicts = ScheduleManager.find_conflicts(
+            teacher,
+            [{'days': [day], 'start_time': start_time, 'end_time': end_time}],
+            exclude_id
+        )
+        return bool(conflicts[0]['conflicts'])
     
     @staticmethod
     def create_schedule(teacher, start_time, end_time, days, group=None, student=None, payment=0, is_recurring=True):
-        # Convert string times to time objects if they're strings
-        if isinstance(start_time, str):
-            start_time = datetime.strptime(start_time, '%H:%M').time()
-        if isinstance(end_time, str):
-            end_time = datetime.strptime(end_time, '%H:%M').time()
+        start_time = ScheduleManager.to_time(start_time)
+        end_time = ScheduleManager.to_time(end_time)
 
-        # Check for conflicts on each day
-        for day in days:
-            if ScheduleManager.check_schedule_conflict(teacher, start_time, end_time, day):
-                raise ValidationError(f"Schedule conflicts with existing appointments on day {day}")
+        # Check for conflicts on all days at once
+        if start_time < end_time:
+            conflicts = ScheduleManager.find_conflicts(
+                teacher, [{'days': days, 'start_time': start_time, 'end_time': end_time}]
+            )[0]['conflicts']
+            if conflicts:
+                raise ValidationError(
+                    "Schedule conflicts with existing appointments: " + ", ".join(
+                        f"{conflict['description']} on day {conflict['day']} "
+                        f"({conflict['start_time']:%H:%M}-{conflict['end_time']:%H:%M})"
+                        for conflict in conflicts
+                    )
+                )
         
         schedule = Schedule(
             teacher=teacher,
@@ -56,55 +166,1058 @@ class ScheduleManager:
         return schedule
 
     @staticmethod
-    def create_sessions_for_schedule(schedule):
-        """Creates sessions for the next 4 weeks based on the schedule"""
+    def create_schedules(proposals, payment=0):
+        """
+        Creates a group schedule for every proposal through create_schedule,
+        all or nothing. Groups without a teacher are assigned the proposed one.
+        """
+        teachers = Teacher.objects.in_bulk({proposal['teacher_id'] for proposal in proposals})
+        groups = Group.objects.in_bulk({proposal['group_id'] for proposal in proposals})
+        schedules = []
+        with transaction.atomic():
+            for proposal in proposals:
+                teacher = teachers.get(proposal['teacher_id'])
+                group = groups.get(proposal['group_id'])
+                if teacher is None or group is None:
+                    raise ValidationError("Proposal refers to a missing teacher or group")
+                if group.teacher_id is None:
+                    group.teacher = teacher
+                    group.save(update_fields=['teacher', 'updated_at'])
+                schedules.append(ScheduleManager.create_schedule(
+                    teacher=teacher,
+                    start_time=proposal['start_time'],
+                    end_time=proposal['end_time'],
+                    days=proposal['days'],
+                    group=group,
+                    payment=payment
+                ))
+        return schedules
+
+    @staticmethod
+    def session_dates(schedule, start_date, end_date, closures=()):
+        """
+        Returns every date from start_date to end_date that falls on one of
+        the schedule's days, skipping dates one of the closures covers
+        """
+        dates = []
+        for day in set(schedule.days):
+            current = start_date + timedelta(days=(day - start_date.weekday()) % 7)
+            while current <= end_date:
+                if not any(closure.covers(schedule, current) for closure in closures):
+                    dates.append(current)
+                current += timedelta(weeks=1)
+        return sorted(dates)
+
+    @staticmethod
+    def missing_sessions(schedules, start_date, end_date):
+        """
+        Returns unsaved sessions for every occurrence of the schedules between
+        start_date and end_date that does not exist yet and is not closed.
+        Occurrence dates are computed arithmetically, existing sessions and
+        closures are looked up with one query each. A session moved to
+        another date still holds its occurrence.
+        """
+        schedules = [schedule for schedule in schedules if schedule.group_id or schedule.student_id]
+        if not schedules or start_date > end_date:
+            return []
+
+        existing = set(Session.objects.filter(
+            schedule__in=schedules,
+            occurrence_date__range=(start_date, end_date)
+        ).values_list('schedule_id', 'occurrence_date'))
+        closures = list(Closure.objects.overlapping(start_date, end_date))
+
+        return [
+            ScheduleManager.occurrence_session(schedule, date)
+            for schedule in schedules
+            for date in ScheduleManager.session_dates(schedule, start_date, end_date, closures)
+            if (schedule.id, date) not in existing
+        ]
+
+    @staticmethod
+    def occurrence_session(schedule, date):
+        """An unsaved session for one occurrence of the schedule"""
+        return Session(
+            schedule=schedule,
+            teacher_id=schedule.teacher_id,
+            group_id=schedule.group_id,
+            student_id=None if schedule.group_id else schedule.student_id,
+            date=date,
+            occurrence_date=date,
+            start_time=schedule.start_time,
+            end_time=schedule.end_time,
+            type='GROUP' if schedule.group_id else 'PRIVATE',
+            payment=schedule.payment,
+            status='SCHEDULED'
+        )
+
+    @staticmethod
+    def iter_occurrences(schedules, start_date, end_date, closures=()):
+        """
+        Lazily yields (date, schedule) for every occurrence of the recurring
+        schedules from start_date to end_date that none of the closures
+        covers, ordered by date and start time, without touching the database.
+        """
+        def occurrences(schedule):
+            days = sorted({day for day in schedule.days if isinstance(day, int) and 0 <= day <= 6})
+            week = start_date - timedelta(days=start_date.weekday())
+            while days and week <= end_date:
+                for day in days:
+                    date = week + timedelta(days=day)
+                    if start_date <= date <= end_date and not any(
+                        closure.covers(schedule, date) for closure in closures
+                    ):
+                        yield date, schedule.start_time, schedule.id, schedule
+                week += timedelta(weeks=1)
+
+        for date, _, _, schedule in heapq.merge(*(
+            occurrences(schedule) for schedule in schedules
+            if schedule.is_recurring and (schedule.group_id or schedule.student_id)
+        )):
+            yield date, schedule
+
+    @staticmethod
+    def virtual_sessions(schedules, start_date, end_date, persisted=(), closures=()):
+        """
+        Lazily yields unsaved sessions for the open occurrences that have no
+        persisted session, given as (schedule_id, occurrence_date) pairs. Related
+        objects come from the schedules, so select_related them. Each one
+        has a virtual_id that occurrence() accepts.
+        """
+        persisted = set(persisted)
+        for date, schedule in ScheduleManager.iter_occurrences(schedules, start_date, end_date, closures):
+            if (schedule.id, date) in persisted:
+                continue
+            session = ScheduleManager.occurrence_session(schedule, date)
+            session.teacher = schedule.teacher
+            session.group = schedule.group
+            session.student = None if schedule.group_id else schedule.student
+            session.virtual_id = f'{schedule.id}-{date:%Y%m%d}'
+            yield session
+
+    @staticmethod
+    def is_virtual_id(value):
+        return re.fullmatch(r'\d+-\d{8}', str(value)) is not None
+
+    @staticmethod
+    def occurrence(virtual_id, materialize=False, schedules=None):
+        """
+        Returns the session of a virtual occurrence: the persisted one if it
+        exists, otherwise an unsaved one, or a newly saved one when
+        materialize is set because something is happening to it. schedules
+        narrows down which schedules may be looked up. Raises ValidationError
+        when the id is not an occurrence.
+        """
+        schedule_id, day = str(virtual_id).split('-')
+        try:
+            date = datetime.strptime(day, '%Y%m%d').date()
+        except ValueError:
+            raise ValidationError("Not a session occurrence")
+        schedule = (Schedule.objects.all() if schedules is None else schedules).filter(
+            id=schedule_id, is_recurring=True
+        ).select_related('teacher', 'group', 'student').first()
+        occurrence = next(ScheduleManager.virtual_sessions(
+            [schedule], date, date, closures=Closure.objects.overlapping(date, date)
+        ), None) if schedule else None
+        if occurrence is None:
+            raise ValidationError("Not a session occurrence")
+
+        session = Session.objects.filter(schedule=schedule, occurrence_date=date).first()
+        if session is not None:
+            return session
+        if not materialize:
+            return occurrence
+        try:
+            with transaction.atomic():
+                occurrence.save()
+        except IntegrityError:
+            # Materialized concurrently
+            return Session.objects.get(schedule=schedule, occurrence_date=date)
+        return occurrence
+
+    @staticmethod
+    def materialize_sessions(schedules, start_date=None, end_date=None):
+        """
+        Creates the missing sessions of the given schedules between start_date
+        (default today) and end_date (default SESSION_HORIZON_WEEKS ahead)
+        with one bulk_create that skips occurrences a concurrent run already
+        created. Returns the number of sessions created.
+        """
+        if start_date is None:
+            start_date = timezone.now().date()
+        if end_date is None:
+            end_date = start_date + timedelta(weeks=settings.SESSION_HORIZON_WEEKS)
+
+        sessions = ScheduleManager.missing_sessions(schedules, start_date, end_date)
+        Session.objects.bulk_create(sessions, batch_size=1000, ignore_conflicts=True)
+        if sessions:
+            AvailabilityManager.invalidate({session.teacher_id for session in sessions})
+        return len(sessions)
+
+    @staticmethod
+    def create_sessions_for_schedule(schedule, weeks=None):
+        """Creates sessions for the next weeks (SESSION_HORIZON_WEEKS by default) based on the schedule"""
         today = timezone.now().date()
-        end_date = today + timedelta(weeks=4)
-        
+        end_date = today + timedelta(weeks=settings.SESSION_HORIZON_WEEKS if weeks is None else weeks)
         with transaction.atomic():
-            # If it's a group schedule, create sessions for each student in the group
-            if schedule.group:
-                group_students = GroupStudent.objects.filter(group=schedule.group)
-                for day in schedule.days:
-                    current_date = today
-                    while current_date <= end_date:
-                        if current_date.weekday() == day:
-                            session = Session(
-                                schedule=schedule,
-                                teacher=schedule.teacher,
-                                group=schedule.group,
-                                date=current_date,
-                                start_time=schedule.start_time,
-                                end_time=schedule.end_time,
-                                type='GROUP',
-                                payment=schedule.payment,
-                                status='SCHEDULED'
-                            )
-                            session.save()
-                        current_date += timedelta(days=1)
-            
-            # If it's a private student schedule
-            elif schedule.student:
-                for day in schedule.days:
-                    current_date = today
-                    while current_date <= end_date:
-                        if current_date.weekday() == day:
-                            session = Session(
-                                schedule=schedule,
-                                teacher=schedule.teacher,
-                                student=schedule.student,
-                                date=current_date,
-                                start_time=schedule.start_time,
-                                end_time=schedule.end_time,
-                                type='PRIVATE',
-                                payment=schedule.payment,
-                                status='SCHEDULED'
-                            )
-                            session.save()
-                        current_date += timedelta(days=1)
+            created = ScheduleManager.materialize_sessions([schedule], today, end_date)
+            if schedule.generated_until is None or schedule.generated_until < end_date:
+                schedule.generated_until = end_date
+                schedule.save(update_fields=['generated_until'])
+        return created
+
+    @staticmethod
+    def sync_sessions(schedule, previous, today=None):
+        """
+        Carries an edit of a schedule over to its saved future sessions.
+        previous is the schedule as it was before the edit.
+
+        Sessions that have attendance or performance records, are completed or
+        cancelled, are running today, or were moved off their occurrence date
+        by hand are left alone. Only the fields the edit changed are pushed,
+        and only to sessions still holding the previous value, so sessions
+        retimed by hand keep their times. Sessions on a dropped weekday are
+        moved to an added weekday in the same week where there is one and
+        deleted otherwise, and the new occurrences up to generated_until are
+        bulk inserted. Returns counts of updated, moved, deleted and created
+        sessions.
+        """
+        if today is None:
+            today = timezone.now().date()
+        end_date = max(schedule.generated_until or today, today)
+
+        before = ScheduleManager.session_fields(previous)
+        fields = {
+            field: value for field, value in ScheduleManager.session_fields(schedule).items()
+            if before[field] != value
+        }
+        dropped_days = set(previous.days) - set(schedule.days)
+        added_days = set(schedule.days) - set(previous.days)
+
+        with transaction.atomic():
+            sessions = list(Session.objects.select_for_update().filter(
+                schedule=schedule,
+                occurrence_date__gte=today
+            ).order_by('occurrence_date').annotate(
+                has_records=Exists(AttendanceLog.objects.filter(session=OuterRef('pk'))) |
+                Exists(Performance.objects.filter(session=OuterRef('pk')))
+            ))
+            existing = {session.occurrence_date for session in sessions}
+
+            changed = []
+            removed = []
+            for session in sessions:
+                if session.has_records or session.status in ('COMPLETED', 'CANCELLED'):
+                    continue
+                if session.status == 'IN_PROGRESS' and session.date == today:
+                    continue
+                if session.date != session.occurrence_date:
+                    continue
+                if session.occurrence_date.weekday() in dropped_days:
+                    removed.append(session)
+                elif any(getattr(session, field) == before[field] for field in fields):
+                    changed.append(session)
+
+            moved = []
+            closures = []
+            if removed:
+                closures = list(Closure.objects.overlapping(today, removed[-1].occurrence_date + timedelta(days=6)))
+            for session in removed[:]:
+                week = session.occurrence_date - timedelta(days=session.occurrence_date.weekday())
+                target = next((
+                    date for date in ScheduleManager.session_dates(
+                        schedule, max(week, today), week + timedelta(days=6), closures
+                    )
+                    if date.weekday() in added_days and date not in existing
+                ), None)
+                if target is not None:
+                    existing.add(target)
+                    removed.remove(session)
+                    session.date = session.occurrence_date = target
+                    moved.append(session)
+
+            for session in changed + moved:
+                for field, value in fields.items():
+                    if getattr(session, field) == before[field]:
+                        setattr(session, field, value)
+            Session.objects.bulk_update(changed + moved, ['date', 'occurrence_date', *fields])
+            Session.objects.filter(id__in=[session.id for session in removed]).delete()
+            created = ScheduleManager.missing_sessions([schedule], today, end_date) if added_days else []
+            Session.objects.bulk_create(created, batch_size=1000)
+            AvailabilityManager.invalidate([schedule.teacher_id])
+
+        return {'updated': len(changed), 'moved': len(moved), 'deleted': len(removed), 'created': len(created)}
+
+    @staticmethod
+    def session_fields(schedule):
+        """The session fields a schedule sets on its occurrences"""
+        return {
+            'teacher_id': schedule.teacher_id,
+            'group_id': schedule.group_id,
+            'student_id': None if schedule.group_id else schedule.student_id,
+            'start_time': schedule.start_time,
+            'end_time': schedule.end_time,
+            'type': 'GROUP' if schedule.group_id else 'PRIVATE',
+            'payment': schedule.payment,
+        }
+
+    @staticmethod
+    def extend_horizon(weeks=None, today=None):
+        """
+        Keeps sessions of recurring schedules generated up to weeks ahead
+        (SESSION_HORIZON_WEEKS by default). Each schedule's generated_until
+        watermark means a run only creates the dates past it, so a daily run
+        adds one day of sessions. Returns the number of sessions created.
+        """
+        if today is None:
+            today = timezone.now().date()
+        end_date = today + timedelta(weeks=settings.SESSION_HORIZON_WEEKS if weeks is None else weeks)
+
+        schedules = Schedule.objects.filter(is_recurring=True).filter(
+            Q(generated_until__isnull=True) | Q(generated_until__lt=end_date)
+        )
+        # Schedules sharing a watermark share a start date and are generated together
+        pending = {}
+        for schedule in schedules:
+            start_date = today
+            if schedule.generated_until is not None:
+                start_date = max(today, schedule.generated_until + timedelta(days=1))
+            pending.setdefault(start_date, []).append(schedule)
+
+        created = 0
+        with transaction.atomic():
+            for start_date, batch in pending.items():
+                created += ScheduleManager.materialize_sessions(batch, start_date, end_date)
+            Schedule.objects.filter(
+                id__in=[schedule.id for batch in pending.values() for schedule in batch]
+            ).update(generated_until=end_date)
+        return created
+
+
+class SessionStatusManager:
+    @staticmethod
+    def grace_periods(open_grace=None, close_grace=None):
+        """The opening and closing grace windows, from settings by default"""
+        if open_grace is None:
+            open_grace = timedelta(minutes=settings.SESSION_OPEN_GRACE_MINUTES)
+        if close_grace is None:
+            close_grace = timedelta(minutes=settings.SESSION_CLOSE_GRACE_MINUTES)
+        return open_grace, close_grace
+
+    @staticmethod
+    def status_at(date, start_time, end_time, now=None, open_grace=None, close_grace=None):
+        """
+        The status the sweeper gives a session at now: IN_PROGRESS from
+        open_grace before its start, COMPLETED once close_grace after its
+        end has passed. Sessions ending before they start end the next day.
+        """
+        open_grace, close_grace = SessionStatusManager.grace_periods(open_grace, close_grace)
+        local_now = timezone.localtime(now or timezone.now()).replace(tzinfo=None)
+        starts_at = datetime.combine(date, start_time)
+        ends_at = datetime.combine(date, end_time)
+        if ends_at < starts_at:
+            ends_at += timedelta(days=1)
+
+        if ends_at + close_grace <= local_now:
+            return 'COMPLETED'
+        if starts_at - open_grace <= local_now:
+            return 'IN_PROGRESS'
+        return 'SCHEDULED'
+
+    @staticmethod
+    def sweep(now=None, open_grace=None, close_grace=None):
+        """
+        Moves every session whose time has come along SCHEDULED ->
+        IN_PROGRESS -> COMPLETED the way status_at would, with two UPDATEs
+        on the (status, date) index. Cancelled sessions are left alone.
+        Returns {'completed': sessions, 'started': sessions}.
+        """
+        open_grace, close_grace = SessionStatusManager.grace_periods(open_grace, close_grace)
+        local_now = timezone.localtime(now or timezone.now()).replace(tzinfo=None)
+        opens = local_now + open_grace
+        closes = local_now - close_grace
+        overnight = Q(end_time__lt=F('start_time'))
+
+        started = Q(date__lt=opens.date()) | Q(date=opens.date(), start_time__lte=opens.time())
+        ended = (
+            Q(date__lt=closes.date() - timedelta(days=1)) |
+            (Q(date=closes.date() - timedelta(days=1)) & (~overnight | Q(end_time__lte=closes.time()))) |
+            (Q(date=closes.date(), end_time__lte=closes.time()) & ~overnight)
+        )
+
+        with transaction.atomic():
+            # Completed first, so sessions that already ended never show as started
+            completed = Session.objects.filter(
+                status__in=['SCHEDULED', 'IN_PROGRESS'],
+                date__lte=closes.date()
+            ).filter(ended).update(status='COMPLETED')
+            started = Session.objects.filter(
+                status='SCHEDULED',
+                date__lte=opens.date()
+            ).filter(started).update(status='IN_PROGRESS')
+        return {'completed': completed, 'started': started}
+
+
+class AvailabilityManager:
+    """
+    Free time of teachers, worked out from their materialized sessions and
+    from the occurrences of recurring schedules that have no session yet.
+    Results are cached under a per-teacher version that invalidate() bumps
+    whenever a schedule or session of the teacher changes.
+    """
+
+    DAY_START = time(8, 0)
+    DAY_END = time(22, 0)
+    MAX_DAYS = 31
+    CACHE_TIMEOUT = 60 * 10
+
+    @staticmethod
+    def version(teacher_id=None):
+        key = f'availability:version:{teacher_id or "all"}'
+        version = cache.get(key)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.set(key, version, None)
+        return version
+
+    @staticmethod
+    def invalidate(teacher_ids):
+        """Drop cached availability of the given teachers and of every multi-teacher lookup"""
+        versions = {f'availability:version:{teacher_id}': uuid.uuid4().hex for teacher_id in {*teacher_ids, 'all'}}
+        # After commit, so a concurrent read cannot cache the old rows under the new version
+        transaction.on_commit(lambda: cache.set_many(versions, None))
+
+    @staticmethod
+    def busy_intervals(teacher_ids, start_date, end_date):
+        """
+        Returns {(teacher_id, date): [(start_minute, end_minute), ...]} with
+        one query each for sessions, schedules and closures. A schedule
+        occurrence only counts when it has no session and is not closed, so
+        moved and cancelled sessions are respected.
+        """
+        busy = {}
+        materialized = set()
+        sessions = Session.objects.filter(
+            Q(date__range=(start_date, end_date)) | Q(occurrence_date__range=(start_date, end_date)),
+            teacher_id__in=teacher_ids
+        ).values_list('teacher_id', 'schedule_id', 'date', 'occurrence_date', 'start_time', 'end_time', 'status')
+        for teacher_id, schedule_id, date, occurrence_date, start_time, end_time, session_status in sessions:
+            materialized.add((schedule_id, occurrence_date))
+            if session_status != 'CANCELLED' and start_date <= date <= end_date:
+                busy.setdefault((teacher_id, date), []).append(
+                    (ScheduleManager.to_minutes(start_time), ScheduleManager.to_minutes(end_time))
+                )
+
+        weekdays = {(start_date + timedelta(days=offset)).weekday()
+                    for offset in range(min((end_date - start_date).days + 1, 7))}
+        schedules = Schedule.objects.filter(teacher_id__in=teacher_ids, is_recurring=True).on_days(weekdays).only(
+            'id', 'teacher_id', 'group_id', 'days', 'start_time', 'end_time'
+        )
+        closures = list(Closure.objects.overlapping(start_date, end_date))
+        for schedule in schedules:
+            for date in ScheduleManager.session_dates(schedule, start_date, end_date, closures):
+                if (schedule.id, date) not in materialized:
+                    busy.setdefault((schedule.teacher_id, date), []).append(
+                        (ScheduleManager.to_minutes(schedule.start_time), ScheduleManager.to_minutes(schedule.end_time))
+                    )
+        return busy
+
+    @staticmethod
+    def free_slots(busy, duration, day_start, day_end):
+        """Returns the gaps of at least duration minutes between day_start and day_end"""
+        slots = []
+        cursor = day_start
+        for start, end in sorted(busy):
+            if min(start, day_end) - cursor >= duration:
+                slots.append((cursor, min(start, day_end)))
+            cursor = max(cursor, end)
+        if day_end - cursor >= duration:
+            slots.append((cursor, day_end))
+        return slots
+
+    @staticmethod
+    def teacher_availability(teacher_id, start_date, end_date, duration=60, day_start=None, day_end=None):
+        """
+        Returns [{'date': ..., 'free': [{'start': 'HH:MM', 'end': 'HH:MM'}, ...]}, ...]
+        for every date from start_date to end_date, cached until the
+        teacher's schedules or sessions change.
+        """
+        day_start = ScheduleManager.to_minutes(day_start or AvailabilityManager.DAY_START)
+        day_end = ScheduleManager.to_minutes(day_end or AvailabilityManager.DAY_END)
+        if duration <= 0:
+            raise ValidationError("Duration must be positive")
+        if start_date > end_date:
+            raise ValidationError("The start date must not be after the end date")
+        if (end_date - start_date).days >= AvailabilityManager.MAX_DAYS:
+            raise ValidationError(f"At most {AvailabilityManager.MAX_DAYS} days can be requested at once")
+
+        key = (
+            f'availability:{teacher_id}:{AvailabilityManager.version(teacher_id)}:'
+            f'{start_date}:{end_date}:{duration}:{day_start}:{day_end}'
+        )
+        availability = cache.get(key)
+        if availability is None:
+            busy = AvailabilityManager.busy_intervals([teacher_id], start_date, end_date)
+            availability = []
+            for offset in range((end_date - start_date).days + 1):
+                date = start_date + timedelta(days=offset)
+                availability.append({
+                    'date': date.isoformat(),
+                    'free': [
+                        {'start': f'{start // 60:02d}:{start % 60:02d}', 'end': f'{end // 60:02d}:{end % 60:02d}'}
+                        for start, end in AvailabilityManager.free_slots(
+                            busy.get((teacher_id, date), []), duration, day_start, day_end
+                        )
+                    ],
+                })
+            cache.set(key, availability, AvailabilityManager.CACHE_TIMEOUT)
+        return availability
+
+    @staticmethod
+    def free_teachers(start_time, end_time, date=None, day=None):
+        """
+        Splits all teachers into those free and those busy between
+        start_time and end_time, either on a date (sessions and schedules)
+        or on every week's weekday (recurring schedules only). Returns
+        {'available': [teacher_id, ...], 'busy': [teacher_id, ...]}.
+        """
+        start_time = ScheduleManager.to_time(start_time)
+        end_time = ScheduleManager.to_time(end_time)
+        if start_time >= end_time:
+            raise ValidationError("End time must be after start time")
+        if (date is None) == (day is None):
+            raise ValidationError("Give either a date or a weekday")
+
+        key = f'availability:teachers:{AvailabilityManager.version()}:{date}:{day}:{start_time}:{end_time}'
+        result = cache.get(key)
+        if result is not None:
+            return result
+
+        teacher_ids = list(Teacher.objects.order_by('name', 'id').values_list('id', flat=True))
+        if date is not None:
+            busy = AvailabilityManager.busy_intervals(teacher_ids, date, date)
+            start = ScheduleManager.to_minutes(start_time)
+            end = ScheduleManager.to_minutes(end_time)
+            busy_ids = {
+                teacher_id for (teacher_id, _), intervals in busy.items()
+                if any(interval_start < end and interval_end > start for interval_start, interval_end in intervals)
+            }
+        else:
+            busy_ids = set(Schedule.objects.filter(
+                is_recurring=True,
+                start_time__lt=end_time,
+                end_time__gt=start_time
+            ).on_days([day]).values_list('teacher_id', flat=True))
+
+        result = {
+            'available': [teacher_id for teacher_id in teacher_ids if teacher_id not in busy_ids],
+            'busy': [teacher_id for teacher_id in teacher_ids if teacher_id in busy_ids],
+        }
+        cache.set(key, result, AvailabilityManager.CACHE_TIMEOUT)
+        return result
+
+
+class CalendarManager:
+    """
+    iCalendar feeds of a teacher, student or group. A recurring schedule is
+    written once as a weekly RRULE, with cancelled occurrences as EXDATEs,
+    occurrences moved to another day as EXDATEs plus an event of their own
+    and retimed ones as overrides, so feeds stay small however far they
+    reach. Rendered feeds are cached under versions that invalidate() bumps
+    whenever a session or schedule of the feed's owner changes.
+    """
+
+    KINDS = ('teacher', 'student', 'group')
+    WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+    # Sessions older than this are left out, and recurring series start no
+    # earlier, so every occurrence in the feed has its exceptions loaded
+    PAST_DAYS = 90
+    REFRESH_MINUTES = 15
+    CACHE_TIMEOUT = 60 * 60 * 24
+    SALT = 'students.calendar'
+
+    @staticmethod
+    def token(kind, owner_id):
+        """Secret part of a feed URL, calendar clients cannot send a JWT"""
+        return signing.Signer(salt=CalendarManager.SALT).signature(f'{kind}:{owner_id}')
+
+    @staticmethod
+    def check_token(kind, owner_id, token):
+        return kind in CalendarManager.KINDS and constant_time_compare(
+            token, CalendarManager.token(kind, owner_id)
+        )
+
+    @staticmethod
+    def invalidate(teacher_ids=(), group_ids=(), student_ids=()):
+        """Bump the versions of the affected feeds once the transaction commits"""
+        now = timezone.now()
+        versions = {
+            f'calendar:version:{kind}:{owner_id}': (uuid.uuid4().hex, now)
+            for kind, owner_ids in (('teacher', teacher_ids), ('group', group_ids), ('student', student_ids))
+            for owner_id in owner_ids
+            if owner_id is not None
+        }
+        if versions:
+            transaction.on_commit(lambda: cache.set_many(versions, None))
+
+    @staticmethod
+    def invalidate_all():
+        """Bump the version every feed depends on, for changes such as closures"""
+        version = (uuid.uuid4().hex, timezone.now())
+        transaction.on_commit(lambda: cache.set('calendar:version:all', version, None))
+
+    @staticmethod
+    def state(kind, owner_id):
+        """
+        Returns (etag, last_modified) of a feed from its cached versions. A
+        student's feed also depends on the versions of their groups.
+        """
+        keys = ['calendar:version:all', f'calendar:version:{kind}:{owner_id}']
+        if kind == 'student':
+            keys += [
+                f'calendar:version:group:{group_id}'
+                for group_id in GroupStudent.objects.filter(student_id=owner_id).order_by('group_id').values_list(
+                    'group_id', flat=True
+                )
+            ]
+        versions = cache.get_many(keys)
+        missing = {key: (uuid.uuid4().hex, timezone.now()) for key in keys if key not in versions}
+        if missing:
+            cache.set_many(missing, None)
+            versions.update(missing)
+
+        etag = hashlib.md5(
+            ';'.join(f'{key}={versions[key][0]}' for key in keys).encode()
+        ).hexdigest()
+        return etag, max(modified for _, modified in versions.values())
+
+    @staticmethod
+    def feed(kind, owner_id, etag):
+        """Returns the rendered feed for the state etag, rendering it on a cache miss"""
+        key = f'calendar:feed:{kind}:{owner_id}:{etag}'
+        body = cache.get(key)
+        if body is None:
+            body = CalendarManager.render(kind, owner_id)
+            cache.set(key, body, CalendarManager.CACHE_TIMEOUT)
+        return body
+
+    @staticmethod
+    def render(kind, owner_id):
+        """Renders the feed with four queries"""
+        window_start = timezone.localdate() - timedelta(days=CalendarManager.PAST_DAYS)
+        schedules = Schedule.objects.select_related('teacher', 'group', 'student')
+        sessions = Session.objects.filter(
+            Q(date__gte=window_start) | Q(occurrence_date__gte=window_start)
+        ).select_related('teacher', 'group', 'student')
+        if kind == 'teacher':
+            name = Teacher.objects.filter(id=owner_id).values_list('name', flat=True).first()
+            owner = Q(teacher_id=owner_id)
+        elif kind == 'group':
+            name = Group.objects.filter(id=owner_id).values_list('name', flat=True).first()
+            owner = Q(group_id=owner_id)
+        else:
+            name = Student.objects.filter(id=owner_id).values_list('name', flat=True).first()
+            owner = Q(student_id=owner_id) | Q(group_id__in=GroupStudent.objects.filter(
+                student_id=owner_id
+            ).values('group_id'))
+
+        lines = [
+            'BEGIN:VCALENDAR',
+            'VERSION:2.0',
+            'PRODID:-//school_management//Schedule//EN',
+            'CALSCALE:GREGORIAN',
+            'METHOD:PUBLISH',
+            f'X-WR-CALNAME:{CalendarManager.escape(name or "Schedule")}',
+            f'REFRESH-INTERVAL;VALUE=DURATION:PT{CalendarManager.REFRESH_MINUTES}M',
+            f'X-PUBLISHED-TTL:PT{CalendarManager.REFRESH_MINUTES}M',
+        ]
+        stamp = timezone.now().strftime('%Y%m%dT%H%M%SZ')
+
+        closures = list(Closure.objects.filter(end_date__gte=window_start))
+        recurring = {}
+        for schedule in schedules.filter(owner):
+            if schedule.is_recurring and schedule.days_mask:
+                recurring[schedule.id] = (schedule, [], [])
+        single = []
+        for session in sessions.filter(owner).order_by('date', 'start_time'):
+            pattern = recurring.get(session.schedule_id)
+            occurrence = session.occurrence_date or session.date
+            if pattern is None or occurrence < window_start or occurrence.weekday() not in pattern[0].days:
+                if session.status != 'CANCELLED' and session.date >= window_start:
+                    single.append(session)
+            elif session.status == 'CANCELLED':
+                pattern[1].append(occurrence)
+            elif session.date != occurrence:
+                # Moved to another day, the occurrence is dropped from the series
+                pattern[1].append(occurrence)
+                if session.date >= window_start:
+                    single.append(session)
+            elif (session.start_time, session.end_time) != (pattern[0].start_time, pattern[0].end_time):
+                pattern[2].append(session)
+
+        for schedule, dropped, moved in recurring.values():
+            start_date = max(timezone.localdate(schedule.created_at), window_start)
+            start_date += timedelta(days=min((day - start_date.weekday()) % 7 for day in set(schedule.days)))
+            event = CalendarManager.event(kind, f'schedule-{schedule.id}', schedule, start_date, stamp)
+            event.insert(-1, 'RRULE:FREQ=WEEKLY;BYDAY=' + ','.join(
+                CalendarManager.WEEKDAYS[day] for day in sorted(set(schedule.days))
+            ))
+            excluded = set(dropped)
+            for closure in closures:
+                if closure.teacher_id in (None, schedule.teacher_id) and closure.group_id in (None, schedule.group_id):
+                    excluded.update(ScheduleManager.session_dates(
+                        schedule, max(closure.start_date, window_start, start_date), closure.end_date
+                    ))
+            for date in sorted(excluded):
+                event.insert(-1, 'EXDATE' + CalendarManager.when(date, schedule.start_time))
+            lines += event
+            for session in moved:
+                override = CalendarManager.event(kind, f'schedule-{schedule.id}', session, session.date, stamp)
+                override.insert(-1, 'RECURRENCE-ID' + CalendarManager.when(session.date, schedule.start_time))
+                lines += override
+        for session in single:
+            lines += CalendarManager.event(kind, f'session-{session.id}', session, session.date, stamp)
+
+        lines.append('END:VCALENDAR')
+        return ''.join(CalendarManager.fold(line) + '\r\n' for line in lines)
+
+    @staticmethod
+    def event(kind, uid, lesson, date, stamp):
+        """VEVENT lines for a schedule or session, ending with END:VEVENT"""
+        if lesson.group_id:
+            summary = lesson.group.name
+        elif kind == 'teacher':
+            summary = f'Private lesson: {lesson.student.name}' if lesson.student_id else 'Private lesson'
+        else:
+            summary = f'Private lesson with {lesson.teacher.name}'
+        return [
+            'BEGIN:VEVENT',
+            f'UID:{uid}@school_management',
+            f'DTSTAMP:{stamp}',
+            'DTSTART' + CalendarManager.when(date, lesson.start_time),
+            'DTEND' + CalendarManager.when(date, lesson.end_time),
+            f'SUMMARY:{CalendarManager.escape(summary)}',
+            f'DESCRIPTION:{CalendarManager.escape("Teacher: " + lesson.teacher.name)}',
+            'END:VEVENT',
+        ]
+
+    @staticmethod
+    def when(date, value):
+        """The ':value' of a date-time property, in CALENDAR_TIME_ZONE or floating local time"""
+        moment = datetime.combine(date, value).strftime('%Y%m%dT%H%M%S')
+        if settings.CALENDAR_TIME_ZONE:
+            return f';TZID={settings.CALENDAR_TIME_ZONE}:{moment}'
+        return f':{moment}'
+
+    @staticmethod
+    def escape(text):
+        for special, escaped in (('\\', '\\\\'), (';', '\\;'), (',', '\\,'), ('\r\n', '\\n'), ('\n', '\\n')):
+            text = text.replace(special, escaped)
+        return text
+
+    @staticmethod
+    def fold(line):
+        """Splits a content line into 75-octet pieces, continued with a leading space"""
+        encoded = line.encode()
+        if len(encoded) <= 75:
+            return line
+        pieces = []
+        while encoded:
+            size = 75 if not pieces else 74
+            # Never cut a multi-byte character in half
+            while size < len(encoded) and (encoded[size] & 0xC0) == 0x80:
+                size -= 1
+            pieces.append(encoded[:size].decode())
+            encoded = encoded[size:]
+        return '\r\n '.join(pieces)
+
+
+class TimetableSolver:
+    """
+    Proposes a conflict-free weekly timetable for groups without a schedule.
+
+    Teachers and students get one bitmap per weekday with a bit per busy
+    minute, so checking a slot costs a few integer ANDs. Groups are placed
+    greedily, most constrained first. A local search then fits leftover
+    groups by moving a group that blocks them, and moves placed groups to
+    cheaper slots (lighter teacher load, fewer gaps and working days).
+    """
+
+    # Twice-weekly lessons, the school's usual rhythm
+    PATTERNS = ([0, 2], [1, 3], [2, 4], [0, 3], [1, 4], [3, 5], [2, 5])
+    DURATION = 90
+    STEP = 30
+    TIME_LIMIT = 10
+    # Costs of a placement, on top of the teacher's weekly load in hours
+    NEW_DAY_COST = 2
+    GAP_COST = 1
+
+    def __init__(self, groups, teachers, schedules, memberships, duration=None, patterns=None, step=None,
+                 day_start=None, day_end=None):
+        self.duration = self.DURATION if duration is None else duration
+        step = self.STEP if step is None else step
+        day_start = ScheduleManager.to_minutes(ScheduleManager.to_time(day_start or AvailabilityManager.DAY_START))
+        day_end = ScheduleManager.to_minutes(ScheduleManager.to_time(day_end or AvailabilityManager.DAY_END))
+        if self.duration <= 0 or step <= 0:
+            raise ValidationError("Duration and step must be positive")
+        patterns = [sorted(set(days)) for days in (patterns or self.PATTERNS)]
+        if not patterns or any(not days or not all(0 <= day <= 6 for day in days) for days in patterns):
+            raise ValidationError("Every day pattern needs weekdays from 0 to 6")
+
+        self.groups = {group.id: group for group in groups}
+        self.teachers = {teacher.id: teacher for teacher in teachers}
+        self.specializations = {
+            teacher.id: {str(name).lower() for name in teacher.specializations or []} for teacher in teachers
+        }
+        self.slots = [
+            (days, start)
+            for days in patterns
+            for start in range(day_start, day_end - self.duration + 1, step)
+        ]
+        self.masks = {start: self.mask(start, start + self.duration) for _, start in self.slots}
+        self.members = {group_id: [] for group_id in self.groups}
+        student_groups = {}
+        for student_id, group_id in memberships:
+            student_groups.setdefault(group_id, []).append(student_id)
+            if group_id in self.members:
+                self.members[group_id].append(student_id)
+
+        self.teacher_busy = {teacher_id: [0] * 7 for teacher_id in self.teachers}
+        self.student_busy = {
+            student_id: [0] * 7 for student_ids in student_groups.values() for student_id in student_ids
+        }
+        self.load = dict.fromkeys(self.teachers, 0)
+        for teacher_id, group_id, student_id, days, start_time, end_time in schedules:
+            start = ScheduleManager.to_minutes(start_time)
+            end = ScheduleManager.to_minutes(end_time)
+            if start >= end:
+                continue
+            mask = self.mask(start, end)
+            attendees = student_groups.get(group_id, []) if group_id else [student_id]
+            for day in set(days):
+                if not 0 <= day <= 6:
+                    continue
+                if teacher_id in self.teacher_busy:
+                    self.teacher_busy[teacher_id][day] |= mask
+                    self.load[teacher_id] += end - start
+                for attendee in attendees:
+                    self.student_busy.setdefault(attendee, [0] * 7)[day] |= mask
+
+        self.eligible = {group_id: self.eligible_teachers(group) for group_id, group in self.groups.items()}
+        self.placements = {}
+
+    @classmethod
+    def for_groups(cls, group_ids=None, **options):
+        """Loads the unscheduled active groups (optionally only group_ids) and all occupancy in four queries"""
+        groups = Group.objects.filter(status__in=['active', 'full']).exclude(
+            Exists(Schedule.objects.filter(group=OuterRef('pk')))
+        ).only('id', 'name', 'language', 'level', 'teacher', 'max_capacity').order_by('id')
+        if group_ids is not None:
+            groups = groups.filter(id__in=group_ids)
+        groups = list(groups)
+        teachers = list(Teacher.objects.only('id', 'name', 'specializations').order_by('id'))
+        schedules = Schedule.objects.values_list(
+            'teacher_id', 'group_id', 'student_id', 'days', 'start_time', 'end_time'
+        )
+        memberships = GroupStudent.objects.values_list('student_id', 'group_id')
+        return cls(groups, teachers, schedules, memberships, **options)
+
+    @staticmethod
+    def mask(start, end):
+        return ((1 << (end - start)) - 1) << start
+
+    def eligible_teachers(self, group):
+        """
+        The group's own teacher, otherwise the specialists in its language,
+        otherwise the teachers without any specializations
+        """
+        if group.teacher_id is not None:
+            return [group.teacher_id] if group.teacher_id in self.teachers else []
+        language = group.language.lower()
+        specialists = [teacher_id for teacher_id, names in self.specializations.items() if language in names]
+        generalists = [teacher_id for teacher_id, names in self.specializations.items() if not names]
+        return specialists or generalists
+
+    def student_occupancy(self, group_id):
+        """Per-day bitmaps of the minutes any student of the group is busy"""
+        busy = [0] * 7
+        for student_id in self.members[group_id]:
+            for day, minutes in enumerate(self.student_busy[student_id]):
+                busy[day] |= minutes
+        return busy
+
+    def teacher_cost(self, group_id, teacher_id):
+        """The part of a placement's cost that does not depend on the slot"""
+        cost = self.load[teacher_id] / 60
+        # A teacher specialised in the group's level is preferred
+        if self.groups[group_id].level.lower() in self.specializations[teacher_id]:
+            cost -= 1
+        return cost
+
+    def slot_cost(self, teacher_id, days, start):
+        """Penalises opening a new working day or leaving a gap, averaged over the lesson days"""
+        end = start + self.duration
+        cost = 0
+        for day in days:
+            busy = self.teacher_busy[teacher_id][day]
+            if not busy:
+                cost += self.NEW_DAY_COST
+            elif not (busy >> end) & 1 and not (start and (busy >> (start - 1)) & 1):
+                cost += self.GAP_COST
+        return cost / len(days)
+
+    def cost(self, group_id, teacher_id, days, start):
+        return self.teacher_cost(group_id, teacher_id) + self.slot_cost(teacher_id, days, start)
+
+    def best_slot(self, group_id):
+        """Returns (cost, teacher_id, days, start) of the cheapest free slot, or None"""
+        best = None
+        students = self.student_occupancy(group_id)
+        for teacher_id in self.eligible[group_id]:
+            base = self.teacher_cost(group_id, teacher_id)
+            # Slot costs are never negative, so this teacher cannot do better
+            if best is not None and base >= best[0]:
+                continue
+            busy = [teacher | student for teacher, student in zip(self.teacher_busy[teacher_id], students)]
+            for days, start in self.slots:
+                mask = self.masks[start]
+                if not any(busy[day] & mask for day in days):
+                    cost = base + self.slot_cost(teacher_id, days, start)
+                    if best is None or cost < best[0]:
+                        best = (cost, teacher_id, days, start)
+        return best
+
+    def place(self, group_id, teacher_id, days, start):
+        mask = self.mask(start, start + self.duration)
+        for day in days:
+            self.teacher_busy[teacher_id][day] |= mask
+            for student_id in self.members[group_id]:
+                self.student_busy[student_id][day] |= mask
+        self.load[teacher_id] += self.duration * len(days)
+        self.placements[group_id] = (teacher_id, days, start)
+
+    def remove(self, group_id):
+        teacher_id, days, start = self.placements.pop(group_id)
+        # Placements never overlap other bits, so clearing them is exact
+        mask = ~self.mask(start, start + self.duration)
+        for day in days:
+            self.teacher_busy[teacher_id][day] &= mask
+            for student_id in self.members[group_id]:
+                self.student_busy[student_id][day] &= mask
+        self.load[teacher_id] -= self.duration * len(days)
+        return teacher_id, days, start
+
+    def repair(self, group_id, deadline):
+        """Tries to fit an unplaced group by moving one placed group out of its way"""
+        teachers = set(self.eligible[group_id])
+        members = set(self.members[group_id])
+        for other_id in list(self.placements):
+            if self.placements[other_id][0] not in teachers and members.isdisjoint(self.members[other_id]):
+                continue
+            if monotonic() > deadline:
+                return False
+            previous = self.remove(other_id)
+            slot = self.best_slot(group_id)
+            if slot:
+                self.place(group_id, *slot[1:])
+                moved = self.best_slot(other_id)
+                if moved:
+                    self.place(other_id, *moved[1:])
+                    return True
+                self.remove(group_id)
+            self.place(other_id, *previous)
+        return False
+
+    def improve(self, deadline, passes=20):
+        """Moves placed groups to cheaper slots until nothing improves"""
+        for _ in range(passes):
+            improved = False
+            for group_id in list(self.placements):
+                if monotonic() > deadline:
+                    return
+                current = self.remove(group_id)
+                best = self.best_slot(group_id)
+                if best and best[0] < self.cost(group_id, *current) - 1e-9:
+                    self.place(group_id, *best[1:])
+                    improved = True
+                else:
+                    self.place(group_id, *current)
+            if not improved:
+                return
+
+    def solve(self, time_limit=None):
+        """
+        Returns {'proposals': [...], 'unplaced': [...], 'elapsed': seconds}.
+        Each proposal carries the teacher_id, group_id, days, start_time and
+        end_time that ScheduleManager.create_schedules() accepts.
+        """
+        started = monotonic()
+        deadline = started + (time_limit or self.TIME_LIMIT)
+        order = sorted(
+            self.groups,
+            key=lambda group_id: (len(self.eligible[group_id]), -len(self.members[group_id]), group_id)
+        )
+        unplaced = []
+        for group_id in order:
+            best = self.best_slot(group_id)
+            if best:
+                self.place(group_id, *best[1:])
+            else:
+                unplaced.append(group_id)
+
+        unplaced = [
+            group_id for group_id in unplaced
+            if monotonic() > deadline or not self.repair(group_id, deadline)
+        ]
+        self.improve(deadline)
+
+        proposals = []
+        for group_id, (teacher_id, days, start) in sorted(
+            self.placements.items(), key=lambda item: (item[1][0], item[1][1], item[1][2])
+        ):
+            end = start + self.duration
+            proposals.append({
+                'type': 'group',
+                'group_id': group_id,
+                'group_name': self.groups[group_id].name,
+                'teacher_id': teacher_id,
+                'teacher_name': self.teachers[teacher_id].name,
+                'days': days,
+                'start_time': f'{start // 60:02d}:{start % 60:02d}',
+                'end_time': f'{end // 60:02d}:{end % 60:02d}',
+            })
+        return {
+            'proposals': proposals,
+            'unplaced': [
+                {
+                    'group_id': group_id,
+                    'group_name': self.groups[group_id].name,
+                    'reason': (
+                        "No free slot for the group's teachers and students" if self.eligible[group_id]
+                        else f"No teacher teaches {self.groups[group_id].language}"
+                    ),
+                }
+                for group_id in sorted(unplaced)
+            ],
+            'elapsed': monotonic() - started,
+        }
 
 
 class GroupManager:
+    @staticmethod
+    def rosters(group_ids):
+        """
+        Loads the students of many groups in one query, returns
+        {group_id: [student, ...]} in the order they joined, with only the
+        columns session listings show.
+        """
+        rosters = {group_id: [] for group_id in group_ids}
+        for membership in GroupStudent.objects.filter(group_id__in=rosters).select_related('student').only(
+            'group_id', 'student__id', 'student__name', 'student__email', 'student__level', 'student__phone_number'
+        ).order_by('id'):
+            rosters[membership.group_id].append(membership.student)
+        return rosters
+
     @staticmethod
     def create_group(name, teacher, max_capacity):
         group = Group(
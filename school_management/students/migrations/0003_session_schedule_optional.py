@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0002_alter_attendancelog_unique_together'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='session',
+            name='schedule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sessions', to='students.schedule'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_ledgers(apps, schema_editor):
+    # Seed every student's ledger with their current balance so the
+    # snapshot columns equal the ledger totals from the start
+    Student = apps.get_model('students', 'Student')
+    LessonLedger = apps.get_model('students', 'LessonLedger')
+    students = Student.objects.values_list('id', 'lessons_remaining', 'subscription_balance')
+    LessonLedger.objects.bulk_create([
+        LessonLedger(
+            student_id=student_id,
+            entry_type='correction',
+            lessons=lessons_remaining,
+            amount=subscription_balance,
+            lessons_after=lessons_remaining,
+            balance_after=subscription_balance,
+            note='Opening balance'
+        )
+        for student_id, lessons_remaining, subscription_balance in students.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0004_scanreceipt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LessonLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_type', models.CharField(choices=[('purchase', 'Purchase'), ('deduction', 'Deduction'), ('refund', 'Refund'), ('correction', 'Correction')], max_length=20)),
+                ('lessons', models.IntegerField(help_text='Change in lessons remaining')),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Change in subscription balance', max_digits=10)),
+                ('lessons_after', models.IntegerField()),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attendance', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='students.attendancelog')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='students.student')),
+                ('subscription', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='students.studentsubscription')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['student', 'created_at'], name='students_le_student_b05e80_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledgers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:12
+
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import migrations, models
+
+
+def price_subscriptions(apps, schema_editor):
+    # Fix each subscription's lesson price from its plan and hand the
+    # student's remaining lessons to their latest subscription
+    StudentSubscription = apps.get_model('students', 'StudentSubscription')
+    subscriptions = StudentSubscription.objects.select_related('subscription_plan', 'student').order_by(
+        'student_id', '-start_date', '-id'
+    )
+    updated = []
+    last_student_id = None
+    for subscription in subscriptions.iterator():
+        plan = subscription.subscription_plan
+        if plan.number_of_lessons > 0:
+            subscription.lesson_price = (plan.price / plan.number_of_lessons).quantize(
+                Decimal('0.01'), ROUND_HALF_UP
+            )
+        if subscription.student_id != last_student_id:
+            subscription.lessons_left = max(
+                min(subscription.student.lessons_remaining, plan.number_of_lessons), 0
+            )
+            last_student_id = subscription.student_id
+        updated.append(subscription)
+    StudentSubscription.objects.bulk_update(updated, ['lesson_price', 'lessons_left'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0005_lessonledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentsubscription',
+            name='lesson_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='studentsubscription',
+            name='lessons_left',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='studentsubscription',
+            index=models.Index(fields=['student', 'start_date'], name='students_st_student_5a5a8f_idx'),
+        ),
+        migrations.RunPython(price_subscriptions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:14
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations
+from django.db.models import Count, F
+
+CHARGED_STATUSES = ('present', 'late')
+
+
+def refund_attendance(apps, log, note):
+    # The way BalanceService.refund_attendances refunds a log, which cannot
+    # run here as it uses the current models
+    Student = apps.get_model('students', 'Student')
+    StudentSubscription = apps.get_model('students', 'StudentSubscription')
+    LessonLedger = apps.get_model('students', 'LessonLedger')
+    last = LessonLedger.objects.filter(
+        attendance_id=log.id,
+        entry_type__in=['deduction', 'refund']
+    ).order_by('-id').first()
+    if last is not None and last.entry_type == 'refund':
+        return
+
+    student = Student.objects.select_for_update().get(id=log.student_id)
+    subscription_id = None
+    if last is not None:
+        amount = -last.amount
+        subscription_id = last.subscription_id
+    elif student.lessons_remaining > 0:
+        amount = (student.subscription_balance / student.lessons_remaining).quantize(
+            Decimal('0.01'), ROUND_HALF_UP
+        )
+    else:
+        amount = Decimal('0.00')
+
+    Student.objects.filter(id=student.id).update(
+        lessons_remaining=F('lessons_remaining') + 1,
+        subscription_balance=F('subscription_balance') + amount
+    )
+    if subscription_id:
+        StudentSubscription.objects.filter(id=subscription_id).update(lessons_left=F('lessons_left') + 1)
+    LessonLedger.objects.create(
+        student_id=student.id,
+        entry_type='refund',
+        lessons=1,
+        amount=amount,
+        lessons_after=student.lessons_remaining + 1,
+        balance_after=student.subscription_balance + amount,
+        subscription_id=subscription_id,
+        note=note
+    )
+
+
+def merge_duplicate_sessions(apps, schema_editor):
+    # Keep the occurrence with the most attendance per (schedule, date) and
+    # move what the duplicates recorded onto it before they are removed. A
+    # student charged on both keeps one charge and the other is refunded
+    Session = apps.get_model('students', 'Session')
+    AttendanceLog = apps.get_model('students', 'AttendanceLog')
+    Performance = apps.get_model('students', 'Performance')
+    duplicates = Session.objects.filter(schedule__isnull=False).values('schedule_id', 'date').annotate(
+        total=Count('id')
+    ).filter(total__gt=1)
+    for duplicate in duplicates.iterator():
+        sessions = list(Session.objects.filter(
+            schedule_id=duplicate['schedule_id'],
+            date=duplicate['date']
+        ).annotate(logs=Count('attendancelog')).order_by('-logs', 'id'))
+        keep, others = sessions[0], [session.id for session in sessions[1:]]
+        marked = {log.student_id: log for log in AttendanceLog.objects.filter(session=keep)}
+        for log in AttendanceLog.objects.filter(session_id__in=others).order_by('id'):
+            kept = marked.get(log.student_id)
+            if kept is not None and log.status in CHARGED_STATUSES:
+                if kept.status in CHARGED_STATUSES:
+                    refund_attendance(apps, log, f'Refunded duplicate attendance on {duplicate["date"]}')
+                    continue
+                # The charged log is the one worth keeping
+                kept.delete()
+                kept = None
+            if kept is None:
+                marked[log.student_id] = log
+                log.session = keep
+                log.save(update_fields=['session'])
+        Performance.objects.filter(session_id__in=others).update(session=keep)
+        Session.objects.filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0006_subscription_lesson_price'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_sessions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:31
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0007_merge_duplicate_sessions'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='session',
+            unique_together={('schedule', 'date')},
+        ),
+    ]
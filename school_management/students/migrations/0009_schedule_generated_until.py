@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0008_unique_session_per_schedule_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedule',
+            name='generated_until',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
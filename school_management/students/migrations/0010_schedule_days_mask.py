@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:18
+
+from django.db import migrations, models
+
+
+def backfill_days_mask(apps, schema_editor):
+    # Historical models have no custom save, so compute the mask here
+    Schedule = apps.get_model('students', 'Schedule')
+    schedules = []
+    for schedule in Schedule.objects.only('id', 'days').iterator():
+        schedule.days_mask = sum(
+            1 << day for day in set(schedule.days or []) if isinstance(day, int) and 0 <= day <= 6
+        )
+        schedules.append(schedule)
+    Schedule.objects.bulk_update(schedules, ['days_mask'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0009_schedule_generated_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedule',
+            name='days_mask',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['teacher', 'days_mask'], name='students_sc_teacher_78fd28_idx'),
+        ),
+        migrations.RunPython(backfill_days_mask, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0011_closure'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['status', 'date'], name='students_se_status_dd6644_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0012_session_status_date_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendancelog',
+            index=models.Index(fields=['-scanned_at', '-id'], name='students_at_scanned_67c46f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['date', 'start_time', 'id'], name='students_se_date_6a087f_idx'),
+        ),
+    ]
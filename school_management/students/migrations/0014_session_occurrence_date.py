@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:06
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_occurrence_dates(apps, schema_editor):
+    # Sessions were keyed on their date until now, so it is their occurrence
+    # date and unique (schedule, date) kept one session per occurrence
+    Session = apps.get_model('students', 'Session')
+    Session.objects.filter(schedule__isnull=False).update(occurrence_date=F('date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0013_list_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='session',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='occurrence_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_occurrence_dates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='session',
+            unique_together={('schedule', 'occurrence_date')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0014_session_occurrence_date'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='session',
+            name='status',
+            field=models.CharField(choices=[('SCHEDULED', 'Scheduled'), ('IN_PROGRESS', 'In Progress'), ('COMPLETED', 'Completed'), ('CANCELLED', 'Cancelled')], default='SCHEDULED', max_length=20),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:17
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0015_session_status_default_scheduled'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='schedule',
+            name='students_sc_teacher_78fd28_idx',
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models.functions import RowNumber
 from django.conf import settings
 import uuid
 import json
@@ -12,6 +13,25 @@ from decimal import Decimal
 
 
 # Create your models here.
+class StudentQuerySet(models.QuerySet):
+    def with_latest_subscription(self):
+        """
+        Prefetches each student's latest subscription and its plan into
+        latest_subscriptions, a list of at most one, with one extra query
+        ranking the subscriptions per student by start date.
+        """
+        latest = StudentSubscription.objects.select_related('subscription_plan').alias(
+            rank=models.Window(
+                expression=RowNumber(),
+                partition_by=[models.F('student_id')],
+                order_by=[models.F('start_date').desc(), models.F('id').desc()]
+            )
+        ).filter(rank=1)
+        return self.prefetch_related(
+            models.Prefetch('studentsubscription_set', queryset=latest, to_attr='latest_subscriptions')
+        )
+
+
 class Student(models.Model):
     # STUDENT_TYPE_CHOICES = [
     #     ('GROUP', 'Group Student'),
@@ -31,9 +51,37 @@ class Student(models.Model):
     # student_type = models.CharField(max_length=10, choices=STUDENT_TYPE_CHOICES)
     level = models.CharField(max_length=50, blank=True)
 
+    objects = StudentQuerySet.as_manager()
+
+    # Cached snapshot of the lesson ledger, maintained by BalanceService
+    SNAPSHOT_FIELDS = ('lessons_remaining', 'subscription_balance')
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # A full save of an existing student must not overwrite the balance
+        # snapshot with stale in-memory values
+        if self.pk and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.SNAPSHOT_FIELDS
+            ]
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Students created with a balance open their ledger with it
+            if adding and (self.lessons_remaining or self.subscription_balance):
+                LessonLedger.objects.create(
+                    student=self,
+                    entry_type='correction',
+                    lessons=self.lessons_remaining,
+                    amount=self.subscription_balance,
+                    lessons_after=self.lessons_remaining,
+                    balance_after=self.subscription_balance,
+                    note='Opening balance'
+                )
+
     def generate_qr_code(self):
         try:
             # Create minimal QR code data - just the student ID
@@ -68,12 +116,45 @@ class Student(models.Model):
             raise
 
 
-class Session(models.Model):
-    schedule = models.ForeignKey('Schedule', on_delete=models.CASCADE, related_name='sessions')
+class CachedLessonMixin:
+    """Refreshes the cached availability and calendar feeds of a lesson's owners when it changes"""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_owners = instance.owners()
+        return instance
+
+    def owners(self):
+        return tuple(self.__dict__.get(field) for field in ('teacher_id', 'group_id', 'student_id'))
+
+    def invalidate_caches(self):
+        from .manager import AvailabilityManager, CalendarManager
+
+        # The owners as loaded too, so moving a lesson also refreshes its previous owners
+        teacher_ids, group_ids, student_ids = zip(self.owners(), getattr(self, 'loaded_owners', (None, None, None)))
+        AvailabilityManager.invalidate([teacher_id for teacher_id in teacher_ids if teacher_id is not None])
+        CalendarManager.invalidate(teacher_ids, group_ids, student_ids)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.invalidate_caches()
+        self.loaded_owners = self.owners()
+
+    def delete(self, *args, **kwargs):
+        self.invalidate_caches()
+        return super().delete(*args, **kwargs)
+
+
+class Session(CachedLessonMixin, models.Model):
+    schedule = models.ForeignKey('Schedule', on_delete=models.CASCADE, related_name='sessions', null=True, blank=True)
     teacher = models.ForeignKey('Teacher', on_delete=models.CASCADE)
     student = models.ForeignKey('Student', on_delete=models.CASCADE, null=True, blank=True)
     group = models.ForeignKey('Group', on_delete=models.CASCADE, null=True, blank=True)
     date = models.DateField()
+    # The date the schedule placed this occurrence on, like an iCalendar
+    # RECURRENCE-ID it stays put when the session is moved to another date
+    occurrence_date = models.DateField(null=True, blank=True)
     start_time = models.TimeField()
     end_time = models.TimeField()
     type = models.CharField(max_length=10, choices=[('GROUP', 'Group'), ('PRIVATE', 'Private')])
@@ -86,60 +167,46 @@ class Session(models.Model):
             ('COMPLETED', 'Completed'),
             ('CANCELLED', 'Cancelled')
         ],
-        default='IN_PROGRESS'
+        # The status sweeper opens sessions when their time window starts
+        default='SCHEDULED'
     )
 
+    class Meta:
+        # One session per schedule occurrence, generated sessions rely on it
+        # to insert with ignore_conflicts
+        unique_together = ('schedule', 'occurrence_date')
+        indexes = [
+            # The status sweeper and scan routing filter on status and date
+            models.Index(fields=['status', 'date']),
+            # Session listings page in date and start time order
+            models.Index(fields=['date', 'start_time', 'id']),
+        ]
+
     def mark_attendance(self, student_id):
         """Mark attendance for a student and process payment"""
-        from .models import AttendanceLog, Student
-        
+        from .services import BalanceService
+
         try:
-            student = Student.objects.get(id=student_id)
-            
-            # Check for existing attendance
-            existing_attendance = AttendanceLog.objects.filter(
-                student=student,
-                session=self
-            ).first()
-            
-            if existing_attendance:
-                raise ValidationError("Attendance already marked for this student in this session")
-            
-            # Create attendance log
-            attendance = AttendanceLog.objects.create(
-                student=student,
-                session=self,
-                valid=True,
-                status='present'
-            )
-            
-            # Calculate cost per lesson using current balance and remaining lessons
-            if student.lessons_remaining > 0:
-                cost_per_lesson = Decimal(str(student.subscription_balance / student.lessons_remaining))
-            else:
-                # If no lessons remaining, use the last known cost per lesson or a default value
-                cost_per_lesson = Decimal('0.00')
-            
-            # Deduct lesson and balance
-            student.lessons_remaining = models.F('lessons_remaining') - 1
-            student.subscription_balance = models.F('subscription_balance') - cost_per_lesson
-            student.save()
-            
-            # Refresh from db to get updated values
-            student.refresh_from_db()
-            
-            return attendance
-            
+            with transaction.atomic():
+                attendance = AttendanceLog.objects.create(
+                    student_id=student_id,
+                    session=self,
+                    valid=True,
+                    status='present'
+                )
+                # Refusing the deduction rolls the log back with it
+                BalanceService.deduct_lesson(student_id, attendance)
+                return attendance
         except Student.DoesNotExist:
-            raise ValueError("Student not found")
-        except Exception as e:
-            raise ValidationError(str(e))
+            raise ValidationError("Student not found")
+        except IntegrityError:
+            raise ValidationError("Attendance already marked for this student in this session")
 
 
 class AttendanceLog(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     session = models.ForeignKey(Session, on_delete=models.CASCADE)
-    scanned_at = models.DateTimeField(auto_now_add=True)
+    scanned_at = models.DateTimeField(default=timezone.now)
     valid = models.BooleanField(default=True)
     status = models.CharField(
         max_length=20,
@@ -153,11 +220,31 @@ class AttendanceLog(models.Model):
 
     class Meta:
         unique_together = ('student', 'session')
+        # Attendance listings page newest scans first
+        indexes = [models.Index(fields=['-scanned_at', '-id'])]
 
     def __str__(self):
         return f"{self.student.name} - {self.session} - {self.status}"
 
 
+class ScanReceipt(models.Model):
+    STATUS_CHOICES = [
+        ('accepted', 'Accepted'),
+        ('rejected', 'Rejected'),
+    ]
+
+    idempotency_key = models.CharField(max_length=100, unique=True)
+    student = models.ForeignKey(Student, on_delete=models.SET_NULL, null=True, blank=True)
+    attendance = models.ForeignKey(AttendanceLog, on_delete=models.SET_NULL, null=True, blank=True)
+    scanned_at = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    message = models.CharField(max_length=255, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.idempotency_key} - {self.status}"
+
+
 class Performance(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     session = models.ForeignKey(Session, on_delete=models.CASCADE)
@@ -186,11 +273,70 @@ class StudentSubscription(models.Model):
     subscription_plan = models.ForeignKey(SubscriptionPlan, on_delete=models.CASCADE)
     start_date = models.DateField()
     end_date = models.DateField(blank=True, null=True)
+    # Fixed at purchase, lessons are consumed from the oldest subscription first
+    lesson_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    lessons_left = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['student', 'start_date'])]
 
     def __str__(self):
         return f"{self.student.name} - {self.subscription_plan.name}"
 
 
+class LessonLedger(models.Model):
+    ENTRY_TYPE_CHOICES = [
+        ('purchase', 'Purchase'),
+        ('deduction', 'Deduction'),
+        ('refund', 'Refund'),
+        ('correction', 'Correction'),
+    ]
+
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='ledger_entries')
+    entry_type = models.CharField(max_length=20, choices=ENTRY_TYPE_CHOICES)
+    lessons = models.IntegerField(help_text='Change in lessons remaining')
+    amount = models.DecimalField(max_digits=10, decimal_places=2, help_text='Change in subscription balance')
+    lessons_after = models.IntegerField()
+    balance_after = models.DecimalField(max_digits=10, decimal_places=2)
+    attendance = models.ForeignKey(AttendanceLog, on_delete=models.SET_NULL, null=True, blank=True)
+    subscription = models.ForeignKey(StudentSubscription, on_delete=models.SET_NULL, null=True, blank=True)
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['student', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.student.name} - {self.entry_type} {self.lessons:+d}"
+
+
+class TeacherQuerySet(models.QuerySet):
+    def with_private_students(self):
+        """
+        Prefetches one private session per student each teacher has taught
+        into private_sessions, with the student columns TeacherSerializer
+        shows, so memory grows with the students and not the session
+        history. The first session is looked up per row of the teachers
+        being listed, so the cost follows the page and not the table.
+        """
+        first_session = Session.objects.filter(
+            teacher_id=models.OuterRef('teacher_id'),
+            student_id=models.OuterRef('student_id'),
+            type='PRIVATE'
+        ).order_by('id').values('id')[:1]
+        return self.prefetch_related(
+            models.Prefetch(
+                'session_set',
+                queryset=Session.objects.filter(
+                    type='PRIVATE', student__isnull=False, id=models.Subquery(first_session)
+                ).select_related('student').only(
+                    'teacher_id', 'student__id', 'student__name', 'student__email', 'student__level'
+                ).order_by('student__name', 'student_id'),
+                to_attr='private_sessions'
+            )
+        )
+
+
 class Teacher(models.Model):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
@@ -201,6 +347,8 @@ class Teacher(models.Model):
     phone_number = models.CharField(max_length=20, blank=True)
     specializations = models.JSONField(default=list)
 
+    objects = TeacherQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
@@ -209,6 +357,24 @@ class Teacher(models.Model):
         return Group.objects.filter(teacher=self)
 
 
+class GroupQuerySet(models.QuerySet):
+    def with_roster(self):
+        """
+        Annotates student_count and prefetches the memberships with the
+        student columns GroupSerializer shows, two queries for any number of
+        groups. Filter on memberships with id__in, a join on students here
+        would be counted as well.
+        """
+        return self.annotate(student_count=models.Count('students')).prefetch_related(
+            models.Prefetch(
+                'students',
+                queryset=GroupStudent.objects.select_related('student').only(
+                    'group_id', 'student__id', 'student__name', 'student__email', 'student__level'
+                ).order_by('id')
+            )
+        )
+
+
 class Group(models.Model):
     LANGUAGE_CHOICES = [
         ('English', 'English'),
@@ -249,6 +415,8 @@ class Group(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = GroupQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} - {self.language} ({self.level})"
 
@@ -256,7 +424,53 @@ class Group(models.Model):
         return self.students.count() >= self.max_capacity
 
 
-class Schedule(models.Model):
+class ClosureQuerySet(models.QuerySet):
+    def overlapping(self, start_date, end_date):
+        return self.filter(start_date__lte=end_date, end_date__gte=start_date)
+
+
+class Closure(models.Model):
+    """Dates without lessons, such as holidays, for the whole school or one teacher or group"""
+    start_date = models.DateField()
+    end_date = models.DateField()
+    teacher = models.ForeignKey('Teacher', on_delete=models.CASCADE, null=True, blank=True, related_name='closures')
+    group = models.ForeignKey('Group', on_delete=models.CASCADE, null=True, blank=True, related_name='closures')
+    reason = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ClosureQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['start_date', 'end_date'])]
+
+    def __str__(self):
+        return f"{self.reason or 'Closure'} ({self.start_date} - {self.end_date})"
+
+    def clean(self):
+        if self.start_date and self.end_date and self.start_date > self.end_date:
+            raise ValidationError("A closure cannot end before it starts")
+
+    def covers(self, lesson, date):
+        """Whether the closure cancels the lesson (a schedule or session) on date"""
+        return (
+            self.start_date <= date <= self.end_date
+            and self.teacher_id in (None, lesson.teacher_id)
+            and self.group_id in (None, lesson.group_id)
+        )
+
+
+class ScheduleQuerySet(models.QuerySet):
+    def on_days(self, days):
+        """Schedules running on any of the given weekdays, filtered on days_mask"""
+        # A plain integer AND, evaluated on both backends without decoding
+        # JSON. No index can answer it, it is checked on each row left by
+        # the other filters, such as the teacher's through its foreign key
+        return self.alias(
+            matching_days=models.F('days_mask').bitand(Schedule.mask_for(days))
+        ).filter(matching_days__gt=0)
+
+
+class Schedule(CachedLessonMixin, models.Model):
     teacher = models.ForeignKey('Teacher', on_delete=models.CASCADE)
     student = models.ForeignKey('Student', on_delete=models.CASCADE, null=True, blank=True)
     group = models.ForeignKey('Group', on_delete=models.CASCADE, null=True, blank=True)
@@ -266,6 +480,27 @@ class Schedule(models.Model):
     is_recurring = models.BooleanField(default=True)
     payment = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last date sessions have been generated up to
+    generated_until = models.DateField(null=True, blank=True)
+    # Bit n is set when the schedule runs on weekday n, kept in sync with days
+    days_mask = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    objects = ScheduleQuerySet.as_manager()
+
+    @staticmethod
+    def mask_for(days):
+        mask = 0
+        for day in days:
+            if isinstance(day, int) and 0 <= day <= 6:
+                mask |= 1 << day
+        return mask
+
+    def save(self, *args, **kwargs):
+        self.days_mask = self.mask_for(self.days)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'days' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'days_mask'}
+        super().save(*args, **kwargs)
 
     def clean(self):
         if not self.student and not self.group:
@@ -290,6 +525,8 @@ class Schedule(models.Model):
 
     def generate_next_session(self, target_date=None):
         """Generate the next session based on this schedule"""
+        from .manager import SessionStatusManager
+
         try:
             if target_date is None:
                 target_date = timezone.now().date()
@@ -301,7 +538,7 @@ class Schedule(models.Model):
             # Check if a session already exists for this date
             existing_session = Session.objects.filter(
                 schedule=self,
-                date=target_date
+                occurrence_date=target_date
             ).first()
             
             if existing_session:
@@ -314,11 +551,13 @@ class Schedule(models.Model):
                 student=self.student,
                 group=self.group,
                 date=target_date,
+                occurrence_date=target_date,
                 start_time=self.start_time,
                 end_time=self.end_time,
                 type='GROUP' if self.group else 'PRIVATE',
                 payment=self.payment,
-                status='IN_PROGRESS'  # Ensure new sessions are active by default
+                # Only active while its time window is open, the sweeper moves it on
+                status=SessionStatusManager.status_at(target_date, self.start_time, self.end_time)
             )
             
             return session
@@ -337,4 +576,17 @@ class GroupStudent(models.Model):
         unique_together = ['student', 'group']
 
     def __str__(self):
-        return f"{self.student.name} in {self.group.name}"
\ No newline at end of file
+        return f"{self.student.name} in {self.group.name}"
+
+    def save(self, *args, **kwargs):
+        from .manager import CalendarManager
+
+        super().save(*args, **kwargs)
+        # The student's feed now includes or drops the group's lessons
+        CalendarManager.invalidate(student_ids=[self.student_id])
+
+    def delete(self, *args, **kwargs):
+        from .manager import CalendarManager
+
+        CalendarManager.invalidate(student_ids=[self.student_id])
+        return super().delete(*args, **kwargs)
\ No newline at end of file
@@ -1,5 +1,8 @@
 from rest_framework import serializers
+from django.db import models
 from .models import *
+from .manager import GroupManager
+from .services import BalanceService
 from django.utils import timezone
 from datetime import datetime
 from django.contrib.auth import get_user_model
@@ -9,41 +12,77 @@ from io import BytesIO
 import base64
 
 
-class StudentSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Lets GET requests pick the fields of the response with ?fields=id,name.
+    The Meta.expandable fields, nested or costly to compute, become opt-in
+    as soon as ?expand= is given, naming the ones to include. Fields left
+    out are never computed. Nested serializers always render in full.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        root = self.parent is None or (isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None)
+        if not root or request is None or request.method not in ('GET', 'HEAD'):
+            return fields
+
+        def names(param):
+            return {name.strip() for name in request.query_params.get(param, '').split(',') if name.strip()}
+
+        wanted = names('fields') or set(fields)
+        if 'expand' in request.query_params:
+            wanted = (wanted - set(getattr(self.Meta, 'expandable', ()))) | names('expand')
+        return {name: field for name, field in fields.items() if name in wanted}
+
+
+class StudentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     total_lessons = serializers.SerializerMethodField()
     subscription_info = serializers.SerializerMethodField()
 
     class Meta:
         model = Student
         fields = '__all__'
+        expandable = ('qr_code', 'total_lessons', 'subscription_info')
+
+    def get_latest_subscription(self, obj):
+        # Listings prefetch it with Student.objects.with_latest_subscription()
+        if not hasattr(obj, 'latest_subscriptions'):
+            obj.latest_subscriptions = list(
+                StudentSubscription.objects.select_related('subscription_plan').filter(
+                    student=obj
+                ).order_by('-start_date', '-id')[:1]
+            )
+        return obj.latest_subscriptions[0] if obj.latest_subscriptions else None
 
     def get_total_lessons(self, obj):
-        try:
-            subscription = StudentSubscription.objects.filter(student=obj).latest('start_date')
-            return subscription.subscription_plan.number_of_lessons
-        except StudentSubscription.DoesNotExist:
-            return 0
-        except Exception as e:
-            print(f"Error getting total lessons for student {obj.id}: {str(e)}")
-            return 0
+        subscription = self.get_latest_subscription(obj)
+        return subscription.subscription_plan.number_of_lessons if subscription else 0
 
     def get_subscription_info(self, obj):
-        try:
-            subscription = StudentSubscription.objects.filter(student=obj).latest('start_date')
-            return {
-                'plan_name': subscription.subscription_plan.name,
-                'total_lessons': subscription.subscription_plan.number_of_lessons,
-                'start_date': subscription.start_date,
-                'end_date': subscription.end_date,
-            }
-        except StudentSubscription.DoesNotExist:
-            return None
-        except Exception as e:
-            print(f"Error getting subscription info for student {obj.id}: {str(e)}")
+        subscription = self.get_latest_subscription(obj)
+        if subscription is None:
             return None
+        return {
+            'plan_name': subscription.subscription_plan.name,
+            'total_lessons': subscription.subscription_plan.number_of_lessons,
+            'start_date': subscription.start_date,
+            'end_date': subscription.end_date,
+        }
 
+    def update(self, instance, validated_data):
+        # Balance edits are recorded in the ledger instead of overwriting the snapshot
+        lessons_remaining = validated_data.pop('lessons_remaining', None)
+        subscription_balance = validated_data.pop('subscription_balance', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if lessons_remaining is not None or subscription_balance is not None:
+                instance.lessons_remaining, instance.subscription_balance = BalanceService.set_balance(
+                    instance.id, lessons_remaining, subscription_balance, note='Edited by admin'
+                )
+        return instance
 
-class GroupSerializer(serializers.ModelSerializer):
+
+class GroupSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     current_capacity = serializers.SerializerMethodField()
     students = serializers.SerializerMethodField()
 
@@ -51,8 +90,12 @@ class GroupSerializer(serializers.ModelSerializer):
         model = Group
         fields = ['id', 'name', 'description', 'language', 'level', 'max_capacity', 
                  'status', 'current_capacity', 'created_at', 'updated_at', 'students']
+        expandable = ('students',)
 
     def get_current_capacity(self, obj):
+        # Listings annotate it with Group.objects.with_roster()
+        if hasattr(obj, 'student_count'):
+            return obj.student_count
         return obj.students.count()
 
     def get_students(self, obj):
@@ -64,24 +107,47 @@ class GroupSerializer(serializers.ModelSerializer):
         } for student in obj.students.all()]
 
 
-class TeacherSerializer(serializers.ModelSerializer):
+class StudentSummarySerializer(serializers.ModelSerializer):
+    """The student columns shown in nested listings, without balances or subscriptions"""
+    class Meta:
+        model = Student
+        fields = ['id', 'name', 'email', 'level']
+
+
+class TeacherSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     teaching_groups = GroupSerializer(many=True, read_only=True)
     private_students = serializers.SerializerMethodField()
 
     class Meta:
         model = Teacher
         fields = ['id', 'name', 'email', 'phone_number', 'specializations', 'teaching_groups', 'private_students']
+        expandable = ('teaching_groups', 'private_students')
 
     def get_private_students(self, obj):
-        # Get students from private sessions
-        private_students = Student.objects.filter(
-            session__teacher=obj,
-            session__type='PRIVATE'
-        ).distinct()
-        return StudentSerializer(private_students, many=True).data
-
-
-class SessionSerializer(serializers.ModelSerializer):
+        # Listings prefetch them with Teacher.objects.with_private_students()
+        if hasattr(obj, 'private_sessions'):
+            private_students = [session.student for session in obj.private_sessions]
+        else:
+            private_students = Student.objects.filter(
+                session__teacher=obj,
+                session__type='PRIVATE'
+            ).distinct().only('id', 'name', 'email', 'level').order_by('name', 'id')
+        return StudentSummarySerializer(private_students, many=True).data
+
+
+class SessionListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        sessions = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        # Every roster on the page in one query, unless the caller built them
+        rosters = self.context.get('rosters')
+        if rosters is None and self.child.ROSTER_FIELDS & set(self.child.fields):
+            rosters = GroupManager.rosters({session.group_id for session in sessions if session.group_id})
+        # Shared by the sessions of this listing through the context
+        self.context.update({'rosters': rosters or {}, 'group_summaries': {}, 'teacher_summaries': {}})
+        return [self.child.to_representation(session) for session in sessions]
+
+
+class SessionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     time = serializers.SerializerMethodField()
     className = serializers.SerializerMethodField()
     students = serializers.SerializerMethodField()
@@ -91,12 +157,95 @@ class SessionSerializer(serializers.ModelSerializer):
     student_details = serializers.SerializerMethodField()
     teacher_details = serializers.SerializerMethodField()
     subject = serializers.SerializerMethodField()
+    virtual = serializers.SerializerMethodField()
 
     class Meta:
         model = Session
         fields = ['id', 'time', 'className', 'students', 'type', 'isOnline', 'proficiencyLevel', 
                  'date', 'start_time', 'end_time', 'status', 'teacher', 'student', 'group',
-                 'student_details', 'teacher_details', 'subject']
+                 'student_details', 'teacher_details', 'subject', 'virtual']
+        expandable = ('students', 'student_details', 'teacher_details')
+        list_serializer_class = SessionListSerializer
+
+    # Fields that read the group roster or the related rows
+    ROSTER_FIELDS = {'students', 'proficiencyLevel', 'student_details'}
+    STUDENT_FIELDS = ROSTER_FIELDS | {'className'}
+    TEACHER_FIELDS = {'teacher_details', 'subject'}
+
+    def to_representation(self, obj):
+        fields = self.fields
+        if len(fields) < len(self.Meta.fields):
+            # Sparse fieldsets render field by field, computing only what was asked for
+            data = super().to_representation(obj)
+            if 'id' in data:
+                data['id'] = self.session_id(obj)
+            return data
+
+        # Every field at once, through the same get_ methods but without
+        # walking the fields, and with the roster summarized once
+        names, level, student_details = self.participants(obj)
+        return {
+            'id': self.session_id(obj),
+            'time': self.get_time(obj),
+            'className': self.get_className(obj),
+            'students': names,
+            'type': self.get_type(obj),
+            'isOnline': self.get_isOnline(obj),
+            'proficiencyLevel': level,
+            'date': fields['date'].to_representation(obj.date),
+            'start_time': fields['start_time'].to_representation(obj.start_time),
+            'end_time': fields['end_time'].to_representation(obj.end_time),
+            'status': obj.status,
+            'teacher': obj.teacher_id,
+            'student': obj.student_id,
+            'group': obj.group_id,
+            'student_details': student_details,
+            'teacher_details': self.get_teacher_details(obj),
+            'subject': self.get_subject(obj),
+            'virtual': self.get_virtual(obj),
+        }
+
+    def session_id(self, obj):
+        # Detail routes accept the virtual id and persist the occurrence on first write
+        if obj.pk is None and hasattr(obj, 'virtual_id'):
+            return obj.virtual_id
+        return obj.pk
+
+    def roster(self, obj):
+        """The students of the session's group in the order they joined"""
+        rosters = self.context.setdefault('rosters', {})
+        if obj.group_id not in rosters:
+            prefetched = getattr(obj.group, '_prefetched_objects_cache', {}).get('students')
+            if prefetched is not None:
+                rosters[obj.group_id] = [
+                    membership.student for membership in sorted(prefetched, key=lambda membership: membership.id)
+                ]
+            else:
+                rosters.update(GroupManager.rosters([obj.group_id]))
+        return rosters[obj.group_id]
+
+    def group_summary(self, obj):
+        """(names, first student's level, details) of the group's roster, shared by its sessions"""
+        summaries = self.context.setdefault('group_summaries', {})
+        if obj.group_id not in summaries:
+            students = self.roster(obj)
+            summaries[obj.group_id] = (
+                [student.name for student in students],
+                students[0].level if students else None,
+                [self.student_summary(student) for student in students]
+            )
+        return summaries[obj.group_id]
+
+    def participants(self, obj):
+        """(names, level, details) of the session's student or group roster"""
+        if obj.type == 'PRIVATE' and obj.student:
+            return [obj.student.name], obj.student.level, self.student_summary(obj.student)
+        elif obj.type == 'GROUP' and obj.group:
+            return self.group_summary(obj)
+        return [], None, None
+
+    def get_virtual(self, obj):
+        return obj.pk is None
 
     def get_time(self, obj):
         return obj.start_time.strftime('%I:%M %p')
@@ -109,11 +258,7 @@ class SessionSerializer(serializers.ModelSerializer):
         return "Unassigned Lesson"
 
     def get_students(self, obj):
-        if obj.type == 'PRIVATE' and obj.student:
-            return [obj.student.name]
-        elif obj.type == 'GROUP' and obj.group:
-            return [gs.student.name for gs in obj.group.students.all()]
-        return []
+        return self.participants(obj)[0]
 
     def get_type(self, obj):
         return 'Private' if obj.type == 'PRIVATE' else 'Group'
@@ -122,42 +267,36 @@ class SessionSerializer(serializers.ModelSerializer):
         return getattr(obj, 'is_online', False)
 
     def get_proficiencyLevel(self, obj):
-        if obj.type == 'PRIVATE' and obj.student:
-            return obj.student.level
-        elif obj.type == 'GROUP' and obj.group and obj.group.students.exists():
-            # Get level from the first student in the group
-            first_student = obj.group.students.first().student
-            return first_student.level if first_student else None
-        return None
+        # A group's level is that of its first student
+        return self.participants(obj)[1]
 
     def get_student_details(self, obj):
-        if obj.type == 'PRIVATE' and obj.student:
-            return {
-                'id': obj.student.id,
-                'name': obj.student.name,
-                'level': obj.student.level,
-                'email': obj.student.email,
-                'phone_number': obj.student.phone_number
+        return self.participants(obj)[2]
+
+    def student_summary(self, student):
+        return {
+            'id': student.id,
+            'name': student.name,
+            'level': student.level,
+            'email': student.email,
+            'phone_number': student.phone_number
+        }
+
+    def teacher_summary(self, teacher):
+        summaries = self.context.setdefault('teacher_summaries', {})
+        if teacher.id not in summaries:
+            summaries[teacher.id] = {
+                'id': teacher.id,
+                'name': teacher.name,
+                'email': teacher.email,
+                'phone_number': teacher.phone_number,
+                'specializations': teacher.specializations
             }
-        elif obj.type == 'GROUP' and obj.group:
-            return [{
-                'id': student.student.id,
-                'name': student.student.name,
-                'level': student.student.level,
-                'email': student.student.email,
-                'phone_number': student.student.phone_number
-            } for student in obj.group.students.all()]
-        return None
+        return summaries[teacher.id]
 
     def get_teacher_details(self, obj):
         if obj.teacher:
-            return {
-                'id': obj.teacher.id,
-                'name': obj.teacher.name,
-                'email': obj.teacher.email,
-                'phone_number': obj.teacher.phone_number,
-                'specializations': obj.teacher.specializations
-            }
+            return self.teacher_summary(obj.teacher)
         return None
 
     def get_subject(self, obj):
@@ -195,10 +334,39 @@ class SubscriptionPlanSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class LessonLedgerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LessonLedger
+        fields = ['id', 'entry_type', 'lessons', 'amount', 'lessons_after', 'balance_after',
+                  'attendance', 'subscription', 'note', 'created_at']
+
+
+class ClosureSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Closure
+        fields = ['id', 'start_date', 'end_date', 'teacher', 'group', 'reason', 'created_at']
+
+    def validate(self, data):
+        if data['start_date'] > data['end_date']:
+            raise serializers.ValidationError("A closure cannot end before it starts")
+        return data
+
+
 class StudentSubscriptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = StudentSubscription
         fields = '__all__'
+        read_only_fields = ['lesson_price', 'lessons_left']
+
+    def create(self, validated_data):
+        # Buying a subscription credits its lessons to the student
+        subscription, _ = BalanceService.purchase(
+            validated_data['student'].id,
+            validated_data['subscription_plan'],
+            validated_data['start_date'],
+            validated_data.get('end_date')
+        )
+        return subscription
 
 
 class GroupCreateSerializer(serializers.ModelSerializer):
@@ -272,26 +440,22 @@ class CreateStudentWithUserSerializer(serializers.Serializer):
         except SubscriptionPlan.DoesNotExist:
             raise serializers.ValidationError({"subscription_plan": "Invalid subscription plan selected"})
 
-        # Create student with subscription details
+        # Create student, the balance is credited from the subscription below
         student = Student.objects.create(
             user=user,
             name=validated_data['name'],
             email=validated_data['email'],
             phone_number=validated_data.get('phone_number', ''),
-            level=validated_data.get('level', ''),
-            lessons_remaining=plan.number_of_lessons,  # Set initial lessons from plan
-            subscription_balance=plan.price  # Set initial balance from plan
+            level=validated_data.get('level', '')
         )
 
         # Set the qr_code to the student ID
         student.qr_code = str(student.id)
         student.save()
 
-        # Create subscription record
-        StudentSubscription.objects.create(
-            student=student,
-            subscription_plan=plan,
-            start_date=timezone.now().date()
+        # Create subscription record, crediting lessons and balance from the plan
+        _, (student.lessons_remaining, student.subscription_balance) = BalanceService.purchase(
+            student.id, plan, timezone.now().date()
         )
 
         return student
@@ -1,8 +1,13 @@
 from django.core.exceptions import ValidationError
-from .manager import ScheduleManager, GroupManager
+from django.db import connection, transaction, IntegrityError
+from django.db.models import BooleanField, Case, Exists, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from .manager import AvailabilityManager, CalendarManager, ScheduleManager, GroupManager
 from .models import *
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
 
 
 class ClassManagementService:
@@ -85,3 +90,925 @@ class ClassManagementService:
         ClassManagementService.create_session_from_schedule(schedule, next_session_date)
 
         return schedule
+
+
+class BalanceService:
+    """
+    Every change to a student's lessons and balance goes through here. Each
+    change is appended to LessonLedger and the Student columns are updated as
+    a snapshot of the ledger in the same transaction.
+    """
+
+    CENT = Decimal('0.01')
+
+    @staticmethod
+    def lock(student_ids):
+        """Lock student rows and return {id: (lessons_remaining, subscription_balance)}"""
+        return {
+            student_id: (lessons_remaining, subscription_balance)
+            for student_id, lessons_remaining, subscription_balance in Student.objects.select_for_update().filter(
+                id__in=student_ids
+            ).values_list('id', 'lessons_remaining', 'subscription_balance')
+        }
+
+    @staticmethod
+    def open_subscriptions(student_ids):
+        """Return {student_id: [[subscription_id, lesson_price, lessons_left], ...]}, oldest first"""
+        subscriptions = {}
+        for subscription_id, student_id, lesson_price, lessons_left in StudentSubscription.objects.filter(
+            student_id__in=student_ids,
+            lessons_left__gt=0
+        ).order_by('start_date', 'id').values_list('id', 'student_id', 'lesson_price', 'lessons_left'):
+            subscriptions.setdefault(student_id, []).append([subscription_id, lesson_price, lessons_left])
+        return subscriptions
+
+    @staticmethod
+    def deduct(charges, snapshot=None):
+        """
+        Deducts one lesson per charge and appends a ledger entry for each.
+
+        charges is a list of (student_id, attendance) pairs, attendance may be
+        None. snapshot holds the (lessons_remaining, subscription_balance) of
+        every charged student as returned by lock() in the caller's
+        transaction, and is loaded when not given. Lessons are taken from the
+        student's oldest subscription first at the price fixed when it was
+        bought. Lessons not covered by a subscription cost the balance divided
+        by the remaining lessons, and the student's last lesson takes
+        whatever balance is left so rounding never strands a few cents.
+        Students without enough lessons or balance are refused as a whole.
+        Returns {student_id: (lessons_remaining, subscription_balance)} for
+        the students that were charged.
+        """
+        if not charges:
+            return {}
+
+        with transaction.atomic(savepoint=False):
+            if snapshot is None:
+                snapshot = BalanceService.lock({student_id for student_id, _ in charges})
+
+            attendances = {}
+            for student_id, attendance in charges:
+                attendances.setdefault(student_id, []).append(attendance)
+            subscriptions = BalanceService.open_subscriptions(
+                [student_id for student_id in attendances if student_id in snapshot]
+            )
+
+            deltas = {}
+            consumed = {}
+            entries = []
+            for student_id, student_attendances in attendances.items():
+                if student_id not in snapshot:
+                    continue
+                lessons_remaining, balance = snapshot[student_id]
+                if lessons_remaining < len(student_attendances) or balance <= 0:
+                    continue
+
+                queue = subscriptions.get(student_id, [])
+                charged = Decimal('0')
+                for attendance in student_attendances:
+                    subscription_id = None
+                    if queue:
+                        subscription_id, price, _ = queue[0]
+                        queue[0][2] -= 1
+                        if not queue[0][2]:
+                            queue.pop(0)
+                        consumed[subscription_id] = consumed.get(subscription_id, 0) - 1
+                    else:
+                        price = (balance / lessons_remaining).quantize(BalanceService.CENT, ROUND_HALF_UP)
+                    if lessons_remaining == 1:
+                        price = balance
+                    price = max(min(price, balance), Decimal('0.00'))
+
+                    lessons_remaining -= 1
+                    balance -= price
+                    charged += price
+                    entries.append(LessonLedger(
+                        student_id=student_id,
+                        entry_type='deduction',
+                        lessons=-1,
+                        amount=-price,
+                        lessons_after=lessons_remaining,
+                        balance_after=balance,
+                        attendance=attendance,
+                        subscription_id=subscription_id
+                    ))
+                deltas[student_id] = (-len(student_attendances), -charged)
+
+            return BalanceService._apply(deltas, entries, consumed)
+
+    @staticmethod
+    def deduct_lesson(student_id, attendance=None):
+        """
+        Deducts a single lesson and returns (lessons_remaining,
+        subscription_balance). Raises Student.DoesNotExist or ValidationError
+        when the deduction is refused.
+        """
+        student_id = int(student_id)
+        # Refusals are raised outside the block so they do not doom the
+        # caller's transaction
+        with transaction.atomic(savepoint=False):
+            snapshot = BalanceService.lock([student_id])
+            if student_id not in snapshot:
+                refusal = Student.DoesNotExist("Student not found")
+            elif snapshot[student_id][0] <= 0:
+                refusal = ValidationError("No remaining lessons in subscription")
+            elif snapshot[student_id][1] <= 0:
+                refusal = ValidationError("Insufficient subscription balance")
+            else:
+                return BalanceService.deduct([(student_id, attendance)], snapshot)[student_id]
+        raise refusal
+
+    @staticmethod
+    def refund_lesson(student_id, attendance=None):
+        """
+        Gives one lesson back and returns (lessons_remaining,
+        subscription_balance). When the attendance was charged through the
+        ledger the exact amount is refunded to the subscription it came from,
+        otherwise the lesson is valued at the current balance divided by the
+        remaining lessons.
+        """
+        student_id = int(student_id)
+        with transaction.atomic(savepoint=False):
+            snapshot = BalanceService.lock([student_id])
+            if student_id in snapshot:
+                lessons_remaining, balance = snapshot[student_id]
+                deduction = None
+                if attendance is not None:
+                    deduction = LessonLedger.objects.filter(
+                        attendance=attendance,
+                        entry_type='deduction'
+                    ).order_by('-id').first()
+                subscription_id = None
+                if deduction is not None:
+                    amount = -deduction.amount
+                    subscription_id = deduction.subscription_id
+                elif lessons_remaining > 0:
+                    amount = (balance / lessons_remaining).quantize(BalanceService.CENT, ROUND_HALF_UP)
+                else:
+                    amount = Decimal('0.00')
+
+                entry = LessonLedger(
+                    student_id=student_id,
+                    entry_type='refund',
+                    lessons=1,
+                    amount=amount,
+                    lessons_after=lessons_remaining + 1,
+                    balance_after=balance + amount,
+                    attendance=attendance,
+                    subscription_id=subscription_id
+                )
+                return BalanceService._apply(
+                    {student_id: (1, amount)}, [entry], {subscription_id: 1} if subscription_id else None
+                )[student_id]
+        raise Student.DoesNotExist("Student not found")
+
+    @staticmethod
+    def refund_attendances(attendances, note=''):
+        """
+        Refunds the lessons charged for many attendances at once, each the
+        way refund_lesson would, with one lock, one ledger read and one
+        _apply. Attendances whose deduction was already refunded are
+        skipped. Returns {student_id: (lessons_remaining, subscription_balance)}.
+        """
+        if not attendances:
+            return {}
+
+        with transaction.atomic(savepoint=False):
+            snapshot = BalanceService.lock({attendance.student_id for attendance in attendances})
+            # The deduction each attendance still owes, None once it was refunded
+            charged = {}
+            for entry in LessonLedger.objects.filter(
+                attendance__in=attendances,
+                entry_type__in=['deduction', 'refund']
+            ).order_by('id'):
+                charged[entry.attendance_id] = entry if entry.entry_type == 'deduction' else None
+
+            deltas = {}
+            entries = []
+            consumed = {}
+            for attendance in attendances:
+                student_id = attendance.student_id
+                if student_id not in snapshot or (attendance.id in charged and charged[attendance.id] is None):
+                    continue
+                lessons_remaining, balance = snapshot[student_id]
+                deduction = charged.get(attendance.id)
+                subscription_id = None
+                if deduction is not None:
+                    amount = -deduction.amount
+                    subscription_id = deduction.subscription_id
+                elif lessons_remaining > 0:
+                    amount = (balance / lessons_remaining).quantize(BalanceService.CENT, ROUND_HALF_UP)
+                else:
+                    amount = Decimal('0.00')
+
+                snapshot[student_id] = (lessons_remaining + 1, balance + amount)
+                lessons, total = deltas.get(student_id, (0, Decimal('0.00')))
+                deltas[student_id] = (lessons + 1, total + amount)
+                if subscription_id:
+                    consumed[subscription_id] = consumed.get(subscription_id, 0) + 1
+                entries.append(LessonLedger(
+                    student_id=student_id,
+                    entry_type='refund',
+                    lessons=1,
+                    amount=amount,
+                    lessons_after=lessons_remaining + 1,
+                    balance_after=balance + amount,
+                    attendance=attendance,
+                    subscription_id=subscription_id,
+                    note=note
+                ))
+            return BalanceService._apply(deltas, entries, consumed)
+
+    @staticmethod
+    def purchase(student_id, plan, start_date, end_date=None):
+        """
+        Creates a subscription for a plan, fixing its per-lesson price, and
+        credits its lessons and price to the student. Returns the subscription
+        and the new (lessons_remaining, subscription_balance).
+        """
+        student_id = int(student_id)
+        lesson_price = Decimal('0.00')
+        if plan.number_of_lessons > 0:
+            lesson_price = (plan.price / plan.number_of_lessons).quantize(BalanceService.CENT, ROUND_HALF_UP)
+
+        with transaction.atomic(savepoint=False):
+            snapshot = BalanceService.lock([student_id])
+            if student_id in snapshot:
+                subscription = StudentSubscription.objects.create(
+                    student_id=student_id,
+                    subscription_plan=plan,
+                    start_date=start_date,
+                    end_date=end_date,
+                    lesson_price=lesson_price,
+                    lessons_left=plan.number_of_lessons
+                )
+                balances = BalanceService.credit(
+                    student_id, plan.number_of_lessons, plan.price, 'purchase',
+                    subscription=subscription, snapshot=snapshot
+                )
+                return subscription, balances
+        raise Student.DoesNotExist("Student not found")
+
+    @staticmethod
+    def credit(student_id, lessons, amount, entry_type, attendance=None, subscription=None,
+               note='', snapshot=None):
+        """
+        Applies a signed change in lessons and balance as a single ledger
+        entry, for purchases, refunds and corrections. Returns
+        (lessons_remaining, subscription_balance).
+        """
+        student_id = int(student_id)
+        amount = Decimal(str(amount)).quantize(BalanceService.CENT)
+        with transaction.atomic(savepoint=False):
+            if snapshot is None:
+                snapshot = BalanceService.lock([student_id])
+            if student_id in snapshot:
+                lessons_remaining, balance = snapshot[student_id]
+                entry = LessonLedger(
+                    student_id=student_id,
+                    entry_type=entry_type,
+                    lessons=lessons,
+                    amount=amount,
+                    lessons_after=lessons_remaining + lessons,
+                    balance_after=balance + amount,
+                    attendance=attendance,
+                    subscription=subscription,
+                    note=note
+                )
+                return BalanceService._apply({student_id: (lessons, amount)}, [entry])[student_id]
+        raise Student.DoesNotExist("Student not found")
+
+    @staticmethod
+    def set_balance(student_id, lessons_remaining=None, subscription_balance=None, note=''):
+        """
+        Records a manual edit of the snapshot as a correction entry. Returns
+        (lessons_remaining, subscription_balance).
+        """
+        student_id = int(student_id)
+        with transaction.atomic(savepoint=False):
+            snapshot = BalanceService.lock([student_id])
+            if student_id in snapshot:
+                current_lessons, current_balance = snapshot[student_id]
+                lessons = 0 if lessons_remaining is None else lessons_remaining - current_lessons
+                amount = Decimal('0') if subscription_balance is None else Decimal(str(subscription_balance)) - current_balance
+                if not lessons and not amount:
+                    return snapshot[student_id]
+                return BalanceService.credit(
+                    student_id, lessons, amount, 'correction', note=note, snapshot=snapshot
+                )
+        raise Student.DoesNotExist("Student not found")
+
+    @staticmethod
+    def ledger_totals(student_ids):
+        """Return {student_id: (lessons, amount)} summed over the ledger"""
+        return {
+            row['student_id']: (row['lessons'], row['amount'])
+            for row in LessonLedger.objects.filter(student_id__in=student_ids).values('student_id').annotate(
+                lessons=Sum('lessons'),
+                amount=Sum('amount')
+            ).order_by()
+        }
+
+    @staticmethod
+    def attendance_drift(student_ids):
+        """
+        Cross-checks the ledger against the attendance logs of the given
+        students. Every charged log should net one deduction and every other
+        log none. Logs scanned before the student's first ledger entry were
+        settled in the opening balance and are not checked. Returns the
+        drifted logs annotated with expected and net, their ledger lessons.
+        """
+        opened = LessonLedger.objects.filter(student=OuterRef('student')).order_by('id').values('created_at')[:1]
+        return list(AttendanceLog.objects.filter(
+            student_id__in=student_ids,
+            scanned_at__gte=Subquery(opened)
+        ).annotate(
+            expected=Case(
+                When(status__in=AttendanceService.CHARGED_STATUSES, then=Value(-1)),
+                default=Value(0)
+            ),
+            net=Coalesce(Sum('lessonledger__lessons'), 0)
+        ).exclude(net=F('expected')).order_by('student_id', 'id'))
+
+    @staticmethod
+    def settle_attendances(attendances):
+        """
+        Settles logs returned by attendance_drift, refunding the lessons
+        overcharged and deducting the ones never charged. Students without
+        enough lessons are refused as deduct would. Returns the number of
+        logs settled.
+        """
+        overcharged = [attendance for attendance in attendances if attendance.net < attendance.expected]
+        uncharged = [attendance for attendance in attendances if attendance.net > attendance.expected]
+        with transaction.atomic(savepoint=False):
+            refunded = BalanceService.refund_attendances(overcharged, note='Reconciled with attendance')
+            deducted = BalanceService.deduct([(attendance.student_id, attendance) for attendance in uncharged])
+        return (
+            sum(1 for attendance in overcharged if attendance.student_id in refunded)
+            + sum(1 for attendance in uncharged if attendance.student_id in deducted)
+        )
+
+    @staticmethod
+    def rebuild(student_ids):
+        """
+        Resets the snapshot of the given students to their ledger totals.
+        Returns {student_id: (lessons_remaining, subscription_balance)} for
+        the students whose snapshot had drifted.
+        """
+        with transaction.atomic(savepoint=False):
+            snapshot = BalanceService.lock(student_ids)
+            totals = BalanceService.ledger_totals(list(snapshot))
+            deltas = {}
+            for student_id, (lessons_remaining, balance) in snapshot.items():
+                lessons, amount = totals.get(student_id, (0, Decimal('0.00')))
+                if (lessons, amount) != (lessons_remaining, balance):
+                    deltas[student_id] = (lessons - lessons_remaining, amount - balance)
+            return BalanceService._apply(deltas, [])
+
+    @staticmethod
+    def _apply(deltas, entries, consumed=None):
+        """
+        Writes the snapshot deltas with one UPDATE ... RETURNING, moves the
+        subscription lesson counters by the consumed deltas with one blind
+        UPDATE and appends the ledger entries with one bulk insert.
+        """
+        if not deltas:
+            return {}
+
+        with connection.cursor() as cursor:
+            table = connection.ops.quote_name(Student._meta.db_table)
+            placeholders = ', '.join(['%s'] * len(deltas))
+            cases = ' '.join(['WHEN %s THEN %s'] * len(deltas))
+            lesson_params = [value for student_id, (lessons, _) in deltas.items() for value in (student_id, lessons)]
+            amount_params = [value for student_id, (_, amount) in deltas.items() for value in (student_id, amount)]
+            cursor.execute(
+                f"UPDATE {table} "
+                f"SET lessons_remaining = lessons_remaining + CASE id {cases} END, "
+                f"subscription_balance = subscription_balance + CASE id {cases} END "
+                f"WHERE id IN ({placeholders}) "
+                f"RETURNING id, lessons_remaining, subscription_balance",
+                lesson_params + amount_params + list(deltas)
+            )
+            balances = {
+                student_id: (lessons_remaining, Decimal(str(subscription_balance)).quantize(BalanceService.CENT))
+                for student_id, lessons_remaining, subscription_balance in cursor.fetchall()
+            }
+
+            if consumed:
+                table = connection.ops.quote_name(StudentSubscription._meta.db_table)
+                placeholders = ', '.join(['%s'] * len(consumed))
+                cases = ' '.join(['WHEN %s THEN %s'] * len(consumed))
+                cursor.execute(
+                    f"UPDATE {table} SET lessons_left = lessons_left + CASE id {cases} END "
+                    f"WHERE id IN ({placeholders})",
+                    [value for item in consumed.items() for value in item] + list(consumed)
+                )
+
+        LessonLedger.objects.bulk_create(entries)
+        return balances
+
+
+class ClosureService:
+    @staticmethod
+    def create_closure(start_date, end_date, teacher=None, group=None, reason=''):
+        """
+        Creates a closure, cancels the sessions it covers with one UPDATE and
+        refunds every lesson already charged for them in bulk. Returns
+        (closure, {'cancelled': sessions, 'refunded': lessons}).
+        """
+        closure = Closure(start_date=start_date, end_date=end_date, teacher=teacher, group=group, reason=reason)
+        closure.full_clean()
+
+        with transaction.atomic():
+            closure.save()
+            sessions = Session.objects.filter(date__range=(start_date, end_date)).exclude(status='CANCELLED')
+            if teacher is not None:
+                sessions = sessions.filter(teacher=teacher)
+            if group is not None:
+                sessions = sessions.filter(group=group)
+            affected = list(sessions.select_for_update().values_list('id', 'teacher_id'))
+            session_ids = [session_id for session_id, _ in affected]
+            Session.objects.filter(id__in=session_ids).update(status='CANCELLED')
+
+            attendances = list(AttendanceLog.objects.select_for_update().filter(
+                session_id__in=session_ids,
+                status__in=AttendanceService.CHARGED_STATUSES
+            ))
+            BalanceService.refund_attendances(attendances, note=f'Refunded for {closure}')
+            # No longer charged, so a later status change cannot refund twice
+            AttendanceLog.objects.filter(id__in=[attendance.id for attendance in attendances]).update(
+                status='absent',
+                valid=False
+            )
+            ClosureService.invalidate(closure, {teacher_id for _, teacher_id in affected})
+
+        return closure, {'cancelled': len(session_ids), 'refunded': len(attendances)}
+
+    @staticmethod
+    def delete_closure(closure):
+        """Deletes a closure, its cancelled sessions stay cancelled"""
+        with transaction.atomic():
+            closure.delete()
+            ClosureService.invalidate(closure)
+
+    @staticmethod
+    def invalidate(closure, teacher_ids=()):
+        """Refresh cached availability of the teachers the closure touches and every calendar feed"""
+        teacher_ids = set(teacher_ids)
+        if closure.teacher_id is not None:
+            teacher_ids.add(closure.teacher_id)
+        elif closure.group_id is not None:
+            teacher_ids.update(Schedule.objects.filter(group_id=closure.group_id).values_list('teacher_id', flat=True))
+        else:
+            teacher_ids.update(Teacher.objects.values_list('id', flat=True))
+        AvailabilityManager.invalidate(teacher_ids)
+        CalendarManager.invalidate_all()
+
+
+class AttendanceService:
+    @staticmethod
+    def scan(student_id, user=None, today=None, create_session=True):
+        """
+        Records a QR scan for a student in a single transaction.
+
+        The student row is locked first. A second query then checks for an
+        attendance log today and routes the scan to today's active session,
+        so it sees whatever a concurrent scan committed before the lock was
+        granted. The attendance log is then inserted and one lesson is
+        deducted from the locked snapshot and the oldest open subscription,
+        with its ledger entry, so a steady-state scan costs a fixed seven
+        queries. Raises ValidationError when the scan is rejected.
+        """
+        if today is None:
+            today = timezone.now().date()
+
+        try:
+            with transaction.atomic():
+                student = AttendanceService._lock_student(student_id)
+
+                if student.lessons_remaining <= 0:
+                    raise ValidationError("No remaining lessons in subscription")
+                if student.subscription_balance <= 0:
+                    raise ValidationError("Insufficient subscription balance")
+
+                attended_today, session_id = AttendanceService._scan_routing(student.id, today)
+                if attended_today:
+                    raise ValidationError("Attendance already marked for today")
+
+                if session_id is None:
+                    if not create_session:
+                        raise ValidationError(
+                            "No active session found for today. "
+                            "Please ensure a session is activated before scanning."
+                        )
+                    session_id = AttendanceService._open_private_session(student, user, today).id
+
+                attendance = AttendanceLog.objects.create(
+                    student_id=student.id,
+                    session_id=session_id,
+                    valid=True,
+                    status='present'
+                )
+
+                snapshot = {student.id: (student.lessons_remaining, student.subscription_balance)}
+                lessons_remaining, subscription_balance = BalanceService.deduct(
+                    [(student.id, attendance)], snapshot
+                )[student.id]
+        except IntegrityError:
+            raise ValidationError("Attendance already marked for this student in this session")
+
+        return {
+            'student': student,
+            'attendance': attendance,
+            'session_id': session_id,
+            'lessons_remaining': lessons_remaining,
+            'subscription_balance': subscription_balance,
+        }
+
+    CHARGED_STATUSES = ('present', 'late')
+
+    @staticmethod
+    def mark_roster(session, entries):
+        """
+        Records attendance for a whole session roster at once.
+
+        entries is a list of {'student_id': ..., 'status': ...} dicts. All
+        students are locked and checked for membership in one query, and
+        their logs for the session are read after the lock in a second one,
+        so a concurrent submit is seen. Every attendance log is written with
+        one bulk_create and all deductions for present/late students are
+        applied with one UPDATE and one ledger insert, so the query count
+        does not grow with the roster. Returns one outcome dict per entry.
+        Raises ValidationError when a path that does not lock the student
+        marked one of them concurrently.
+        """
+        if session.status == 'CANCELLED':
+            raise ValidationError("Cannot take attendance for a cancelled session")
+
+        valid_statuses = dict(AttendanceLog._meta.get_field('status').choices)
+        outcomes = {}
+        requested = {}
+        for index, entry in enumerate(entries):
+            student_id = entry.get('student_id')
+            attendance_status = entry.get('status', 'present')
+            try:
+                student_id = int(student_id)
+            except (TypeError, ValueError):
+                outcomes[index] = {'student_id': student_id, 'status': 'error', 'message': 'Invalid student id'}
+                continue
+            if attendance_status not in valid_statuses:
+                outcomes[index] = {'student_id': student_id, 'status': 'error',
+                                   'message': f'Invalid attendance status {attendance_status}'}
+            elif student_id in requested.values():
+                outcomes[index] = {'student_id': student_id, 'status': 'error',
+                                   'message': 'Duplicate entry for student'}
+            else:
+                requested[index] = student_id
+
+        with transaction.atomic():
+            if session.group_id:
+                in_session = Exists(GroupStudent.objects.filter(group_id=session.group_id, student=OuterRef('pk')))
+            else:
+                in_session = Q(pk=session.student_id)
+            students = {
+                student.id: student
+                for student in Student.objects.select_for_update().only(
+                    'id', 'name', 'lessons_remaining', 'subscription_balance'
+                ).annotate(
+                    in_session=ExpressionWrapper(in_session, output_field=BooleanField())
+                ).filter(id__in=requested.values())
+            }
+            # A subquery of the locking SELECT would read the snapshot from before the lock
+            already_marked = set(AttendanceLog.objects.filter(
+                session_id=session.id, student_id__in=students
+            ).values_list('student_id', flat=True))
+
+            logs = []
+            charged = []
+            for index, student_id in requested.items():
+                attendance_status = entries[index].get('status', 'present')
+                student = students.get(student_id)
+                if student is None:
+                    message = 'Student not found'
+                elif not student.in_session:
+                    message = 'Student is not part of this session'
+                elif student_id in already_marked:
+                    message = 'Attendance already marked for this student in this session'
+                elif attendance_status in AttendanceService.CHARGED_STATUSES and student.lessons_remaining <= 0:
+                    message = 'No remaining lessons in subscription'
+                elif attendance_status in AttendanceService.CHARGED_STATUSES and student.subscription_balance <= 0:
+                    message = 'Insufficient subscription balance'
+                else:
+                    message = None
+
+                if message:
+                    outcomes[index] = {'student_id': student_id, 'status': 'error', 'message': message}
+                    continue
+
+                logs.append(AttendanceLog(
+                    student_id=student_id,
+                    session_id=session.id,
+                    valid=True,
+                    status=attendance_status
+                ))
+                if attendance_status in AttendanceService.CHARGED_STATUSES:
+                    charged.append((student_id, logs[-1]))
+                outcomes[index] = {
+                    'student_id': student_id,
+                    'status': 'success',
+                    'message': f'Marked {student.name} as {attendance_status}',
+                    'attendance_status': attendance_status,
+                    'lessons_remaining': student.lessons_remaining,
+                    'subscription_balance': student.subscription_balance,
+                }
+
+            try:
+                AttendanceLog.objects.bulk_create(logs)
+            except IntegrityError:
+                raise ValidationError("Attendance was marked concurrently for this session, please retry")
+            balances = BalanceService.deduct(charged, {
+                student.id: (student.lessons_remaining, student.subscription_balance)
+                for student in students.values()
+            })
+
+        for outcome in outcomes.values():
+            if outcome['student_id'] in balances and outcome['status'] == 'success':
+                outcome['lessons_remaining'], outcome['subscription_balance'] = balances[outcome['student_id']]
+
+        return [outcomes[index] for index in sorted(outcomes)]
+
+    @staticmethod
+    def set_status(attendance, new_status):
+        """
+        Changes the status of an attendance log and charges or refunds the
+        lesson when it moves between attended and not attended. The caller
+        must hold the log row lock inside a transaction. Returns
+        (lessons_remaining, subscription_balance), or None when the balance
+        did not change.
+        """
+        if new_status not in dict(AttendanceLog._meta.get_field('status').choices):
+            raise ValidationError(f"Invalid attendance status {new_status}")
+
+        was_charged = attendance.status in AttendanceService.CHARGED_STATUSES
+        now_charged = new_status in AttendanceService.CHARGED_STATUSES
+        balances = None
+        if now_charged and not was_charged:
+            balances = BalanceService.deduct_lesson(attendance.student_id, attendance)
+        elif was_charged and not now_charged:
+            balances = BalanceService.refund_lesson(attendance.student_id, attendance)
+
+        attendance.status = new_status
+        attendance.save(update_fields=['status'])
+        return balances
+
+    SYNC_BATCH_LIMIT = 500
+    SCAN_GRACE_PERIOD = timedelta(minutes=15)
+
+    @staticmethod
+    def sync_batch(scans):
+        """
+        Applies a batch of queued offline scans in one transaction.
+
+        Each scan carries an idempotency_key, a student_id and the client's
+        scanned_at timestamp. Keys that were synced before replay their stored
+        outcome instead of being applied twice. New scans are applied in
+        timestamp order and routed to the session that was running when the
+        scan happened. Every lookup is done once for the whole batch, so the
+        query count does not grow with the batch size.
+        """
+        if len(scans) > AttendanceService.SYNC_BATCH_LIMIT:
+            raise ValidationError(f"A batch can hold at most {AttendanceService.SYNC_BATCH_LIMIT} scans")
+
+        outcomes = {}
+        first_index = {}
+        pending = []
+        for index, scan in enumerate(scans):
+            key = str(scan.get('idempotency_key') or '').strip()
+            scanned_at = scan.get('scanned_at')
+            try:
+                scanned_at = parse_datetime(scanned_at) if isinstance(scanned_at, str) else None
+            except ValueError:
+                # Well formed but impossible, such as the 30th of February
+                scanned_at = None
+            try:
+                student_id = int(scan.get('student_id'))
+            except (TypeError, ValueError):
+                student_id = None
+
+            if not key or len(key) > 100:
+                message = 'A valid idempotency_key is required'
+            elif student_id is None:
+                message = 'A valid student_id is required'
+            elif scanned_at is None:
+                message = 'scanned_at must be an ISO 8601 timestamp'
+            else:
+                message = None
+
+            if message:
+                outcomes[index] = AttendanceService._sync_outcome(key, 'invalid', message)
+            elif key in first_index:
+                # Resolved from the first occurrence once the batch is applied
+                continue
+            else:
+                if timezone.is_naive(scanned_at):
+                    scanned_at = timezone.make_aware(scanned_at)
+                first_index[key] = index
+                pending.append((index, key, student_id, scanned_at))
+
+        with transaction.atomic():
+            receipts = {
+                receipt['idempotency_key']: receipt
+                for receipt in ScanReceipt.objects.filter(
+                    idempotency_key__in=first_index
+                ).values('idempotency_key', 'status', 'message', 'attendance_id', 'attendance__session_id')
+            }
+            new_scans = []
+            for index, key, student_id, scanned_at in pending:
+                receipt = receipts.get(key)
+                if receipt:
+                    outcomes[index] = AttendanceService._sync_outcome(
+                        key, receipt['status'], receipt['message'],
+                        receipt['attendance__session_id'], receipt['attendance_id'], replayed=True
+                    )
+                else:
+                    new_scans.append((index, key, student_id, scanned_at))
+            new_scans.sort(key=lambda scan: scan[3])
+
+            student_ids = {student_id for _, _, student_id, _ in new_scans}
+            local_times = {index: timezone.localtime(scanned_at).replace(tzinfo=None)
+                           for index, _, _, scanned_at in new_scans}
+            dates = {local_time.date() for local_time in local_times.values()}
+
+            students = {
+                student.id: student
+                for student in Student.objects.select_for_update().only(
+                    'id', 'lessons_remaining', 'subscription_balance'
+                ).filter(id__in=student_ids)
+            }
+            groups = {}
+            for student_id, group_id in GroupStudent.objects.filter(
+                student_id__in=student_ids
+            ).values_list('student_id', 'group_id'):
+                groups.setdefault(student_id, set()).add(group_id)
+            sessions = {}
+            for session in Session.objects.filter(date__in=dates).exclude(status='CANCELLED').filter(
+                Q(student_id__in=student_ids) |
+                Q(group_id__in={group_id for ids in groups.values() for group_id in ids})
+            ).only('id', 'date', 'start_time', 'end_time', 'student_id', 'group_id'):
+                sessions.setdefault(session.date, []).append(session)
+            attended = set(AttendanceLog.objects.filter(
+                student_id__in=student_ids,
+                session__date__in=dates
+            ).values_list('student_id', 'session__date'))
+
+            lessons_left = {student.id: student.lessons_remaining for student in students.values()}
+            charges = []
+            accepted = []
+            logs = []
+            new_receipts = []
+            for index, key, student_id, scanned_at in new_scans:
+                student = students.get(student_id)
+                local_time = local_times[index]
+                session = None
+                if student is None:
+                    message = 'Student not found'
+                else:
+                    session = AttendanceService._route_scan(
+                        sessions.get(local_time.date(), []), student_id, groups.get(student_id, ()), local_time
+                    )
+                    if session is None:
+                        message = 'No session was running at the time of the scan'
+                    elif (student_id, session.date) in attended:
+                        message = 'Attendance already marked for that day'
+                    elif lessons_left[student_id] <= 0:
+                        message = 'No remaining lessons in subscription'
+                    elif student.subscription_balance <= 0:
+                        message = 'Insufficient subscription balance'
+                    else:
+                        message = None
+
+                if message:
+                    new_receipts.append(ScanReceipt(
+                        idempotency_key=key,
+                        student=student,
+                        scanned_at=scanned_at,
+                        status='rejected',
+                        message=message
+                    ))
+                    outcomes[index] = AttendanceService._sync_outcome(key, 'rejected', message)
+                    continue
+
+                attended.add((student_id, session.date))
+                lessons_left[student_id] -= 1
+                attendance = AttendanceLog(
+                    student_id=student_id,
+                    session_id=session.id,
+                    scanned_at=scanned_at,
+                    valid=True,
+                    status='present'
+                )
+                logs.append(attendance)
+                charges.append((student_id, attendance))
+                new_receipts.append(ScanReceipt(
+                    idempotency_key=key,
+                    student=student,
+                    attendance=attendance,
+                    scanned_at=scanned_at,
+                    status='accepted'
+                ))
+                accepted.append((index, key, session.id, attendance))
+
+            AttendanceLog.objects.bulk_create(logs)
+            BalanceService.deduct(charges, {
+                student.id: (student.lessons_remaining, student.subscription_balance)
+                for student in students.values()
+            })
+            ScanReceipt.objects.bulk_create(new_receipts)
+
+        for index, key, session_id, attendance in accepted:
+            outcomes[index] = AttendanceService._sync_outcome(key, 'accepted', '', session_id, attendance.id)
+        for index, scan in enumerate(scans):
+            if index not in outcomes:
+                key = str(scan.get('idempotency_key')).strip()
+                outcomes[index] = dict(outcomes[first_index[key]], replayed=True)
+
+        return [outcomes[index] for index in range(len(scans))]
+
+    @staticmethod
+    def _route_scan(day_sessions, student_id, group_ids, local_time):
+        """Pick the session running at local_time, closest start time first"""
+        grace = AttendanceService.SCAN_GRACE_PERIOD
+        candidates = []
+        for session in day_sessions:
+            if session.student_id != student_id and session.group_id not in group_ids:
+                continue
+            starts_at = datetime.combine(session.date, session.start_time)
+            ends_at = datetime.combine(session.date, session.end_time)
+            if starts_at - grace <= local_time <= ends_at + grace:
+                candidates.append((abs(local_time - starts_at), session.start_time, session))
+        if not candidates:
+            return None
+        return min(candidates, key=lambda candidate: candidate[:2])[2]
+
+    @staticmethod
+    def _sync_outcome(key, status, message, session_id=None, attendance_id=None, replayed=False):
+        return {
+            'idempotency_key': key,
+            'status': status,
+            'message': message,
+            'session_id': session_id,
+            'attendance_id': attendance_id,
+            'replayed': replayed,
+        }
+
+    @staticmethod
+    def _lock_student(student_id):
+        """Lock the student row, concurrent scans of the same student wait here"""
+        return Student.objects.select_for_update().only(
+            'id', 'name', 'lessons_remaining', 'subscription_balance'
+        ).get(id=student_id)
+
+    @staticmethod
+    def _scan_routing(student_id, today):
+        """
+        Returns (attended_today, active_session_id) for a locked student.
+
+        This must run after _lock_student. Subqueries of the locking SELECT
+        read the snapshot taken before the lock was granted and would miss a
+        log inserted by the scan that held it.
+        """
+        active_session = Session.objects.filter(
+            date=today,
+            status='IN_PROGRESS'
+        ).filter(
+            Q(student=OuterRef('pk')) | Q(group__students__student=OuterRef('pk'))
+        ).order_by('start_time').values('id')[:1]
+
+        return Student.objects.filter(id=student_id).annotate(
+            attended_today=Exists(
+                AttendanceLog.objects.filter(student=OuterRef('pk'), scanned_at__date=today)
+            ),
+            active_session_id=Subquery(active_session)
+        ).values_list('attended_today', 'active_session_id').get()
+
+    @staticmethod
+    def _open_private_session(student, user, today):
+        """Create an ad-hoc private session for a walk-in scan"""
+        teacher = Teacher.objects.filter(user=user).first() if user is not None else None
+        if teacher is None:
+            # Fall back to any available teacher for testing/development
+            teacher = Teacher.objects.first()
+        if teacher is None:
+            raise ValidationError("No teacher available to assign to session")
+
+        now = timezone.now()
+        return Session.objects.create(
+            date=today,
+            student=student,
+            teacher=teacher,
+            type='PRIVATE',
+            status='IN_PROGRESS',
+            start_time=now.time(),
+            end_time=(now + timedelta(hours=1)).time(),
+            payment=0
+        )
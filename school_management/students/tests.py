@@ -1,3 +1,1194 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.db.models import Sum
+from django.urls import reverse
+from rest_framework import serializers
+from rest_framework.test import APIClient
+from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+import csv
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from .models import (
+    Student, Teacher, Group, GroupStudent, Schedule, Session, AttendanceLog, LessonLedger, SubscriptionPlan,
+    StudentSubscription
+)
+from .manager import AvailabilityManager, CalendarManager, ScheduleManager, SessionStatusManager, TeacherTimetable, TimetableSolver
+from .serializers import SessionSerializer
+from .services import AttendanceService, BalanceService, ClosureService
+
+
+def create_student(name, lessons_remaining=10, subscription_balance='100.00'):
+    user = get_user_model().objects.create_user(email=f'{name}@example.com', role='student')
+    return Student.objects.create(
+        user=user,
+        name=name,
+        email=user.email,
+        lessons_remaining=lessons_remaining,
+        subscription_balance=Decimal(subscription_balance)
+    )
+
+
+def create_teacher(name):
+    user = get_user_model().objects.create_user(email=f'{name}@example.com', role='instructor')
+    return Teacher.objects.create(user=user, name=name, email=user.email)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class BalanceConcurrencyTests(TransactionTestCase):
+    """Hammer the balance paths from a thread pool and check the invariants"""
+
+    workers = 16
+
+    def run_concurrently(self, func, args):
+        def call(arg):
+            try:
+                return func(arg)
+            except ValidationError:
+                return None
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(call, args))
+
+    def test_concurrent_deductions_never_overdraw(self):
+        student = create_student('stress', lessons_remaining=50, subscription_balance='500.00')
+
+        results = self.run_concurrently(BalanceService.deduct_lesson, [student.id] * 200)
+
+        student.refresh_from_db()
+        self.assertEqual(len([result for result in results if result is not None]), 50)
+        self.assertEqual(student.lessons_remaining, 0)
+        self.assertEqual(student.subscription_balance, Decimal('0.00'))
+
+    def test_concurrent_scans_charge_once(self):
+        teacher = create_teacher('teacher')
+        group = Group.objects.create(
+            name='Evening', language='English', level='Beginner', teacher=teacher, max_capacity=20
+        )
+        students = [create_student(f'student{i}', lessons_remaining=4, subscription_balance='40.00') for i in range(10)]
+        GroupStudent.objects.bulk_create([GroupStudent(student=student, group=group) for student in students])
+        Session.objects.create(
+            teacher=teacher, group=group, date=timezone.now().date(),
+            start_time=time(17, 0), end_time=time(18, 0), type='GROUP', payment=0, status='IN_PROGRESS'
+        )
+
+        # Every student scans five times at once; only one scan each may count
+        self.run_concurrently(AttendanceService.scan, [student.id for student in students] * 5)
+
+        for student in students:
+            student.refresh_from_db()
+            self.assertEqual(student.lessons_remaining, 3)
+            self.assertEqual(student.subscription_balance, Decimal('30.00'))
+        self.assertEqual(AttendanceLog.objects.count(), len(students))
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_concurrent_walk_in_scans_open_one_session(self):
+        create_teacher('walk-in-teacher')
+        students = [create_student(f'walk-in{i}', lessons_remaining=4, subscription_balance='40.00') for i in range(5)]
+
+        # Without an active session every scan would open its own private session
+        self.run_concurrently(AttendanceService.scan, [student.id for student in students] * 5)
+
+        for student in students:
+            student.refresh_from_db()
+            self.assertEqual(student.lessons_remaining, 3)
+            self.assertEqual(student.subscription_balance, Decimal('30.00'))
+            self.assertEqual(Session.objects.filter(student=student).count(), 1)
+        self.assertEqual(AttendanceLog.objects.count(), len(students))
+
+    def test_concurrent_roster_submits_charge_once(self):
+        teacher = create_teacher('roster-teacher')
+        group = Group.objects.create(
+            name='Roster', language='English', level='Beginner', teacher=teacher, max_capacity=20
+        )
+        students = [create_student(f'roster{i}', lessons_remaining=4, subscription_balance='40.00') for i in range(10)]
+        GroupStudent.objects.bulk_create([GroupStudent(student=student, group=group) for student in students])
+        session = Session.objects.create(
+            teacher=teacher, group=group, date=timezone.now().date(),
+            start_time=time(17, 0), end_time=time(18, 0), type='GROUP', payment=0, status='IN_PROGRESS'
+        )
+        entries = [{'student_id': student.id, 'status': 'present'} for student in students]
+
+        results = self.run_concurrently(lambda _: AttendanceService.mark_roster(session, entries), range(5))
+
+        # Later submits see the logs of the first one and report them per student
+        marked = [outcome for result in results for outcome in result if outcome['status'] == 'success']
+        self.assertEqual(len(marked), len(students))
+        for student in students:
+            student.refresh_from_db()
+            self.assertEqual(student.lessons_remaining, 3)
+            self.assertEqual(student.subscription_balance, Decimal('30.00'))
+        self.assertEqual(AttendanceLog.objects.count(), len(students))
+
+
+class MarkRosterTests(TestCase):
+    def setUp(self):
+        self.teacher = create_teacher('roster-teacher')
+        self.group = Group.objects.create(
+            name='Roster', language='English', level='Beginner', teacher=self.teacher, max_capacity=20
+        )
+        self.session = Session.objects.create(
+            teacher=self.teacher, group=self.group, date=timezone.now().date(),
+            start_time=time(17, 0), end_time=time(18, 0), type='GROUP', payment=0, status='IN_PROGRESS'
+        )
+
+    def enroll(self, name, **balances):
+        student = create_student(name, **balances)
+        GroupStudent.objects.create(group=self.group, student=student)
+        return student
+
+    def test_outcome_per_entry(self):
+        present = self.enroll('present', lessons_remaining=4, subscription_balance='40.00')
+        absent = self.enroll('absent', lessons_remaining=4, subscription_balance='40.00')
+        empty = self.enroll('empty', lessons_remaining=0, subscription_balance='0.00')
+        outsider = create_student('outsider')
+
+        outcomes = AttendanceService.mark_roster(self.session, [
+            {'student_id': present.id, 'status': 'present'},
+            {'student_id': absent.id, 'status': 'absent'},
+            {'student_id': empty.id, 'status': 'present'},
+            {'student_id': outsider.id, 'status': 'present'},
+            {'student_id': present.id, 'status': 'late'},
+            {'student_id': 'nobody', 'status': 'present'},
+            {'student_id': absent.id + 1000, 'status': 'present'},
+            {'student_id': outsider.id, 'status': 'excused'},
+        ])
+
+        self.assertEqual([(outcome['status'], outcome['message']) for outcome in outcomes], [
+            ('success', 'Marked present as present'),
+            ('success', 'Marked absent as absent'),
+            ('error', 'No remaining lessons in subscription'),
+            ('error', 'Student is not part of this session'),
+            ('error', 'Duplicate entry for student'),
+            ('error', 'Invalid student id'),
+            ('error', 'Student not found'),
+            ('error', 'Invalid attendance status excused'),
+        ])
+        # Only attended lessons are charged
+        self.assertEqual((outcomes[0]['lessons_remaining'], outcomes[0]['subscription_balance']), (3, Decimal('30.00')))
+        self.assertEqual((outcomes[1]['lessons_remaining'], outcomes[1]['subscription_balance']), (4, Decimal('40.00')))
+        self.assertEqual(
+            set(AttendanceLog.objects.values_list('student_id', 'status')),
+            {(present.id, 'present'), (absent.id, 'absent')}
+        )
+
+    def test_resubmit_reports_marked_students(self):
+        student = self.enroll('twice')
+        entries = [{'student_id': student.id, 'status': 'present'}]
+        AttendanceService.mark_roster(self.session, entries)
+
+        outcomes = AttendanceService.mark_roster(self.session, entries)
+
+        self.assertEqual(outcomes[0]['message'], 'Attendance already marked for this student in this session')
+        student.refresh_from_db()
+        self.assertEqual(student.lessons_remaining, 9)
+
+    def test_query_count_does_not_grow_with_roster(self):
+        counts = []
+        for size in (2, 12):
+            self.session.attendancelog_set.all().delete()
+            students = [self.enroll(f'roster{size}-{i}') for i in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                AttendanceService.mark_roster(
+                    self.session, [{'student_id': student.id, 'status': 'present'} for student in students]
+                )
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+
+class SyncBatchTests(TestCase):
+    def setUp(self):
+        self.student = create_student('offline', lessons_remaining=5, subscription_balance='50.00')
+        self.session = Session.objects.create(
+            teacher=create_teacher('offline-teacher'), student=self.student, date=date(2024, 3, 4),
+            start_time=time(9), end_time=time(10), type='PRIVATE', payment=0, status='COMPLETED'
+        )
+
+    def scan(self, key, hour, minute=0):
+        scanned_at = timezone.make_aware(datetime(2024, 3, 4, hour, minute))
+        return {'idempotency_key': key, 'student_id': self.student.id, 'scanned_at': scanned_at.isoformat()}
+
+    def test_batch_routes_rejects_and_replays(self):
+        outcomes = AttendanceService.sync_batch([
+            self.scan('late-scan', 9, 5),
+            self.scan('late-scan', 9, 5),
+            self.scan('second-scan', 9, 30),
+            self.scan('evening-scan', 15),
+        ])
+
+        self.assertEqual(
+            [(outcome['status'], outcome['message'], outcome['replayed']) for outcome in outcomes],
+            [
+                ('accepted', '', False),
+                ('accepted', '', True),
+                ('rejected', 'Attendance already marked for that day', False),
+                ('rejected', 'No session was running at the time of the scan', False),
+            ]
+        )
+        attendance = AttendanceLog.objects.get()
+        self.assertEqual(outcomes[0]['attendance_id'], attendance.id)
+        self.assertEqual(outcomes[1]['attendance_id'], attendance.id)
+        self.assertEqual(attendance.session_id, self.session.id)
+        # The log keeps when the scan happened, not when it was synced
+        self.assertEqual(attendance.scanned_at, timezone.make_aware(datetime(2024, 3, 4, 9, 5)))
+
+        replay = AttendanceService.sync_batch([self.scan('late-scan', 9, 5), self.scan('evening-scan', 15)])
+        self.assertEqual(
+            [(outcome['status'], outcome['attendance_id'], outcome['replayed']) for outcome in replay],
+            [('accepted', attendance.id, True), ('rejected', None, True)]
+        )
+        self.assertEqual(AttendanceLog.objects.count(), 1)
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.lessons_remaining, 4)
+
+    def test_impossible_timestamps_are_invalid_without_failing_the_batch(self):
+        scan = dict(self.scan('impossible-scan', 9, 5), scanned_at='2024-02-30T10:00:00')
+
+        outcomes = AttendanceService.sync_batch([scan, self.scan('late-scan', 9, 5)])
+
+        self.assertEqual(
+            [(outcome['status'], outcome['message']) for outcome in outcomes],
+            [('invalid', 'scanned_at must be an ISO 8601 timestamp'), ('accepted', '')]
+        )
+
+
+class BalanceServiceTests(TestCase):
+    def test_deduction_refused_without_lessons(self):
+        student = create_student('empty', lessons_remaining=0)
+
+        with self.assertRaisesMessage(ValidationError, 'No remaining lessons in subscription'):
+            BalanceService.deduct_lesson(student.id)
+
+        student.refresh_from_db()
+        self.assertEqual(student.lessons_remaining, 0)
+        self.assertEqual(student.subscription_balance, Decimal('100.00'))
+
+    def test_refund_restores_deduction(self):
+        student = create_student('refund', lessons_remaining=4, subscription_balance='100.00')
+
+        self.assertEqual(BalanceService.deduct_lesson(student.id), (3, Decimal('75.00')))
+        self.assertEqual(BalanceService.refund_lesson(student.id), (4, Decimal('100.00')))
+
+    def test_ledger_matches_snapshot(self):
+        teacher = create_teacher('ledger-teacher')
+        student = create_student('ledger', lessons_remaining=3, subscription_balance='100.00')
+        session = Session.objects.create(
+            teacher=teacher, student=student, date=timezone.now().date(),
+            start_time=time(9, 0), end_time=time(10, 0), type='PRIVATE', payment=0
+        )
+        attendance = session.mark_attendance(student.id)
+        BalanceService.refund_lesson(student.id, attendance)
+        BalanceService.deduct_lesson(student.id)
+        BalanceService.deduct_lesson(student.id)
+        BalanceService.deduct_lesson(student.id)
+
+        student.refresh_from_db()
+        totals = LessonLedger.objects.filter(student=student).aggregate(lessons=Sum('lessons'), amount=Sum('amount'))
+        self.assertEqual((student.lessons_remaining, student.subscription_balance), (0, Decimal('0.00')))
+        self.assertEqual((totals['lessons'], totals['amount']), (0, Decimal('0.00')))
+        # Prices are rounded to the cent and the rounding is absorbed by later lessons
+        self.assertEqual(
+            list(LessonLedger.objects.filter(student=student, entry_type='deduction').order_by('id').values_list(
+                'amount', flat=True
+            )),
+            [Decimal('-33.33'), Decimal('-33.33'), Decimal('-33.34'), Decimal('-33.33')]
+        )
+
+    def test_full_save_keeps_snapshot(self):
+        student = create_student('stale', lessons_remaining=4)
+        BalanceService.deduct_lesson(student.id)
+
+        student.name = 'renamed'
+        student.save()
+
+        student.refresh_from_db()
+        self.assertEqual(student.lessons_remaining, 3)
+
+    def test_subscriptions_consumed_oldest_first(self):
+        student = create_student('fifo', lessons_remaining=0, subscription_balance='0.00')
+        first = SubscriptionPlan.objects.create(name='Starter', number_of_lessons=2, price=Decimal('50.00'))
+        second = SubscriptionPlan.objects.create(name='Standard', number_of_lessons=3, price=Decimal('100.00'))
+        older, _ = BalanceService.purchase(student.id, first, date(2024, 1, 1))
+        newer, _ = BalanceService.purchase(student.id, second, date(2024, 2, 1))
+        self.assertEqual((older.lesson_price, newer.lesson_price), (Decimal('25.00'), Decimal('33.33')))
+
+        balances = [BalanceService.deduct_lesson(student.id) for _ in range(5)]
+
+        self.assertEqual(balances, [
+            (4, Decimal('125.00')), (3, Decimal('100.00')),
+            (2, Decimal('66.67')), (1, Decimal('33.34')), (0, Decimal('0.00')),
+        ])
+        older.refresh_from_db()
+        newer.refresh_from_db()
+        self.assertEqual((older.lessons_left, newer.lessons_left), (0, 0))
+
+
+class ReconcileBalancesCommandTests(TestCase):
+    def setUp(self):
+        self.teacher = create_teacher('reconcile-teacher')
+        self.plan = SubscriptionPlan.objects.create(name='Reconcile', number_of_lessons=4, price=Decimal('100.00'))
+
+    def enrolled(self, name):
+        student = create_student(name, lessons_remaining=0, subscription_balance='0.00')
+        BalanceService.purchase(student.id, self.plan, date(2024, 1, 1))
+        session = Session.objects.create(
+            teacher=self.teacher, student=student, date=timezone.now().date(),
+            start_time=time(9, 0), end_time=time(10, 0), type='PRIVATE', payment=0
+        )
+        return student, session
+
+    def reconcile(self, *args):
+        path = os.path.join(self.tmpdir, 'report.csv')
+        call_command('reconcile_balances', '--report', path, *args, stdout=StringIO())
+        with open(path, newline='') as report:
+            return [(row['student_id'], row['problem'], row['attendance_id']) for row in csv.DictReader(report)]
+
+    def test_report_and_fix_drift(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.enrolled('reconcile-clean')
+        uncharged, session = self.enrolled('reconcile-uncharged')
+        # Logged without going through the ledger
+        missed = AttendanceLog.objects.create(student=uncharged, session=session, status='present')
+        overcharged, session = self.enrolled('reconcile-overcharged')
+        excused = session.mark_attendance(overcharged.id)
+        AttendanceLog.objects.filter(id=excused.id).update(status='absent')
+        stale, _ = self.enrolled('reconcile-stale')
+        Student.objects.filter(id=stale.id).update(lessons_remaining=9)
+
+        self.assertCountEqual(self.reconcile(), [
+            (str(uncharged.id), 'uncharged present attendance', str(missed.id)),
+            (str(overcharged.id), 'overcharged absent attendance', str(excused.id)),
+            (str(stale.id), 'snapshot', ''),
+        ])
+
+        # The report still lists what --fix found, a second run finds nothing
+        self.assertEqual(len(self.reconcile('--fix')), 3)
+        self.assertEqual(self.reconcile(), [])
+        balances = dict(Student.objects.filter(
+            id__in=[uncharged.id, overcharged.id, stale.id]
+        ).values_list('id', 'lessons_remaining'))
+        self.assertEqual(balances, {uncharged.id: 3, overcharged.id: 4, stale.id: 4})
+        self.assertTrue(LessonLedger.objects.filter(attendance=missed, entry_type='deduction').exists())
+        self.assertTrue(LessonLedger.objects.filter(attendance=excused, entry_type='refund').exists())
+
+
+class ScheduleConflictTests(TestCase):
+    def test_timetable_reports_overlaps_but_not_touching_or_other_days(self):
+        morning = Schedule(id=1, days=[0], start_time=time(8), end_time=time(12))
+        short = Schedule(id=2, days=[0], start_time=time(11), end_time=time(11, 30))
+        afternoon = Schedule(id=3, days=[0], start_time=time(13), end_time=time(14))
+        tuesday = Schedule(id=4, days=[1], start_time=time(9), end_time=time(10))
+        timetable = TeacherTimetable([afternoon, tuesday, short, morning])
+
+        # The long morning schedule is found although a later one ended before the slot
+        self.assertEqual(timetable.overlapping(0, 11 * 60 + 45, 13 * 60), [morning])
+        self.assertEqual(timetable.overlapping(0, 10 * 60, 11 * 60 + 15), [morning, short])
+        self.assertEqual(timetable.overlapping(0, 12 * 60, 13 * 60), [])
+        self.assertEqual(timetable.overlapping(0, 7 * 60, 8 * 60), [])
+        self.assertEqual(timetable.overlapping(0, 14 * 60, 15 * 60), [])
+        self.assertEqual(timetable.overlapping(1, 9 * 60 + 30, 9 * 60 + 45), [tuesday])
+        self.assertEqual(timetable.overlapping(2, 9 * 60, 10 * 60), [])
+
+    def test_find_conflicts_checks_schedules_and_the_other_slots(self):
+        teacher = create_teacher('conflicts')
+        student = create_student('conflicts-student')
+        existing = Schedule.objects.create(
+            teacher=teacher, student=student, days=[0, 2], start_time=time(9), end_time=time(10), payment=0
+        )
+
+        results = ScheduleManager.find_conflicts(teacher, [
+            {'days': [2, 3], 'start_time': '09:30', 'end_time': '10:30'},
+            {'days': [0], 'start_time': '10:00', 'end_time': '11:00'},
+            {'days': [3, 4], 'start_time': '10:30', 'end_time': '11:00'},
+            {'days': [4], 'start_time': '10:30', 'end_time': '11:30'},
+        ])
+
+        self.assertEqual(results, [
+            {'slot': 0, 'conflicts': [{
+                'day': 2, 'schedule_id': existing.id, 'start_time': time(9), 'end_time': time(10),
+                'description': 'conflicts-student',
+            }]},
+            {'slot': 1, 'conflicts': []},
+            {'slot': 2, 'conflicts': [{'day': 4, 'slot': 3}]},
+            {'slot': 3, 'conflicts': [{'day': 4, 'slot': 2}]},
+        ])
+        self.assertFalse(ScheduleManager.check_schedule_conflict(
+            teacher, time(9), time(10), 0, exclude_id=existing.id
+        ))
+        with self.assertRaisesMessage(ValidationError, 'End time must be after start time'):
+            ScheduleManager.find_conflicts(teacher, [{'days': [0], 'start_time': '10:00', 'end_time': '10:00'}])
+
+
+class TimetableSolverTests(TestCase):
+    def test_proposals_avoid_teacher_and_student_clashes(self):
+        teacher = create_teacher('solver')
+        teacher.specializations = ['English']
+        teacher.save()
+        Teacher.objects.filter(id=create_teacher('other').id).update(specializations=['German'])
+        taken = Group.objects.create(
+            name='Taken', language='English', level='Beginner', teacher=teacher, max_capacity=5
+        )
+        Schedule.objects.create(
+            teacher=teacher, group=taken, days=[0], start_time=time(9), end_time=time(21), payment=0
+        )
+        student = create_student('shared')
+        groups = [
+            Group.objects.create(name=f'English {index}', language='English', level='Beginner', max_capacity=5)
+            for index in range(3)
+        ]
+        for group in groups[:2]:
+            GroupStudent.objects.create(student=student, group=group)
+        french = Group.objects.create(name='French', language='French', level='Beginner', max_capacity=5)
+
+        result = TimetableSolver.for_groups(
+            [group.id for group in groups] + [french.id],
+            patterns=[[0], [1]],
+            day_start='09:00',
+            day_end='13:30'
+        ).solve()
+
+        self.assertEqual([group['group_id'] for group in result['unplaced']], [french.id])
+        self.assertEqual({proposal['teacher_id'] for proposal in result['proposals']}, {teacher.id})
+        slots = [(proposal['days'][0], proposal['start_time']) for proposal in result['proposals']]
+        self.assertEqual(len(set(slots)), 3)
+        self.assertNotIn(0, [day for day, _ in slots])
+
+        schedules = ScheduleManager.create_schedules(result['proposals'])
+        self.assertEqual(len(schedules), 3)
+        self.assertEqual(Group.objects.filter(teacher=teacher).count(), 4)
+
+
+class CalendarFeedTests(TestCase):
+    def test_feed_uses_rrule_and_answers_unchanged_polls_with_304(self):
+        teacher = create_teacher('calendar')
+        group = Group.objects.create(name='Evening English', language='English', level='Beginner', max_capacity=5)
+        schedule = Schedule.objects.create(
+            teacher=teacher, group=group, days=[0, 2], start_time=time(18), end_time=time(19, 30), payment=0
+        )
+        ScheduleManager.create_sessions_for_schedule(schedule, weeks=3)
+        url = reverse('calendar-feed', args=['group', group.id, CalendarManager.token('group', group.id)])
+
+        response = self.client.get(url)
+        body = response.content.decode()
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertIn('RRULE:FREQ=WEEKLY;BYDAY=MO,WE', body)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        session = schedule.sessions.order_by('date').last()
+        with self.captureOnCommitCallbacks(execute=True):
+            session.status = 'CANCELLED'
+            session.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'EXDATE:{session.date:%Y%m%d}T180000', response.content.decode())
+        self.assertEqual(self.client.get(url.replace('.ics', 'x.ics')).status_code, 404)
+
+    def test_series_starts_in_the_window_and_excludes_moved_occurrences(self):
+        teacher = create_teacher('calendar-moved')
+        group = Group.objects.create(name='Morning English', language='English', level='Beginner', max_capacity=5)
+        schedule = Schedule.objects.create(
+            teacher=teacher, group=group, days=[0, 1, 2, 3, 4, 5, 6], start_time=time(9), end_time=time(10), payment=0
+        )
+        # Older than the window, whose exceptions are no longer loaded
+        Schedule.objects.filter(id=schedule.id).update(created_at=timezone.now() - timedelta(days=400))
+        ScheduleManager.create_sessions_for_schedule(schedule, weeks=1)
+        session = schedule.sessions.order_by('date').last()
+        original = session.occurrence_date
+        session.date = original + timedelta(days=10)
+        session.save()
+
+        body = CalendarManager.render('group', group.id)
+        window_start = timezone.localdate() - timedelta(days=CalendarManager.PAST_DAYS)
+        self.assertIn(f'DTSTART:{window_start:%Y%m%d}T090000', body)
+        self.assertIn(f'EXDATE:{original:%Y%m%d}T090000', body)
+        self.assertIn(f'UID:session-{session.id}@school_management', body)
+        self.assertIn(f'DTSTART:{session.date:%Y%m%d}T090000', body)
+        self.assertNotIn('RECURRENCE-ID', body)
+
+
+class ClosureTests(TestCase):
+    def test_closure_cancels_refunds_and_stops_generation(self):
+        teacher = create_teacher('closure')
+        student = create_student('closure-student', lessons_remaining=4)
+        schedule = Schedule.objects.create(
+            teacher=teacher, student=student, days=[0, 1, 2, 3, 4, 5, 6],
+            start_time=time(9), end_time=time(10), payment=0
+        )
+        today = timezone.now().date()
+        ScheduleManager.materialize_sessions([schedule], today, today + timedelta(days=6))
+        session = Session.objects.get(schedule=schedule, date=today)
+        session.mark_attendance(student.id)
+
+        closure, counts = ClosureService.create_closure(today, today + timedelta(days=2), teacher=teacher)
+
+        self.assertEqual(counts, {'cancelled': 3, 'refunded': 1})
+        self.assertEqual(Session.objects.filter(schedule=schedule, status='CANCELLED').count(), 3)
+        student.refresh_from_db()
+        self.assertEqual(student.lessons_remaining, 4)
+        self.assertFalse(AttendanceLog.objects.get(session=session).valid)
+        # Deleted sessions of closed dates are not generated again
+        Session.objects.filter(schedule=schedule).delete()
+        missing = ScheduleManager.missing_sessions([schedule], today, today + timedelta(days=6))
+        self.assertEqual(sorted(occurrence.date for occurrence in missing), [today + timedelta(days=day) for day in range(3, 7)])
+        with self.assertRaises(ValidationError):
+            ClosureService.create_closure(today, today - timedelta(days=1))
+
+
+class AvailabilityTests(TestCase):
+    def test_free_slots_fill_the_gaps_between_busy_intervals(self):
+        busy = [(900, 960), (600, 660), (630, 700)]
+
+        self.assertEqual(
+            AvailabilityManager.free_slots(busy, 60, 480, 1320), [(480, 600), (700, 900), (960, 1320)]
+        )
+        self.assertEqual(AvailabilityManager.free_slots(busy, 150, 480, 1320), [(700, 900), (960, 1320)])
+        # Touching intervals leave no gap, and busy time past the day is clipped
+        self.assertEqual(AvailabilityManager.free_slots([(480, 540), (540, 1400)], 1, 480, 1320), [])
+        self.assertEqual(AvailabilityManager.free_slots([], 60, 480, 1320), [(480, 1320)])
+
+    def test_cached_availability_follows_schedule_session_and_closure_writes(self):
+        teacher = create_teacher('availability')
+        schedule = Schedule.objects.create(
+            teacher=teacher, student=create_student('availability-student'), days=[0],
+            start_time=time(9), end_time=time(10), payment=0
+        )
+        monday = date(2030, 1, 7)
+
+        def free():
+            return [
+                (slot['start'], slot['end'])
+                for slot in AvailabilityManager.teacher_availability(teacher.id, monday, monday)[0]['free']
+            ]
+
+        self.assertEqual(free(), [('08:00', '09:00'), ('10:00', '22:00')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule.start_time, schedule.end_time = time(12), time(13)
+            schedule.save()
+        self.assertEqual(free(), [('08:00', '12:00'), ('13:00', '22:00')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Session.objects.create(
+                teacher=teacher, date=monday, start_time=time(15), end_time=time(16), type='PRIVATE', payment=0
+            )
+        self.assertEqual(free(), [('08:00', '12:00'), ('13:00', '15:00'), ('16:00', '22:00')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ClosureService.create_closure(monday, monday, teacher=teacher)
+        self.assertEqual(free(), [('08:00', '22:00')])
+
+
+class SessionStatusTests(TestCase):
+    def test_new_sessions_wait_for_the_sweeper(self):
+        session = Session.objects.create(
+            teacher=create_teacher('status-default'), date=timezone.now().date(),
+            start_time=time(9), end_time=time(10), type='PRIVATE', payment=0
+        )
+
+        self.assertEqual(session.status, 'SCHEDULED')
+
+    def test_sweep_moves_sessions_with_grace_windows(self):
+        teacher = create_teacher('sweeper')
+        now = timezone.make_aware(datetime(2026, 3, 2, 10, 0))
+        today = now.date()
+        yesterday = today - timedelta(days=1)
+        slots = {
+            'ended': (yesterday, time(9), time(10), 'IN_PROGRESS', 'COMPLETED'),
+            'overnight-ended': (yesterday, time(23, 30), time(0, 30), 'SCHEDULED', 'COMPLETED'),
+            'cancelled': (yesterday, time(9), time(10), 'CANCELLED', 'CANCELLED'),
+            'closing': (today, time(8), time(9, 50), 'SCHEDULED', 'IN_PROGRESS'),
+            'opening': (today, time(10, 10), time(11), 'SCHEDULED', 'IN_PROGRESS'),
+            'later': (today, time(10, 30), time(11, 30), 'SCHEDULED', 'SCHEDULED'),
+            'overnight': (today, time(23, 30), time(0, 30), 'SCHEDULED', 'SCHEDULED'),
+        }
+        sessions = {
+            name: Session.objects.create(
+                teacher=teacher, date=date, start_time=start_time, end_time=end_time,
+                type='PRIVATE', payment=0, status=status
+            )
+            for name, (date, start_time, end_time, status, _) in slots.items()
+        }
+        grace = timedelta(minutes=15)
+
+        swept = SessionStatusManager.sweep(now, grace, grace)
+
+        self.assertEqual(swept, {'completed': 2, 'started': 2})
+        for name, session in sessions.items():
+            session.refresh_from_db()
+            self.assertEqual(session.status, slots[name][4], name)
+            if session.status != 'CANCELLED':
+                self.assertEqual(
+                    SessionStatusManager.status_at(session.date, session.start_time, session.end_time, now, grace, grace),
+                    session.status
+                )
+
+
+class StudentListQueryTests(TestCase):
+    def test_latest_subscription_is_prefetched(self):
+        starter = SubscriptionPlan.objects.create(name='Starter', number_of_lessons=4, price=Decimal('40.00'))
+        standard = SubscriptionPlan.objects.create(name='Standard', number_of_lessons=8, price=Decimal('80.00'))
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(email='admin@example.com', role='admin'))
+
+        def list_students(count):
+            for index in range(count):
+                student = create_student(f'listed-{count}-{index}')
+                StudentSubscription.objects.create(student=student, subscription_plan=starter, start_date=date(2024, 1, 1))
+                StudentSubscription.objects.create(student=student, subscription_plan=standard, start_date=date(2024, 2, 1))
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get('/api/students/students/')
+            return response, len(queries)
+
+        response, few = list_students(2)
+        response, many = list_students(20)
+
+        self.assertEqual(few, many)
+        students = response.data['results']
+        self.assertEqual(len(students), 22)
+        self.assertEqual({student['subscription_info']['plan_name'] for student in students}, {'Standard'})
+        self.assertEqual({student['total_lessons'] for student in students}, {8})
+
+
+class GroupRosterQueryTests(TestCase):
+    def test_group_listings_do_not_query_per_group(self):
+        teacher = create_teacher('roster')
+        students = [create_student(f'roster-{index}') for index in range(3)]
+        groups = Group.objects.bulk_create([
+            Group(name=f'Roster {index}', language='English', level='Beginner', teacher=teacher, max_capacity=5)
+            for index in range(200)
+        ])
+        GroupStudent.objects.bulk_create([
+            GroupStudent(group=group, student=student)
+            for index, group in enumerate(groups) for student in students[:index % 4]
+        ])
+        client = APIClient()
+        client.force_authenticate(teacher.user)
+
+        with self.assertNumQueries(2):
+            response = client.get('/api/students/groups/', {'page_size': 200})
+        groups = response.data['results']
+        self.assertEqual(len(groups), 200)
+        self.assertEqual([group['current_capacity'] for group in groups[:4]], [0, 1, 2, 3])
+        self.assertEqual([student['name'] for student in groups[3]['students']], ['roster-0', 'roster-1', 'roster-2'])
+
+        with self.assertNumQueries(3):
+            response = client.get(f'/api/students/teachers/{teacher.id}/groups/')
+        self.assertEqual(len(response.data), 200)
+
+        client.force_authenticate(get_user_model().objects.create_user(email='admin@example.com', role='admin'))
+        with self.assertNumQueries(4):
+            response = client.get(f'/api/students/students/{students[0].id}/groups/')
+        self.assertEqual(len(response.data), 150)
+
+
+class TeacherListQueryTests(TestCase):
+    def test_private_students_are_prefetched_once_per_student(self):
+        teachers = [create_teacher(f'private-{index}') for index in range(5)]
+        students = [create_student(f'private-student-{index}') for index in range(4)]
+        Session.objects.bulk_create([
+            Session(
+                teacher=teacher, student=student, date=date(2024, 1, 1) + timedelta(days=day),
+                start_time=time(9), end_time=time(10), type='PRIVATE', payment=0
+            )
+            for teacher in teachers for student in students[:2] for day in range(30)
+        ])
+        group = Group.objects.create(name='Taught', language='English', level='Beginner', teacher=teachers[0], max_capacity=5)
+        GroupStudent.objects.create(group=group, student=students[3])
+        client = APIClient()
+        client.force_authenticate(teachers[0].user)
+
+        with self.assertNumQueries(4), CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/students/teachers/')
+        # Correlated with the listed teachers instead of grouping the whole session table
+        sessions = [query['sql'] for query in queries.captured_queries if 'FROM "students_session"' in query['sql']]
+        self.assertEqual(len(sessions), 1)
+        self.assertNotIn('GROUP BY', sessions[0])
+
+        teachers = response.data['results']
+        self.assertEqual(len(teachers), 5)
+        self.assertEqual(teachers[0]['private_students'], [
+            {'id': student.id, 'name': student.name, 'email': student.email, 'level': student.level}
+            for student in students[:2]
+        ])
+        self.assertEqual(teachers[0]['teaching_groups'][0]['current_capacity'], 1)
+
+
+class SessionSerializerTests(TestCase):
+    def test_listing_matches_field_by_field_rendering(self):
+        teacher = create_teacher('lean')
+        teacher.specializations = ['English']
+        teacher.save()
+        students = [create_student(f'lean-{index}') for index in range(3)]
+        groups = [
+            Group.objects.create(name=f'Lean {index}', language='English', level='Beginner', max_capacity=5)
+            for index in range(4)
+        ]
+        for index, group in enumerate(groups):
+            for student in students[:index]:
+                GroupStudent.objects.create(group=group, student=student)
+        for day in range(10):
+            group = groups[day % 4]
+            Session.objects.create(
+                teacher=teacher, group=group if day % 5 else None, student=None if day % 5 else students[0],
+                date=date(2024, 1, 1) + timedelta(days=day), start_time=time(9), end_time=time(10),
+                type='GROUP' if day % 5 else 'PRIVATE', payment=0
+            )
+        # Unassigned sessions of either type
+        for session_type in ('GROUP', 'PRIVATE'):
+            Session.objects.create(
+                teacher=teacher, date=date(2024, 2, 1), start_time=time(9), end_time=time(10),
+                type=session_type, payment=0
+            )
+        sessions = Session.objects.select_related('student', 'group', 'teacher').order_by('id')
+
+        with self.assertNumQueries(2):
+            data = SessionSerializer(sessions, many=True).data
+
+        field_by_field = SessionSerializer(many=True).child
+        self.assertEqual(
+            [dict(row) for row in data],
+            [dict(serializers.ModelSerializer.to_representation(field_by_field, session)) for session in sessions]
+        )
+        self.assertEqual(data[3]['students'], ['lean-0', 'lean-1', 'lean-2'])
+        self.assertEqual(
+            [(row['className'], row['students'], row['student_details']) for row in data[-2:]],
+            [('Unassigned Lesson', [], None)] * 2
+        )
+
+
+class PaginationTests(TestCase):
+    def test_attendance_pages_follow_scans_newest_first(self):
+        teacher = create_teacher('pages')
+        students = [create_student(f'pages-{index}') for index in range(5)]
+        session = Session.objects.create(
+            teacher=teacher, date=date(2024, 1, 1), start_time=time(9), end_time=time(10), type='GROUP', payment=0
+        )
+        AttendanceLog.objects.bulk_create([
+            AttendanceLog(
+                student=student, session=session, status='present',
+                scanned_at=timezone.make_aware(datetime(2024, 1, 1, 9, index))
+            )
+            for index, student in enumerate(students)
+        ])
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(email='admin@example.com', role='admin'))
+
+        names = []
+        url = '/api/students/attendance-logs/?page_size=2'
+        while url:
+            response = client.get(url)
+            self.assertLessEqual(len(response.data['results']), 2)
+            names += [log['studentName'] for log in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(names, [student.name for student in reversed(students)])
+
+
+class SparseFieldsTests(TestCase):
+    def test_unrequested_fields_are_neither_loaded_nor_rendered(self):
+        teacher = create_teacher('sparse')
+        student = create_student('sparse-student')
+        group = Group.objects.create(name='Sparse', language='English', level='Beginner', max_capacity=5)
+        GroupStudent.objects.create(group=group, student=student)
+        for day in range(3):
+            Session.objects.create(
+                teacher=teacher, group=group, date=date(2024, 1, 1) + timedelta(days=day),
+                start_time=time(9), end_time=time(10), type='GROUP', payment=0
+            )
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(email='admin@example.com', role='admin'))
+
+        with self.assertNumQueries(1):
+            response = client.get('/api/students/students/', {'fields': 'id,name'})
+        self.assertEqual(response.data['results'], [{'id': student.id, 'name': 'sparse-student'}])
+
+        response = client.get('/api/students/students/', {'expand': 'subscription_info'})
+        row = response.data['results'][0]
+        self.assertIn('subscription_info', row)
+        self.assertNotIn('qr_code', row)
+        self.assertNotIn('total_lessons', row)
+
+        with self.assertNumQueries(1):
+            response = client.get('/api/students/sessions/', {'fields': 'id,className'})
+        self.assertEqual(
+            [set(row) for row in response.data['results']], [{'id', 'className'}] * 3
+        )
+        self.assertEqual(response.data['results'][0]['className'], 'Group Lesson - Sparse')
+
+        with self.assertNumQueries(1):
+            response = client.get('/api/students/groups/', {'fields': 'id,name'})
+        self.assertEqual(response.data['results'], [{'id': group.id, 'name': 'Sparse'}])
+
+
+class VirtualSessionTests(TestCase):
+    def test_listing_merges_occurrences_and_writes_persist_them(self):
+        teacher = create_teacher('virtual')
+        group = Group.objects.create(name='Virtual', language='English', level='Beginner', max_capacity=5)
+        schedule = Schedule.objects.create(
+            teacher=teacher, group=group, days=[0, 3], start_time=time(17), end_time=time(18), payment=0
+        )
+        today = timezone.now().date()
+        ScheduleManager.materialize_sessions([schedule], today, today + timedelta(weeks=1))
+        persisted = Session.objects.count()
+        client = APIClient()
+        client.force_authenticate(teacher.user)
+
+        response = client.get('/api/students/sessions/calendar/', {
+            'start_date': today.isoformat(),
+            'end_date': (today + timedelta(days=364)).isoformat(),
+        })
+
+        self.assertEqual(len(response.data), 104)
+        self.assertEqual(len([session for session in response.data if not session['virtual']]), persisted)
+        self.assertEqual(Session.objects.count(), persisted)
+
+        occurrence = response.data[-1]
+        response = client.post(f'/api/students/sessions/{occurrence["id"]}/toggle_activation/')
+        self.assertEqual(response.status_code, 200)
+        session = Session.objects.get(schedule=schedule, date=occurrence['date'])
+        self.assertEqual(session.status, 'IN_PROGRESS')
+
+    def test_session_list_pages_with_or_without_a_date_range(self):
+        teacher = create_teacher('virtual-pages')
+        schedule = Schedule.objects.create(
+            teacher=teacher, student=create_student('virtual-pages-student'), days=[0, 1, 2, 3, 4, 5, 6],
+            start_time=time(17), end_time=time(18), payment=0
+        )
+        today = timezone.now().date()
+        ScheduleManager.materialize_sessions([schedule], today, today + timedelta(days=2))
+        client = APIClient()
+        client.force_authenticate(teacher.user)
+        dates = {'start_date': today.isoformat(), 'end_date': (today + timedelta(days=6)).isoformat()}
+
+        response = client.get('/api/students/sessions/', dates)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNone(response.data['next'])
+
+        response = client.get('/api/students/sessions/calendar/', dates)
+        self.assertEqual(len(response.data), 7)
+
+        response = client.get('/api/students/sessions/calendar/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rescheduled_session_keeps_its_occurrence(self):
+        teacher = create_teacher('virtual-moved')
+        today = timezone.now().date()
+        schedule = Schedule.objects.create(
+            teacher=teacher, student=create_student('virtual-moved-student'), days=[today.weekday()],
+            start_time=time(17), end_time=time(18), payment=0
+        )
+        ScheduleManager.materialize_sessions([schedule], today, today + timedelta(weeks=2))
+        client = APIClient()
+        client.force_authenticate(teacher.user)
+        moved = Session.objects.get(schedule=schedule, date=today + timedelta(weeks=1))
+
+        response = client.patch(f'/api/students/sessions/{moved.id}/', {'date': (today + timedelta(days=8)).isoformat()})
+        self.assertEqual(response.status_code, 200)
+        moved.refresh_from_db()
+        self.assertEqual(moved.occurrence_date, today + timedelta(weeks=1))
+
+        # The original date is neither listed as a virtual ghost nor generated again
+        response = client.get('/api/students/sessions/calendar/', {
+            'start_date': today.isoformat(), 'end_date': (today + timedelta(days=20)).isoformat()
+        })
+        self.assertEqual(
+            [(session['date'], session['virtual']) for session in response.data],
+            [(today.isoformat(), False), ((today + timedelta(days=8)).isoformat(), False),
+             ((today + timedelta(weeks=2)).isoformat(), False)]
+        )
+        self.assertEqual(ScheduleManager.materialize_sessions([schedule], today, today + timedelta(weeks=2)), 0)
+
+        # Two occurrences may be moved onto the same date
+        last = Session.objects.get(schedule=schedule, occurrence_date=today + timedelta(weeks=2))
+        response = client.patch(f'/api/students/sessions/{last.id}/', {'date': (today + timedelta(days=8)).isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Session.objects.filter(schedule=schedule, date=today + timedelta(days=8)).count(), 2)
+
+
+class ScheduleDaysMaskTests(TestCase):
+    def test_mask_for_sets_a_bit_per_valid_weekday(self):
+        self.assertEqual(Schedule.mask_for([0, 2, 6]), 0b1000101)
+        self.assertEqual(Schedule.mask_for([3, 3, '4', 7, -1, None]), 0b1000)
+        self.assertEqual(Schedule.mask_for([]), 0)
+
+    def test_on_days_matches_any_shared_weekday(self):
+        teacher = create_teacher('mask')
+        student = create_student('mask-student')
+        monday, midweek, sunday = [
+            Schedule.objects.create(
+                teacher=teacher, student=student, days=days, start_time=time(9), end_time=time(10), payment=0
+            )
+            for days in ([0], [1, 3], [6])
+        ]
+
+        self.assertEqual(set(Schedule.objects.on_days([3])), {midweek})
+        self.assertEqual(set(Schedule.objects.on_days([0, 6])), {monday, sunday})
+        self.assertEqual(set(Schedule.objects.on_days([2, 4])), set())
+        self.assertEqual(set(Schedule.objects.on_days([])), set())
+
+        sunday.days = [5]
+        sunday.save(update_fields=['days'])
+        self.assertEqual(set(Schedule.objects.on_days([5, 6])), {sunday})
+
+
+class ScheduleSyncTests(TestCase):
+    def test_edit_updates_moves_and_deletes_untouched_sessions(self):
+        teacher = create_teacher('sync')
+        student = create_student('sync-student')
+        # Monday 7 January to Monday 21 January 2030
+        today = date(2030, 1, 7)
+        schedule = Schedule.objects.create(
+            teacher=teacher, student=student, days=[0, 1, 2, 4], start_time=time(17), end_time=time(18),
+            payment=0, generated_until=today + timedelta(weeks=2)
+        )
+        ScheduleManager.materialize_sessions([schedule], today, schedule.generated_until)
+        previous = Schedule.objects.get(id=schedule.id)
+        attended = Session.objects.get(schedule=schedule, date=date(2030, 1, 9))
+        AttendanceLog.objects.create(session=attended, student=student, status='present')
+        by_hand = Session.objects.get(schedule=schedule, date=date(2030, 1, 16))
+        by_hand.date = date(2030, 1, 17)
+        by_hand.save()
+
+        # Tuesday, Wednesday and Friday become Thursday at a later time
+        schedule.days = [0, 3]
+        schedule.start_time, schedule.end_time = time(18), time(19)
+        schedule.save()
+        counts = ScheduleManager.sync_sessions(schedule, previous, today=today)
+
+        # Each week's first dropped session moves to Thursday, the second is deleted
+        self.assertEqual(counts, {'updated': 3, 'moved': 2, 'deleted': 2, 'created': 0})
+        self.assertEqual(
+            list(Session.objects.filter(schedule=schedule).exclude(
+                id__in=[attended.id, by_hand.id]
+            ).order_by('date').values_list('date', 'occurrence_date', 'start_time')),
+            [(day, day, time(18)) for day in (
+                date(2030, 1, 7), date(2030, 1, 10), date(2030, 1, 14), date(2030, 1, 17), date(2030, 1, 21)
+            )]
+        )
+        # Sessions with attendance and sessions moved by hand keep their date and time
+        attended.refresh_from_db()
+        self.assertEqual((attended.date, attended.start_time), (date(2030, 1, 9), time(17)))
+        by_hand.refresh_from_db()
+        self.assertEqual(
+            (by_hand.date, by_hand.occurrence_date, by_hand.start_time),
+            (date(2030, 1, 17), date(2030, 1, 16), time(17))
+        )
+
+    def test_edit_only_pushes_changed_fields_to_sessions_holding_the_old_value(self):
+        teacher = create_teacher('sync-fields')
+        today = timezone.now().date()
+        schedule = Schedule.objects.create(
+            teacher=teacher, student=create_student('sync-fields-student'), days=[0, 1, 2, 3, 4, 5, 6],
+            start_time=time(17), end_time=time(18), payment=0, generated_until=today
+        )
+        ScheduleManager.materialize_sessions([schedule], today, today)
+        # Saved past the watermark by a write to a virtual occurrence
+        later, retimed = [
+            ScheduleManager.occurrence_session(schedule, today + timedelta(days=days)) for days in (14, 15)
+        ]
+        later.save()
+        retimed.start_time, retimed.end_time = time(8), time(9)
+        retimed.save()
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(email='admin@example.com', role='admin'))
+
+        response = client.patch(f'/api/students/schedules/{schedule.id}/', {'payment': '25.00'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Session.objects.filter(schedule=schedule).count(), 3)
+        self.assertEqual(
+            set(Session.objects.filter(schedule=schedule).values_list('payment', 'start_time')),
+            {(Decimal('25.00'), time(17)), (Decimal('25.00'), time(8))}
+        )
+
+        schedule.refresh_from_db()
+        previous = Schedule.objects.get(id=schedule.id)
+        schedule.start_time, schedule.end_time = time(19), time(20)
+        schedule.save()
+        counts = ScheduleManager.sync_sessions(schedule, previous, today=today)
+
+        self.assertEqual(counts, {'updated': 2, 'moved': 0, 'deleted': 0, 'created': 0})
+        later.refresh_from_db()
+        retimed.refresh_from_db()
+        self.assertEqual((later.start_time, later.end_time), (time(19), time(20)))
+        self.assertEqual((retimed.start_time, retimed.end_time), (time(8), time(9)))
+
+
+class MaterializeSessionsTests(TestCase):
+    def test_creates_missing_occurrences_once(self):
+        schedule = Schedule.objects.create(
+            teacher=create_teacher('materialize'), student=create_student('materialize-student'),
+            days=[0, 3], start_time=time(17), end_time=time(18), payment=0
+        )
+        start_date, end_date = date(2030, 1, 7), date(2030, 1, 20)
+        Session.objects.create(
+            schedule=schedule, teacher=schedule.teacher, student=schedule.student, date=date(2030, 1, 10),
+            occurrence_date=date(2030, 1, 10), start_time=time(17), end_time=time(18), type='PRIVATE', payment=0
+        )
+
+        self.assertEqual(ScheduleManager.materialize_sessions([schedule], start_date, end_date), 3)
+        self.assertEqual(ScheduleManager.materialize_sessions([schedule], start_date, end_date), 0)
+        self.assertEqual(
+            list(schedule.sessions.order_by('date').values_list('date', 'occurrence_date', 'status')),
+            [
+                (day, day, 'SCHEDULED')
+                for day in (date(2030, 1, 7), date(2030, 1, 10), date(2030, 1, 14), date(2030, 1, 17))
+            ]
+        )
+
+
+class MergeDuplicateSessionsMigrationTests(TransactionTestCase):
+    before = [('students', '0006_subscription_lesson_price')]
+    after = [('students', '0007_merge_duplicate_sessions')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_merge_into_one_session_refunding_double_charges(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        User = apps.get_model('accounts', 'User')
+        Student = apps.get_model('students', 'Student')
+        Teacher = apps.get_model('students', 'Teacher')
+        Schedule = apps.get_model('students', 'Schedule')
+        Session = apps.get_model('students', 'Session')
+        AttendanceLog = apps.get_model('students', 'AttendanceLog')
+        LessonLedger = apps.get_model('students', 'LessonLedger')
+
+        def person(model, name, **fields):
+            user = User.objects.create(username=name, email=f'{name}@example.com')
+            return model.objects.create(user=user, name=name, email=user.email, **fields)
+
+        teacher = person(Teacher, 'merge-teacher')
+        twice, excused, only_kept, only_dropped = [
+            person(Student, f'merge-{name}', lessons_remaining=5, subscription_balance=Decimal('50.00'))
+            for name in ('twice', 'excused', 'kept', 'dropped')
+        ]
+        schedule = Schedule.objects.create(
+            teacher=teacher, student=twice, days=[0], start_time=time(9), end_time=time(10), payment=0
+        )
+        kept, dropped = [
+            Session.objects.create(
+                schedule=schedule, teacher=teacher, date=date(2024, 1, 1), start_time=time(9), end_time=time(10),
+                type='GROUP', payment=0
+            )
+            for _ in range(2)
+        ]
+        for session, student, status in [
+            (kept, twice, 'present'), (kept, excused, 'absent'), (kept, only_kept, 'present'),
+            (dropped, twice, 'present'), (dropped, excused, 'present'), (dropped, only_dropped, 'late'),
+        ]:
+            log = AttendanceLog.objects.create(session=session, student=student, status=status)
+            if session == dropped and student == twice:
+                LessonLedger.objects.create(
+                    student=twice, entry_type='deduction', lessons=-1, amount=Decimal('-12.50'),
+                    lessons_after=5, balance_after=Decimal('50.00'), attendance=log
+                )
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        apps = executor.loader.project_state(self.after).apps
+        Session = apps.get_model('students', 'Session')
+        AttendanceLog = apps.get_model('students', 'AttendanceLog')
+        Student = apps.get_model('students', 'Student')
+        LessonLedger = apps.get_model('students', 'LessonLedger')
+
+        self.assertEqual(list(Session.objects.values_list('id', flat=True)), [kept.id])
+        self.assertEqual(
+            dict(AttendanceLog.objects.values_list('student__name', 'status')),
+            {'merge-twice': 'present', 'merge-excused': 'present', 'merge-kept': 'present', 'merge-dropped': 'late'}
+        )
+        self.assertEqual(
+            list(Student.objects.filter(lessons_remaining=6).values_list('name', 'subscription_balance')),
+            [('merge-twice', Decimal('62.50'))]
+        )
+        self.assertEqual(
+            list(LessonLedger.objects.filter(entry_type='refund').values_list('student__name', 'amount')),
+            [('merge-twice', Decimal('12.50'))]
+        )
+
+
+class SessionHorizonTests(TestCase):
+    def test_reads_do_not_create_sessions(self):
+        teacher = create_teacher('horizon-reader')
+        Schedule.objects.create(
+            teacher=teacher, student=create_student('horizon-reader-student'), days=[0, 1, 2, 3, 4, 5, 6],
+            start_time=time(17), end_time=time(18), payment=0
+        )
+        client = APIClient()
+        client.force_authenticate(teacher.user)
+        today = timezone.now().date()
+
+        self.assertEqual(client.get('/api/students/sessions/').data['results'], [])
+        response = client.get('/api/students/sessions/calendar/', {
+            'start_date': today.isoformat(), 'end_date': (today + timedelta(days=6)).isoformat()
+        })
+        self.assertEqual(len(response.data), 7)
+        self.assertFalse(Session.objects.exists())
+
+    def test_extend_horizon_only_generates_past_the_watermark(self):
+        teacher = create_teacher('horizon')
+        student = create_student('horizon-student')
+        recurring, one_off = [
+            Schedule.objects.create(
+                teacher=teacher, student=student, days=[0, 1, 2, 3, 4, 5, 6],
+                start_time=start_time, end_time=end_time, payment=0, is_recurring=is_recurring
+            )
+            for start_time, end_time, is_recurring in ((time(9), time(10), True), (time(11), time(12), False))
+        ]
+        today = date(2030, 1, 7)
+
+        self.assertEqual(ScheduleManager.extend_horizon(weeks=1, today=today), 8)
+        self.assertEqual(ScheduleManager.extend_horizon(weeks=1, today=today), 0)
+        self.assertEqual(ScheduleManager.extend_horizon(weeks=1, today=today + timedelta(days=1)), 1)
+
+        recurring.refresh_from_db()
+        one_off.refresh_from_db()
+        self.assertEqual(recurring.generated_until, date(2030, 1, 15))
+        self.assertIsNone(one_off.generated_until)
+        self.assertEqual(
+            list(recurring.sessions.order_by('date').values_list('date', flat=True)),
+            [today + timedelta(days=day) for day in range(9)]
+        )
+        self.assertFalse(one_off.sessions.exists())
+
+
+class GenerateSessionsCommandTests(TestCase):
+    def test_dry_run_writes_nothing_and_runs_are_idempotent(self):
+        schedule = Schedule.objects.create(
+            teacher=create_teacher('generate'), student=create_student('generate-student'),
+            days=[0, 1, 2, 3, 4, 5, 6], start_time=time(17), end_time=time(18), payment=0
+        )
+
+        out = StringIO()
+        call_command('generate_sessions', '--dry-run', '--weeks', '1', stdout=out)
+        self.assertIn('Dry run, 8 sessions would be generated', out.getvalue())
+        self.assertFalse(Session.objects.exists())
+
+        call_command('generate_sessions', '--weeks', '1', stdout=StringIO())
+        self.assertEqual(Session.objects.filter(schedule=schedule).count(), 8)
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.generated_until, timezone.now().date() + timedelta(weeks=1))
+
+        out = StringIO()
+        call_command('generate_sessions', '--weeks', '1', stdout=out)
+        self.assertIn('Successfully generated 0 sessions', out.getvalue())
+        self.assertEqual(Session.objects.filter(schedule=schedule).count(), 8)
@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    AttendanceView, StudentDashboardView, StudentViewSet, SessionViewSet, AttendanceLogViewSet,
+    AttendanceView, AttendanceSyncView, StudentDashboardView, StudentViewSet, SessionViewSet, AttendanceLogViewSet,
     PerformanceViewSet, SubscriptionPlanViewSet, ScheduleViewSet, StudentSubscriptionViewSet,TeacherViewSet, GroupViewSet,
-    scan_qr_code, recent_attendance, refresh_qr_code
+    ClosureViewSet,
+    scan_qr_code, recent_attendance, refresh_qr_code, calendar_feed
 )
 
 router = DefaultRouter()
@@ -16,11 +17,14 @@ router.register(r'attendance-logs', AttendanceLogViewSet)
 router.register(r'performance', PerformanceViewSet)
 router.register(r'subscription-plans', SubscriptionPlanViewSet)
 router.register(r'student-subscriptions', StudentSubscriptionViewSet)
+router.register(r'closures', ClosureViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
     path('dashboard/', StudentDashboardView.as_view(), name='student-dashboard'),
     path('attendance/scan/<str:student_id>/', AttendanceView.as_view(), name='scan-qr-code'),
+    path('attendance/sync/', AttendanceSyncView.as_view(), name='attendance-sync'),
     path('attendance/recent/', recent_attendance, name='recent-attendance'),
     path('students/<int:student_id>/refresh-qr/', refresh_qr_code, name='refresh-qr-code'),
+    path('calendar/<str:kind>/<int:owner_id>/<str:token>.ics', calendar_feed, name='calendar-feed'),
 ]
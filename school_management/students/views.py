@@ -1,9 +1,14 @@
 from django.shortcuts import render, get_object_or_404
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from .models import *
 from .serializers import *
-from .services import ClassManagementService
+from .services import ClassManagementService, AttendanceService, BalanceService, ClosureService
 from .manager import *
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
@@ -11,24 +16,63 @@ from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
 from .models import Student, AttendanceLog, Session
 from rest_framework.views import APIView
-from django.db.models import Avg, F, Q
+from django.db.models import Avg, F, Prefetch, Q
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from django.db import transaction
+from django.db import transaction, IntegrityError
 from datetime import datetime, timedelta
 
 from django.core.exceptions import ValidationError
 
 
+def rendered_fields(view):
+    """Names of the fields the view's serializer renders for this request, see SparseFieldsMixin"""
+    return set(view.get_serializer().fields)
+
+
+def calendar_feed_url(request, kind, owner_id):
+    return request.build_absolute_uri(reverse(
+        'calendar-feed', args=[kind, owner_id, CalendarManager.token(kind, owner_id)]
+    ))
+
+
+@require_safe
+def calendar_feed(request, kind, owner_id, token):
+    """iCalendar feed for calendar clients, authorised by the signed token in its URL"""
+    if not CalendarManager.check_token(kind, owner_id, token):
+        raise Http404
+    etag, last_modified = CalendarManager.state(kind, owner_id)
+    # Clients polling an unchanged feed get a 304 without it being rendered or read
+    response = get_conditional_response(
+        request, etag=quote_etag(etag), last_modified=int(last_modified.timestamp())
+    )
+    if response is None:
+        response = HttpResponse(
+            CalendarManager.feed(kind, owner_id, etag), content_type='text/calendar; charset=utf-8'
+        )
+    response['ETag'] = quote_etag(etag)
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    response['Cache-Control'] = 'private, max-age=900'
+    return response
+
+
 class TeacherViewSet(viewsets.ModelViewSet):
     queryset = Teacher.objects.all()
     serializer_class = TeacherSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Teacher.objects.prefetch_related(
-            'teaching_groups',
-            'session_set__student'
-        ).all()
+        # Only the actions returning TeacherSerializer need the nested data
+        if self.action not in ('list', 'retrieve', 'update', 'partial_update'):
+            return Teacher.objects.all()
+        fields = rendered_fields(self)
+        queryset = Teacher.objects.order_by('id')
+        if 'private_students' in fields:
+            queryset = queryset.with_private_students()
+        if 'teaching_groups' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('teaching_groups', queryset=Group.objects.with_roster().order_by('id'))
+            )
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'create_with_user':
@@ -54,6 +98,75 @@ class TeacherViewSet(viewsets.ModelViewSet):
         teacher = serializer.save()
         return Response(TeacherSerializer(teacher).data, status=status.HTTP_201_CREATED)
 
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        teacher = get_object_or_404(Teacher, pk=pk)
+        try:
+            start_date = datetime.strptime(
+                request.query_params.get('from', timezone.now().date().isoformat()), '%Y-%m-%d'
+            ).date()
+            end_date = datetime.strptime(
+                request.query_params.get('to', (start_date + timedelta(days=6)).isoformat()), '%Y-%m-%d'
+            ).date()
+            duration = int(request.query_params.get('duration', 60))
+            day_start = ScheduleManager.to_time(request.query_params.get('day_start', AvailabilityManager.DAY_START))
+            day_end = ScheduleManager.to_time(request.query_params.get('day_end', AvailabilityManager.DAY_END))
+        except ValueError:
+            return Response(
+                {'error': 'Use YYYY-MM-DD dates, HH:MM times and a duration in minutes'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            availability = AvailabilityManager.teacher_availability(
+                teacher.id, start_date, end_date, duration, day_start, day_end
+            )
+        except ValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = Response({
+            'teacher': teacher.id,
+            'from': start_date,
+            'to': end_date,
+            'duration': duration,
+            'days': availability
+        })
+        response['Cache-Control'] = 'private, max-age=60'
+        return response
+
+    @action(detail=False, methods=['get'], url_path='availability', url_name='free-teachers')
+    def free_teachers(self, request):
+        date = request.query_params.get('date')
+        day = request.query_params.get('day')
+        try:
+            date = datetime.strptime(date, '%Y-%m-%d').date() if date else None
+            day = int(day) if day is not None else None
+            result = AvailabilityManager.free_teachers(
+                request.query_params.get('start_time', ''),
+                request.query_params.get('end_time', ''),
+                date=date,
+                day=day
+            )
+        except ValueError:
+            return Response(
+                {'error': 'Give a YYYY-MM-DD date or a weekday 0-6, and HH:MM start_time and end_time'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except ValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        names = dict(Teacher.objects.filter(
+            id__in=result['available'] + result['busy']
+        ).values_list('id', 'name'))
+        response = Response({
+            'date': date,
+            'day': day,
+            'available': [{'id': teacher_id, 'name': names.get(teacher_id)} for teacher_id in result['available']],
+            'busy': [{'id': teacher_id, 'name': names.get(teacher_id)} for teacher_id in result['busy']]
+        })
+        response['Cache-Control'] = 'private, max-age=60'
+        return response
+
     @action(detail=True, methods=['get'])
     def schedule(self, request, pk=None):
         teacher = self.get_object()
@@ -64,21 +177,37 @@ class TeacherViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def groups(self, request, pk=None):
         teacher = self.get_object()
-        groups = Group.objects.filter(teacher=teacher)
+        groups = Group.objects.filter(teacher=teacher).with_roster().order_by('id')
         serializer = GroupSerializer(groups, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def calendar(self, request, pk=None):
+        teacher = self.get_object()
+        return Response({'url': calendar_feed_url(request, 'teacher', teacher.id)})
+
 
 class GroupViewSet(viewsets.ModelViewSet):
     queryset = Group.objects.all()
     serializer_class = GroupSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        # Grouping for the count would otherwise leave the order to the database
+        if {'current_capacity', 'students'} & rendered_fields(self):
+            return Group.objects.with_roster().order_by('id')
+        return Group.objects.order_by('id')
+
     def get_serializer_class(self):
         if self.action == 'create':
             return GroupCreateSerializer
         return GroupSerializer
 
+    @action(detail=True, methods=['get'])
+    def calendar(self, request, pk=None):
+        group = self.get_object()
+        return Response({'url': calendar_feed_url(request, 'group', group.id)})
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         try:
@@ -248,19 +377,28 @@ class StudentViewSet(viewsets.ModelViewSet):
         if user.is_authenticated:
             if user.role == 'student':
                 # If user is a student, return only their data
-                return Student.objects.filter(user=user)
+                return self.load_rendered(Student.objects.filter(user=user))
             elif user.role == 'admin':
                 # If user is admin, return all students
-                return Student.objects.all()
+                return self.load_rendered(Student.objects.all())
         return Student.objects.none()
 
+    def load_rendered(self, queryset):
+        """Loads only what the requested fields show"""
+        fields = rendered_fields(self)
+        if {'total_lessons', 'subscription_info'} & fields:
+            queryset = queryset.with_latest_subscription()
+        if 'qr_code' not in fields:
+            queryset = queryset.defer('qr_code')
+        return queryset
+
     def retrieve(self, request, *args, **kwargs):
         # For single student retrieval
         user = self.request.user
         if user.role == 'student':
             # Get the student instance associated with the user
             try:
-                student = Student.objects.get(user=user)
+                student = self.load_rendered(Student.objects.all()).get(user=user)
                 serializer = self.get_serializer(student)
                 return Response(serializer.data)
             except Student.DoesNotExist:
@@ -284,75 +422,44 @@ class StudentViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def groups(self, request, pk=None):
         student = self.get_object()
-        groups = Group.objects.filter(students__student=student)
+        groups = Group.objects.filter(
+            id__in=GroupStudent.objects.filter(student=student).values('group_id')
+        ).with_roster().order_by('id')
         serializer = GroupSerializer(groups, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def calendar(self, request, pk=None):
+        student = self.get_object()
+        return Response({'url': calendar_feed_url(request, 'student', student.id)})
+
+    @action(detail=True, methods=['get'])
+    def ledger(self, request, pk=None):
+        student = self.get_object()
+        entries = student.ledger_entries.order_by('-created_at', '-id')
+        serializer = LessonLedgerSerializer(entries, many=True)
+        return Response(serializer.data)
+
     @action(detail=True, methods=['post'])
     def reduce_lesson(self, request, pk=None):
         student = self.get_object()
 
-        # Check if student has remaining lessons
-        if student.lessons_remaining <= 0:
-            return Response({
-                'success': False,
-                'message': 'No remaining lessons in subscription'
-            }, status=400)
+        try:
+            # Record today's lesson through the same pipeline as a QR scan
+            result = AttendanceService.scan(student.id, user=request.user)
 
-        # Check if student has sufficient balance
-        if student.subscription_balance <= 0:
             return Response({
-                'success': False,
-                'message': 'Insufficient subscription balance'
-            }, status=400)
-
-        # Check for existing attendance today
-        today = timezone.now().date()
-        existing_attendance = AttendanceLog.objects.filter(
-            student=student,
-            scanned_at__date=today
-        ).exists()
+                'success': True,
+                'lessonsRemaining': result['lessons_remaining'],
+                'subscriptionBalance': result['subscription_balance'],
+                'message': f'Lesson recorded successfully for {student.name}'
+            })
 
-        if existing_attendance:
+        except ValidationError as e:
             return Response({
                 'success': False,
-                'message': 'Attendance already marked for today'
+                'message': e.messages[0]
             }, status=400)
-
-        try:
-            with transaction.atomic():
-                # Get or create today's session
-                session, _ = Session.objects.get_or_create(
-                    date=today,
-                    defaults={
-                        'language': student.level.split('_')[0] if '_' in student.level else 'English',
-                        'level': student.level.split('_')[1] if '_' in student.level else student.level
-                    }
-                )
-
-                # Create attendance log
-                AttendanceLog.objects.create(
-                    student=student,
-                    session=session,
-                    valid=True
-                )
-
-                # Deduct one lesson and update subscription balance
-                cost_per_lesson = student.subscription_balance / student.lessons_remaining
-                student.lessons_remaining -= 1
-                student.subscription_balance = F('subscription_balance') - cost_per_lesson
-                student.save()
-
-                # Refresh to get updated values
-                student.refresh_from_db()
-
-                return Response({
-                    'success': True,
-                    'lessonsRemaining': student.lessons_remaining,
-                    'subscriptionBalance': student.subscription_balance,
-                    'message': f'Lesson recorded successfully for {student.name}'
-                })
-
         except Exception as e:
             return Response({
                 'success': False,
@@ -417,11 +524,72 @@ class ScheduleViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            previous = Schedule.objects.select_for_update().get(pk=serializer.instance.pk)
+            schedule = serializer.save()
+            # Rewrite only the future sessions the edit actually changed
+            ScheduleManager.sync_sessions(schedule, previous)
+
+    @action(detail=False, methods=['post'], url_path='check-conflicts')
+    def check_conflicts(self, request):
+        teacher = get_object_or_404(Teacher, id=request.data.get('teacher_id'))
+        slots = request.data.get('slots')
+        if not isinstance(slots, list) or not slots:
+            return Response({'error': 'slots must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = ScheduleManager.find_conflicts(teacher, slots, request.data.get('exclude_id'))
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {'error': 'Each slot needs days, start_time and end_time'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except ValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'has_conflicts': any(result['conflicts'] for result in results),
+            'results': results
+        })
+
+    @action(detail=False, methods=['post'])
+    def solve(self, request):
+        group_ids = request.data.get('group_ids')
+        try:
+            solver = TimetableSolver.for_groups(
+                [int(group_id) for group_id in group_ids] if group_ids is not None else None,
+                duration=int(request.data.get('duration', TimetableSolver.DURATION)),
+                patterns=request.data.get('patterns'),
+                day_start=request.data.get('day_start'),
+                day_end=request.data.get('day_end')
+            )
+            result = solver.solve(min(float(request.data.get('time_limit', TimetableSolver.TIME_LIMIT)), 30))
+            if not request.data.get('apply'):
+                return Response(result)
+
+            schedules = ScheduleManager.create_schedules(
+                result['proposals'], payment=request.data.get('payment', 0)
+            )
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'group_ids and patterns must be lists, duration and time_limit numbers, times HH:MM'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except ValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            **result,
+            'schedules': self.get_serializer(schedules, many=True).data
+        }, status=status.HTTP_201_CREATED)
+
 
 class SessionViewSet(viewsets.ModelViewSet):
     queryset = Session.objects.all()
     serializer_class = SessionSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('date', 'start_time', 'id')
 
     def get_queryset(self):
         queryset = Session.objects.all()
@@ -451,33 +619,87 @@ class SessionViewSet(viewsets.ModelViewSet):
                     # For teachers, show their sessions
                     teacher = Teacher.objects.get(user=self.request.user)
                     queryset = queryset.filter(teacher=teacher)
-                    
-                    # Generate sessions from schedule if none exist
-                    if start_date and not queryset.exists():
-                        weekday = datetime.strptime(start_date, '%Y-%m-%d').date().weekday()
-                        schedules = Schedule.objects.filter(
-                            teacher=teacher,
-                            days__contains=[weekday]
-                        )
-                        
-                        for schedule in schedules:
-                            session = schedule.generate_next_session(target_date=start_date)
-                            if session:
-                                queryset = queryset | Session.objects.filter(id=session.id)
             
-            # Select related fields and return distinct results
-            return queryset.select_related(
-                'student',
-                'group',
-                'teacher'
-            ).prefetch_related(
-                'group__students'
-            ).distinct()
+            # Select the related rows the requested fields show and return
+            # distinct results, the list serializer loads the group rosters
+            # in one query
+            fields = rendered_fields(self)
+            related = []
+            if SessionSerializer.STUDENT_FIELDS & fields:
+                related += ['student', 'group']
+            if SessionSerializer.TEACHER_FIELDS & fields:
+                related.append('teacher')
+            return queryset.select_related(*related).distinct()
         
         except Exception as e:
             print(f"Error in get_queryset: {str(e)}")
             return Session.objects.none()
 
+    def visible_schedules(self):
+        """Recurring schedules whose occurrences the request may see, filtered like get_queryset"""
+        schedules = Schedule.objects.filter(is_recurring=True)
+        student_id = self.request.query_params.get('student')
+        if student_id:
+            schedules = schedules.filter(Q(student_id=student_id) | Q(group__students__student_id=student_id))
+        if getattr(self.request.user, 'role', None) == 'instructor':
+            schedules = schedules.filter(teacher__user=self.request.user)
+        return schedules.select_related('teacher', 'group', 'student').distinct()
+
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        """Persisted and virtual sessions between start_date and end_date, in one unpaginated list"""
+        try:
+            start = datetime.strptime(request.query_params.get('start_date', ''), '%Y-%m-%d').date()
+            end = datetime.strptime(request.query_params.get('end_date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            return Response(
+                {'error': 'start_date and end_date are required as YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if (end - start).days > 366:
+            return Response(
+                {'error': 'At most a year of sessions can be listed at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        sessions = list(self.filter_queryset(self.get_queryset()))
+        schedules = list(self.visible_schedules())
+        # Moved sessions mask their original occurrence wherever they went
+        persisted = Session.objects.filter(
+            schedule__in=schedules, occurrence_date__range=(start, end)
+        ).values_list('schedule_id', 'occurrence_date')
+        # Past occurrences without a session did not take place
+        occurrences = ScheduleManager.virtual_sessions(
+            schedules, max(start, timezone.now().date()), end, persisted,
+            list(Closure.objects.overlapping(start, end))
+        )
+        sessions = sorted([*sessions, *occurrences], key=lambda session: (session.date, session.start_time))
+        return Response(self.get_serializer(sessions, many=True).data)
+
+    def get_object(self):
+        pk = self.kwargs.get('pk')
+        if not ScheduleManager.is_virtual_id(pk):
+            return super().get_object()
+        # A virtual occurrence is persisted as soon as anything happens to it
+        try:
+            session = ScheduleManager.occurrence(
+                pk,
+                materialize=self.request.method not in ('GET', 'HEAD', 'OPTIONS'),
+                schedules=self.visible_schedules()
+            )
+        except ValidationError:
+            raise Http404
+        self.check_object_permissions(self.request, session)
+        return session
+
+    def perform_destroy(self, instance):
+        if instance.schedule_id and instance.schedule.is_recurring:
+            # Deleting the row would bring the occurrence back as a virtual one
+            instance.status = 'CANCELLED'
+            instance.save(update_fields=['status'])
+        else:
+            instance.delete()
+
     @action(detail=True, methods=['post'])
     def toggle_activation(self, request, pk=None):
         session = self.get_object()
@@ -495,15 +717,17 @@ class SessionViewSet(viewsets.ModelViewSet):
         
         try:
             student = Student.objects.get(id=student_id)
-            attendance, created = AttendanceLog.objects.get_or_create(
-                session=session,
-                student=student,
-                defaults={'status': 'present'}
-            )
-            
-            if not created:
-                attendance.status = 'present'
-                attendance.save()
+            with transaction.atomic():
+                attendance = AttendanceLog.objects.select_for_update().filter(
+                    session=session,
+                    student=student
+                ).first()
+
+                if attendance is None:
+                    attendance = AttendanceLog.objects.create(session=session, student=student, status='present')
+                    BalanceService.deduct_lesson(student.id, attendance)
+                else:
+                    AttendanceService.set_status(attendance, 'present')
             
             return Response({
                 'status': 'success',
@@ -514,6 +738,11 @@ class SessionViewSet(viewsets.ModelViewSet):
                 {'error': 'Student not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        except ValidationError as e:
+            return Response(
+                {'error': e.messages[0]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             return Response(
                 {'error': str(e)},
@@ -545,20 +774,65 @@ class SessionViewSet(viewsets.ModelViewSet):
             )
         except ValidationError as e:
             return Response(
-                {'error': str(e)}, 
+                {'error': e.messages[0]},
                 status=status.HTTP_400_BAD_REQUEST
             )
         except Exception as e:
             return Response(
-                {'error': str(e)}, 
+                {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=True, methods=['post'], url_path='attendance/bulk')
+    def bulk_attendance(self, request, pk=None):
+        """Mark attendance for the whole roster of this session at once"""
+        session = self.get_object()
+        entries = request.data.get('attendance', [])
+
+        if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+            return Response(
+                {'error': 'attendance must be a list of {student_id, status} objects'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            results = AttendanceService.mark_roster(session, entries)
+            return Response(results, status=status.HTTP_200_OK)
+        except ValidationError as e:
+            return Response(
+                {'error': e.messages[0]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+
+class ClosureViewSet(viewsets.ModelViewSet):
+    queryset = Closure.objects.select_related('teacher', 'group').order_by('-start_date')
+    serializer_class = ClosureSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-start_date', '-id')
+    # Sessions are cancelled when a closure is created, editing it would not redo that
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            closure, counts = ClosureService.create_closure(**serializer.validated_data)
+        except ValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({**self.get_serializer(closure).data, **counts}, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        ClosureService.delete_closure(instance)
+
 
 class AttendanceLogViewSet(viewsets.ModelViewSet):
     serializer_class = AttendanceLogSerializer
     permission_classes = [IsAuthenticated]
     queryset = AttendanceLog.objects.all()
+    # Newest scans first, sorting on the session date and student name
+    # would need a join for every page
+    cursor_ordering = ('-scanned_at', '-id')
 
     def get_queryset(self):
         queryset = AttendanceLog.objects.all()
@@ -584,7 +858,7 @@ class AttendanceLogViewSet(viewsets.ModelViewSet):
                 'student',
                 'session',
                 'session__teacher'
-            ).order_by('-session__date', 'student__name')
+            )
             
         except Teacher.DoesNotExist:
             return AttendanceLog.objects.none()
@@ -604,9 +878,7 @@ class AttendanceLogViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Get student and session objects
-            student = Student.objects.get(id=student_id)
-            session = Session.objects.get(id=session_id)
+            session = Session.objects.only('id', 'status', 'date').get(id=session_id)
 
             # Check if session is active
             if session.status != 'IN_PROGRESS':
@@ -615,58 +887,36 @@ class AttendanceLogViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Check if student has remaining lessons
-            if student.lessons_remaining <= 0:
-                return Response(
-                    {'error': 'No remaining lessons in subscription'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            # Check if student has sufficient balance
-            if student.subscription_balance <= 0:
-                return Response(
-                    {'error': 'Insufficient subscription balance'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+            with transaction.atomic():
+                # Lock the student row for the duplicate check
+                if not BalanceService.lock([student_id]):
+                    raise Student.DoesNotExist
 
-            # Check for existing attendance today
-            existing_attendance = AttendanceLog.objects.filter(
-                student=student,
-                session__date=session.date
-            ).exists()
+                if AttendanceLog.objects.filter(student_id=student_id, session__date=session.date).exists():
+                    raise ValidationError('Attendance already marked for today')
 
-            if existing_attendance:
-                return Response(
-                    {'error': 'Attendance already marked for today'},
-                    status=status.HTTP_400_BAD_REQUEST
+                attendance = AttendanceLog.objects.create(
+                    student_id=student_id,
+                    session=session,
+                    status='present',
+                    valid=True
                 )
-
-            # Create attendance log
-            attendance = AttendanceLog.objects.create(
-                student=student,
-                session=session,
-                status='present',
-                valid=True
-            )
-
-            # Deduct one lesson and update subscription balance
-            cost_per_lesson = student.subscription_balance / student.lessons_remaining
-            student.lessons_remaining -= 1
-            student.subscription_balance = F('subscription_balance') - cost_per_lesson
-            student.save()
-
-            # Refresh student to get updated values
-            student.refresh_from_db()
+                lessons_remaining, subscription_balance = BalanceService.deduct_lesson(student_id, attendance)
 
             # Return success response
             response_data = self.get_serializer(attendance).data
             response_data.update({
-                'lessons_remaining': student.lessons_remaining,
-                'subscription_balance': float(student.subscription_balance)
+                'lessons_remaining': lessons_remaining,
+                'subscription_balance': float(subscription_balance)
             })
 
             return Response(response_data, status=status.HTTP_201_CREATED)
 
+        except ValidationError as e:
+            return Response(
+                {'error': e.messages[0]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Student.DoesNotExist:
             return Response(
                 {'error': 'Student not found'},
@@ -687,7 +937,6 @@ class AttendanceLogViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def update_status(self, request):
         try:
-            print(f"Received update_status request: {request.data}")  # Debug log
             attendance_id = request.data.get('id')
             new_status = request.data.get('status')
             
@@ -697,51 +946,17 @@ class AttendanceLogViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            attendance = AttendanceLog.objects.select_related(
-                'student', 'session'
-            ).get(id=attendance_id)
-            
-            old_status = attendance.status
-            print(f"Changing status from {old_status} to {new_status}")  # Debug log
-            attendance.status = new_status
-            
-            # Handle lesson count and balance updates
+            with transaction.atomic():
+                # Lock the log so two status changes cannot both charge or refund
+                attendance = AttendanceLog.objects.select_for_update(of=('self',)).select_related(
+                    'student', 'session', 'session__group'
+                ).get(id=attendance_id)
+
+                balances = AttendanceService.set_status(attendance, new_status)
+
             student = attendance.student
-            
-            if old_status == 'absent' and new_status == 'present':
-                print(f"Deducting lesson. Current remaining: {student.lessons_remaining}")  # Debug log
-                # Student was marked absent but is now present
-                if student.lessons_remaining > 0:
-                    # Calculate cost per lesson based on current balance and remaining lessons
-                    cost_per_lesson = student.subscription_balance / student.lessons_remaining
-                    print(f"Cost per lesson: {cost_per_lesson}")  # Debug log
-                    
-                    # Deduct one lesson and update balance
-                    student.lessons_remaining -= 1
-                    student.subscription_balance -= cost_per_lesson
-                    print(f"New balance: {student.subscription_balance}")  # Debug log
-                else:
-                    return Response(
-                        {'error': 'No remaining lessons available'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            
-            elif old_status == 'present' and new_status == 'absent':
-                print(f"Adding lesson back. Current remaining: {student.lessons_remaining}")  # Debug log
-                # Calculate cost per lesson based on current balance and remaining lessons
-                # We need to include the lesson we're adding back in the calculation
-                total_lessons = student.lessons_remaining + 1
-                cost_per_lesson = student.subscription_balance / student.lessons_remaining if student.lessons_remaining > 0 else 0
-                
-                # Add back one lesson and update balance
-                student.lessons_remaining += 1
-                student.subscription_balance += cost_per_lesson
-                print(f"New balance: {student.subscription_balance}")  # Debug log
-            
-            # Save changes
-            student.save()
-            attendance.save()
-            print(f"Changes saved. New lessons remaining: {student.lessons_remaining}")  # Debug log
+            if balances is not None:
+                student.lessons_remaining, student.subscription_balance = balances
             
             # Return updated attendance and student data
             response_data = self.get_serializer(attendance).data
@@ -757,8 +972,12 @@ class AttendanceLogViewSet(viewsets.ModelViewSet):
                 {'error': 'Attendance record not found'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
+        except ValidationError as e:
+            return Response(
+                {'error': e.messages[0]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
-            print(f"Error in update_status: {str(e)}")  # Debug log
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -816,88 +1035,21 @@ def scan_qr_code(request, student_id):
                 'message': 'Invalid QR code'
             }, status=400)
 
-        student = Student.objects.get(id=student_id)
-
-        # Check if student has remaining lessons
-        if student.lessons_remaining <= 0:
-            return Response({
-                'success': False,
-                'message': 'No remaining lessons in subscription'
-            }, status=400)
-
-        # Check if student has sufficient balance
-        if student.subscription_balance <= 0:
-            return Response({
-                'success': False,
-                'message': 'Insufficient subscription balance'
-            }, status=400)
-
-        # Check for existing attendance today
-        today = timezone.now().date()
-        existing_attendance = AttendanceLog.objects.filter(
-            student=student,
-            scanned_at__date=today
-        ).exists()
-
-        if existing_attendance:
-            return Response({
-                'success': False,
-                'message': 'Attendance already marked for today'
-            }, status=400)
-
-        # Get the teacher from the request user if they are a teacher
-        teacher = None
-        if hasattr(request.user, 'teacher'):
-            teacher = request.user.teacher
-        else:
-            # Get any available teacher for testing/development
-            teacher = Teacher.objects.first()
-            if not teacher:
-                return Response({
-                    'success': False,
-                    'message': 'No teacher available to assign to session'
-                }, status=400)
-
-        # Get or create today's session
-        try:
-            session = Session.objects.get(
-                date=today,
-                student=student,
-                status='IN_PROGRESS'
-            )
-        except Session.DoesNotExist:
-            # Create new session
-            session = Session.objects.create(
-                date=today,
-                student=student,
-                teacher=teacher,
-                type='PRIVATE',  # Default to private session
-                status='IN_PROGRESS',
-                start_time=timezone.now().time(),
-                end_time=(timezone.now() + timedelta(hours=1)).time(),
-                payment=0  # Set default payment or calculate based on your business logic
-            )
-
-        try:
-            # Mark attendance using the session's method
-            attendance = session.mark_attendance(student.id)
-            
-            # Refresh student object to get updated values
-            student.refresh_from_db()
-
-            return Response({
-                'success': True,
-                'lessonsRemaining': student.lessons_remaining,
-                'subscriptionBalance': float(student.subscription_balance),
-                'message': f'Attendance marked successfully for {student.name}'
-            })
+        # Lock the student, route to today's session, log and deduct in one transaction
+        result = AttendanceService.scan(student_id, user=request.user)
 
-        except ValidationError as e:
-            return Response({
-                'success': False,
-                'message': str(e)
-            }, status=400)
+        return Response({
+            'success': True,
+            'lessonsRemaining': result['lessons_remaining'],
+            'subscriptionBalance': float(result['subscription_balance']),
+            'message': f"Attendance marked successfully for {result['student'].name}"
+        })
 
+    except ValidationError as e:
+        return Response({
+            'success': False,
+            'message': e.messages[0]
+        }, status=400)
     except Student.DoesNotExist:
         return Response({
             'success': False,
@@ -993,57 +1145,20 @@ class AttendanceView(APIView):
 
     def post(self, request, student_id):
         try:
-            student = Student.objects.get(id=student_id)
-
-            # Check if student has remaining lessons
-            if student.lessons_remaining <= 0:
-                return Response({
-                    'success': False,
-                    'message': 'No remaining lessons in subscription'
-                }, status=400)
-
-            # Check for existing attendance today
-            today = timezone.now().date()
-            existing_attendance = AttendanceLog.objects.filter(
-                student=student,
-                scanned_at__date=today
-            ).exists()
-
-            if existing_attendance:
-                return Response({
-                    'success': False,
-                    'message': 'Attendance already marked for today'
-                }, status=400)
-
-            # Find an active session for today
-            try:
-                session = Session.objects.get(
-                    date=today,
-                    manually_activated=True,
-                    student=student
-                )
-            except Session.DoesNotExist:
-                try:
-                    session = Session.objects.get(
-                        date=today,
-                        manually_activated=True,
-                        group__students__student=student
-                    )
-                except Session.DoesNotExist:
-                    return Response({
-                        'success': False,
-                        'message': 'No active session found for today. Please ensure a session is activated before scanning.'
-                    }, status=400)
-
-            # Mark attendance using the session's method
-            attendance = session.mark_attendance(student.id)
+            # Only scan into a session that has already been activated
+            result = AttendanceService.scan(student_id, user=request.user, create_session=False)
 
             return Response({
                 'success': True,
-                'lessonsRemaining': student.lessons_remaining,
-                'message': f'Attendance marked successfully for {student.name}'
+                'lessonsRemaining': result['lessons_remaining'],
+                'message': f"Attendance marked successfully for {result['student'].name}"
             })
 
+        except ValidationError as e:
+            return Response({
+                'success': False,
+                'message': e.messages[0]
+            }, status=400)
         except Student.DoesNotExist:
             return Response({
                 'success': False,
@@ -1056,6 +1171,35 @@ class AttendanceView(APIView):
             }, status=500)
 
 
+class AttendanceSyncView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """Apply a batch of offline scans queued by a scanner tablet"""
+        scans = request.data.get('scans', [])
+
+        if not isinstance(scans, list) or not all(isinstance(scan, dict) for scan in scans):
+            return Response({
+                'success': False,
+                'message': 'scans must be a list of {idempotency_key, student_id, scanned_at} objects'
+            }, status=400)
+
+        try:
+            results = AttendanceService.sync_batch(scans)
+            return Response(results)
+        except ValidationError as e:
+            return Response({
+                'success': False,
+                'message': e.messages[0]
+            }, status=400)
+        except IntegrityError:
+            # Another upload claimed one of the idempotency keys first
+            return Response({
+                'success': False,
+                'message': 'Batch overlaps an upload in progress, please retry'
+            }, status=409)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def refresh_qr_code(request, student_id):
@@ -16,15 +16,15 @@ def get_token(email, password):
 def get_first_teacher(headers):
     """Get the first available teacher"""
     response = requests.get(f'{BASE_URL}/students/teachers/', headers=headers)
-    if response.status_code == 200 and response.json():
-        return response.json()[0]['id']
+    if response.status_code == 200 and response.json()['results']:
+        return response.json()['results'][0]['id']
     raise Exception("No teachers found in the system")
 
 def get_students(headers, limit=3):
     """Get a list of student IDs"""
-    response = requests.get(f'{BASE_URL}/students/students/', headers=headers)
-    if response.status_code == 200 and response.json():
-        students = response.json()[:limit]
+    response = requests.get(f'{BASE_URL}/students/students/', headers=headers, params={'page_size': limit})
+    if response.status_code == 200 and response.json()['results']:
+        students = response.json()['results']
         return [student['id'] for student in students]
     raise Exception("No students found in the system")
 